@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .checks import (check_cache_add, check_jobs_cache,
+                             check_post_shards)
+        from .sqlite import configure_connection
+        checks.register(check_jobs_cache)
+        checks.register(check_cache_add)
+        checks.register(check_post_shards)
+        connection_created.connect(
+            configure_connection, dispatch_uid='core.sqlite'
+        )
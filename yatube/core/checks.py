@@ -0,0 +1,68 @@
+"""Проверки настроек, которые Django выполняет при запуске команд."""
+from django.conf import settings
+from django.core import checks
+
+# Кэши, которые у каждого процесса свои.
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+# Общие кэши, в которых cache.add — проверка и запись, а не одна операция.
+NON_ATOMIC_ADD_CACHES = (
+    'django.core.cache.backends.filebased.FileBasedCache',
+)
+
+
+def check_jobs_cache(app_configs, **kwargs):
+    """Без JOBS_EAGER кэш должен быть общим с исполнителем run_jobs.
+
+    Задачи (core.jobs) сбрасывают карточки и ленты и обновляют готовые
+    ленты в кэше процесса run_jobs, а через кэш очередь будит
+    исполнителя. С кэшем в памяти процесса веб-процессы ничего из этого
+    не увидят.
+    """
+    if getattr(settings, 'JOBS_EAGER', False):
+        return []
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [checks.Error(
+        'JOBS_EAGER выключен, а кэш default у каждого процесса свой.',
+        hint=(
+            'Настройте в CACHES общий кэш (memcached, Redis) '
+            'или включите JOBS_EAGER.'
+        ),
+        id='core.E001',
+    )]
+
+
+def check_cache_add(app_configs, **kwargs):
+    """Блокировки на cache.add работают, только если add атомарен.
+
+    На нём держатся блокировки готовых лент (posts.timelines) и
+    обновления счётчиков (posts.counts): с неатомарным add их могут
+    взять два процесса сразу.
+    """
+    if settings.CACHES['default']['BACKEND'] not in NON_ATOMIC_ADD_CACHES:
+        return []
+    return [checks.Warning(
+        'cache.add в кэше default не атомарен: блокировки лент и '
+        'счётчиков не исключают гонок.',
+        hint='Настройте в CACHES memcached или Redis.',
+        id='core.W002',
+    )]
+
+
+def check_post_shards(app_configs, **kwargs):
+    """Админка постов не видит посты шардов, кроме основного.
+
+    Список постов в админке — обычный ChangeList над одной базой, а
+    поиск по сайту, ленты, API и выгрузка читают все шарды.
+    """
+    if len(getattr(settings, 'POST_SHARDS', ())) < 2:
+        return []
+    return [checks.Warning(
+        'При POST_SHARDS админка постов показывает и ищет только посты '
+        'основной базы.',
+        hint=(
+            'Посты других шардов ищите поиском по сайту или выгружайте '
+            'командой export_posts.'
+        ),
+        id='core.W001',
+    )]
@@ -0,0 +1,219 @@
+"""Очередь фоновых задач в базе (outbox).
+
+Побочные действия записи — счётчики, сброс кэшей, готовые ленты — не
+должны выполняться, пока запрос ждёт ответа. Вместо этого запись
+ставит задачу: ``enqueue()`` вставляет строку ``Job`` в той же
+транзакции. Откат отменяет и задачу, а закоммиченная задача не
+потеряется, даже если процесс упадёт сразу после ответа. После
+коммита (``on_commit``) очередь будит исполнителей через кэш.
+
+Выполняет задачи команда run_jobs: главный поток забирает готовые
+задачи, помечая их занятыми на ``LEASE`` секунд, а пул потоков их
+выполняет. Задачи одной пачки (``batch``, например все задачи одного
+поста) забираются вместе и передаются обработчику одним списком, по
+порядку постановки. Записи обработчика в базу задач и удаление
+выполненных задач идут в одной транзакции. Упавшая пачка
+повторяется с растущей паузой, после ``JOBS_MAX_ATTEMPTS`` попыток
+задачи помечаются ``failed`` и остаются в таблице для разбора.
+
+Задача с ключом идемпотентности (``key``) ждёт в очереди не больше
+одной: повторная постановка, пока задачу не забрали, ничего не делает.
+Забирая задачу, исполнитель освобождает ключ — изменение, случившееся
+во время выполнения, поставит новую задачу, и она выполнится следом.
+
+При ``JOBS_EAGER`` (разработка и тесты) обработчик вызывается сразу в
+``enqueue()``, как будто очереди нет.
+Без него кэш должен быть общим для веб-процессов и run_jobs: через
+него исполнителя будят, а обработчики сбрасывают в нём карточки и
+ленты. Кэш в памяти процесса отвергает проверка core.E001.
+"""
+import itertools
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+WAKE_KEY = 'jobs:wake'
+LEASE = 60
+DEFAULT_MAX_ATTEMPTS = 5
+# Пауза перед повтором: 2, 4, 8... секунд, но не больше часа.
+MAX_BACKOFF = 60 * 60
+
+_handlers = {}
+
+
+class JobEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder обрезает время до миллисекунд, а обработчикам
+    # нужны точные значения (например, pub_date для сравнения).
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def handler(name):
+    """Регистрирует обработчик задач name.
+
+    Обработчик получает список payload пачки и алиас базы задач.
+    """
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def databases():
+    """Базы, в которых лежат очереди."""
+    return tuple(getattr(settings, 'JOB_DATABASES', (DEFAULT_DB_ALIAS,)))
+
+
+def _max_attempts():
+    return getattr(settings, 'JOBS_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+
+
+def wake():
+    cache.set(WAKE_KEY, time.time(), None)
+
+
+def enqueue(name, payload, key=None, batch='', using=None):
+    """Ставит задачу в текущей транзакции базы using.
+
+    Возвращает False, если задача с ключом key уже стоит в очереди.
+    """
+    using = using or DEFAULT_DB_ALIAS
+    data = json.dumps(payload, cls=JobEncoder)
+    if getattr(settings, 'JOBS_EAGER', False):
+        # Через JSON, чтобы обработчик получал то же, что из очереди.
+        _handlers[name]([json.loads(data)], using)
+        return True
+    job = Job(name=name, key=key, batch=batch, payload=data)
+    if key is None:
+        job.save(using=using)
+    else:
+        try:
+            with transaction.atomic(using=using):
+                job.save(using=using)
+        except IntegrityError:
+            return False
+    transaction.on_commit(wake, using=using)
+    return True
+
+
+def _ready(using, now):
+    return Job.objects.using(using).filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        failed=False, run_after__lte=now,
+    )
+
+
+def claim(using, limit):
+    """Забирает до limit готовых задач и возвращает их пачками.
+
+    Пачка, часть которой уже выполняется, не забирается: её задачи
+    должны идти по порядку.
+    """
+    now = timezone.now()
+    busy = Job.objects.using(using).filter(
+        locked_until__gte=now
+    ).exclude(batch='').values('batch')
+    heads = list(_ready(using, now).exclude(batch__in=busy).order_by(
+        'pk'
+    ).values_list('pk', 'batch')[:limit])
+    if not heads:
+        return []
+    token = uuid.uuid4().hex
+    _ready(using, now).filter(
+        Q(pk__in=[pk for pk, batch in heads if not batch])
+        | Q(batch__in={batch for _, batch in heads if batch})
+    ).update(
+        locked_until=now + timedelta(seconds=LEASE), locked_by=token,
+        key=None,
+    )
+    jobs = Job.objects.using(using).filter(locked_by=token).order_by('pk')
+    batches = {}
+    for job in jobs:
+        batches.setdefault(job.batch or job.pk, []).append(job)
+    return list(batches.values())
+
+
+def run(jobs, using):
+    """Выполняет пачку задач; возвращает True, если она прошла."""
+    pks = [job.pk for job in jobs]
+    try:
+        with transaction.atomic(using=using):
+            for name, group in itertools.groupby(jobs, attrgetter('name')):
+                _handlers[name](
+                    [json.loads(job.payload) for job in group], using
+                )
+            Job.objects.using(using).filter(pk__in=pks).delete()
+    except Exception as error:
+        attempts = max(job.attempts for job in jobs) + 1
+        failed = attempts >= _max_attempts()
+        logger.exception(
+            'Пачка задач %s упала (попытка %d)', pks, attempts
+        )
+        Job.objects.using(using).filter(pk__in=pks).update(
+            attempts=attempts,
+            failed=failed,
+            error=f'{type(error).__name__}: {error}',
+            run_after=timezone.now() + timedelta(
+                seconds=min(2 ** attempts, MAX_BACKOFF)
+            ),
+            locked_until=None,
+            locked_by='',
+        )
+        return False
+    return True
+
+
+def run_pending(using=None, limit=100):
+    """Выполняет готовые задачи в текущем потоке; возвращает их число."""
+    done = 0
+    for alias in (using,) if using else databases():
+        while True:
+            batches = claim(alias, limit)
+            if not batches:
+                break
+            for jobs in batches:
+                if run(jobs, alias):
+                    done += len(jobs)
+    return done
+
+
+def stats(using=None):
+    """Метрики очереди: глубина, занятые, упавшие и отставание в секундах.
+
+    Отставание (lag) — возраст самой старой невыполненной задачи.
+    """
+    totals = {'depth': 0, 'locked': 0, 'failed': 0, 'lag': 0.0}
+    now = timezone.now()
+    for alias in (using,) if using else databases():
+        queue = Job.objects.using(alias)
+        rows = queue.order_by().values('failed').annotate(
+            total=Count('pk'), oldest=Min('created')
+        )
+        for row in rows:
+            if row['failed']:
+                totals['failed'] += row['total']
+                continue
+            totals['depth'] += row['total']
+            totals['lag'] = max(
+                totals['lag'], (now - row['oldest']).total_seconds()
+            )
+        totals['locked'] += queue.filter(
+            failed=False, locked_until__gte=now
+        ).count()
+    return totals
@@ -0,0 +1,86 @@
+"""Ограниченный LRU-кэш в памяти процесса.
+
+Потокобезопасен: все операции со словарём идут под одной блокировкой,
+а значение для ``get_or_set`` считается вне её, чтобы медленный запрос
+к базе не держал остальные потоки. У каждой записи есть срок жизни —
+страховка на случай, если инвалидация до процесса не дошла (сигналы
+моделей приходят только в тот процесс, где модель сохранили).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache:
+    """Не больше maxsize записей, каждая живёт не дольше ttl секунд."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # Растёт при каждой инвалидации: get_or_set не сохранит значение,
+        # прочитанное до неё.
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get_or_set(self, key, compute):
+        """Значение по ключу; при промахе — compute(), если оно не None."""
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        generation = self._generation
+        value = compute()
+        if value is not None:
+            with self._lock:
+                if generation == self._generation:
+                    self._set(key, value)
+        return value
+
+    def delete(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
@@ -0,0 +1,86 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет фоновые задачи из очереди core.jobs пулом потоков. '
+        'Работает, пока не остановят; --once — до опустошения очереди.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько задач забирать из базы за раз',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Секунд между опросами базы, если никто не разбудил',
+        )
+        parser.add_argument(
+            '--stats-every', type=float, default=60.0,
+            help='Как часто печатать метрики очереди, секунд',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выйти, когда готовых задач не останется',
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Напечатать метрики очереди в JSON и выйти',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(jobs.stats()))
+            return
+        self.done = self.errors = 0
+        started = next_stats = time.monotonic()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            while True:
+                futures = [
+                    (pool.submit(jobs.run, batch, alias), len(batch))
+                    for alias in jobs.databases()
+                    for batch in jobs.claim(alias, options['batch_size'])
+                ]
+                for future, size in futures:
+                    if future.result():
+                        self.done += size
+                    else:
+                        self.errors += size
+                if time.monotonic() >= next_stats:
+                    self.report(time.monotonic() - started)
+                    next_stats = time.monotonic() + options['stats_every']
+                if futures:
+                    continue
+                if options['once']:
+                    break
+                self.sleep(options['interval'])
+        self.report(time.monotonic() - started)
+        connections.close_all()
+
+    def sleep(self, interval):
+        """Ждёт interval секунд или сигнала о новых задачах."""
+        woken = cache.get(jobs.WAKE_KEY)
+        deadline = time.monotonic() + interval
+        while time.monotonic() < deadline:
+            time.sleep(min(0.1, interval))
+            if cache.get(jobs.WAKE_KEY) != woken:
+                return
+
+    def report(self, elapsed):
+        stats = jobs.stats()
+        self.stdout.write(
+            f'выполнено {self.done} ({self.done / max(elapsed, 1e-9):.1f}/с), '
+            f'ошибок {self.errors}; в очереди {stats["depth"]}, '
+            f'в работе {stats["locked"]}, упало {stats["failed"]}, '
+            f'отставание {stats["lag"]:.1f} с'
+        )
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.19 on 2026-10-17 05:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Обработчик')),
+                ('payload', models.TextField(default='{}', help_text='JSON', verbose_name='Данные')),
+                ('key', models.CharField(blank=True, help_text='Задача с таким ключом стоит в очереди не больше одной', max_length=200, null=True, unique=True, verbose_name='Ключ идемпотентности')),
+                ('batch', models.CharField(blank=True, help_text='Задачи одной пачки выполняются вместе и по порядку', max_length=100, verbose_name='Пачка')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Поставлена')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Не раньше')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Занята до')),
+                ('locked_by', models.CharField(blank=True, max_length=32, verbose_name='Кем занята')),
+                ('failed', models.BooleanField(default=False, verbose_name='Попытки кончились')),
+                ('error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['failed', 'run_after'], name='job_ready_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['batch'], name='job_batch_idx'),
+        ),
+    ]
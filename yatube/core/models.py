@@ -0,0 +1,38 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Фоновая задача в очереди core.jobs."""
+    name = models.CharField('Обработчик', max_length=100)
+    payload = models.TextField('Данные', default='{}', help_text='JSON')
+    key = models.CharField(
+        'Ключ идемпотентности',
+        max_length=200,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text='Задача с таким ключом стоит в очереди не больше одной'
+    )
+    batch = models.CharField(
+        'Пачка',
+        max_length=100,
+        blank=True,
+        help_text='Задачи одной пачки выполняются вместе и по порядку'
+    )
+    created = models.DateTimeField('Поставлена', default=timezone.now)
+    run_after = models.DateTimeField('Не раньше', default=timezone.now)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    locked_until = models.DateTimeField('Занята до', null=True, blank=True)
+    locked_by = models.CharField('Кем занята', max_length=32, blank=True)
+    failed = models.BooleanField('Попытки кончились', default=False)
+    error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['failed', 'run_after'], name='job_ready_idx'),
+            models.Index(fields=['batch'], name='job_batch_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}#{self.pk}'
@@ -0,0 +1,125 @@
+"""Бюджет SQL-запросов на view и поиск N+1.
+
+View объявляет бюджет декоратором ``@query_budget(n)``; n может быть
+функцией без аргументов, если бюджет зависит от настроек (например, от
+числа шардов), — она вызывается на каждый запрос. Middleware
+записывает все запросы, выполненные за время обработки запроса, и
+проверяет две вещи: что запросов не больше бюджета и что ни одна
+«форма» запроса (SQL без значений параметров) не повторилась больше
+``QUERY_BUDGET_REPEATS`` раз — это и есть N+1.
+
+При ``QUERY_BUDGET_STRICT`` нарушение поднимает ``QueryBudgetExceeded``
+и роняет тесты, иначе пишется предупреждение в лог.
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPEATS = 3
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries):
+    """Объявляет, сколько SQL-запросов может сделать view."""
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def query_shape(sql):
+    """SQL без конкретных значений: одинаков у запросов из одного цикла."""
+    return _LITERAL.sub('?', _IN_LIST.sub('IN (...)', sql))
+
+
+class QueryRecorder:
+    """execute_wrapper, который складывает SQL всех выполненных запросов."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    @contextmanager
+    def record(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def repeated(self, limit):
+        """Формы запросов, выполненные больше limit раз."""
+        shapes = Counter(query_shape(sql) for sql in self.queries)
+        return {
+            shape: count for shape, count in shapes.items() if count > limit
+        }
+
+    def violations(self, max_queries=None, repeats=None):
+        if repeats is None:
+            repeats = getattr(
+                settings, 'QUERY_BUDGET_REPEATS', DEFAULT_REPEATS
+            )
+        problems = []
+        if max_queries is not None and len(self) > max_queries:
+            problems.append(
+                f'{len(self)} запросов при бюджете {max_queries}'
+            )
+        for shape, count in self.repeated(repeats).items():
+            problems.append(f'N+1: {count} раз {shape}')
+        return problems
+
+
+@contextmanager
+def assert_query_budget(max_queries=None, repeats=None):
+    """Тестовый помощник: проверяет бюджет и N+1 для блока кода."""
+    recorder = QueryRecorder()
+    with recorder.record():
+        yield recorder
+    problems = recorder.violations(max_queries, repeats)
+    if problems:
+        raise QueryBudgetExceeded('; '.join(problems))
+
+
+class QueryBudgetMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request.query_recorder = recorder
+        with recorder.record():
+            response = self.get_response(request)
+        match = request.resolver_match
+        if match is None:
+            return response
+        problems = recorder.violations(getattr(request, 'query_budget', None))
+        logger.debug('%s: %d SQL-запросов', match.view_name, len(recorder))
+        if not problems:
+            return response
+        message = f'{match.view_name}: ' + '; '.join(problems)
+        if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = getattr(view_func, 'query_budget', None)
+        request.query_budget = budget() if callable(budget) else budget
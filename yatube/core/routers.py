@@ -0,0 +1,113 @@
+"""Чтение с реплик, запись в основную базу.
+
+``ReplicaRouter`` отправляет чтения на одну из баз ``DATABASE_REPLICAS``,
+а запись — в ``default``. Реплика отстаёт от основной базы, поэтому
+чтение с неё разрешает только ``ReplicaMiddleware`` и только для
+GET/HEAD-запросов. Реплика выбирается один раз на запрос: реплики
+отстают по-разному, и запросы одной страницы должны видеть одно
+состояние. Всё остальное читает из основной базы: POST-запросы
+(их обработчики читают и пишут в одной транзакции), management-команды,
+сигналы вне запросов.
+
+Пользователь, который только что писал, должен сразу видеть свой пост.
+Поэтому после POST-запроса (и других, кроме GET/HEAD) с записью
+middleware ставит cookie, и ещё ``REPLICA_STICKY_SECONDS`` секунд все
+запросы этого клиента читают из основной базы. Попутные записи
+GET-запроса (сессия, строка счётчика) переключают на основную базу
+только сам этот запрос.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+STICKY_COOKIE = 'use_primary'
+SAFE_METHODS = ('GET', 'HEAD')
+DEFAULT_STICKY_SECONDS = 10
+
+# Состояние текущего запроса; вне запроса — None, то есть основная база.
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+class _RequestState:
+    def __init__(self, replica):
+        # Реплика запроса; None — читать из основной базы.
+        self.replica = replica
+        self.wrote = False
+
+
+def _replicas():
+    return tuple(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def sticky_seconds():
+    """Сколько секунд после записи читать только из основной базы."""
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS)
+
+
+def read_from_primary():
+    """До конца текущего запроса читать из основной базы."""
+    state = _request_state.get()
+    if state is not None:
+        state.replica = None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and state.replica is not None:
+            return state.replica
+        # None: Django возьмёт базу экземпляра из подсказки или default.
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            # До конца запроса читаем то, что только что записали.
+            state.wrote = True
+            state.replica = None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in _replicas():
+            # Объект, прочитанный с реплики, сохраняется в основную базу.
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *_replicas()}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+
+class ReplicaMiddleware:
+    """Разрешает чтение с реплик и закрепляет писавших за основной базой."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sticky = sticky_seconds()
+        try:
+            pinned = float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        replicas = _replicas()
+        safe = request.method in SAFE_METHODS
+        state = _RequestState(
+            random.choice(replicas) if replicas and safe and not pinned
+            else None
+        )
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        if state.wrote and not safe:
+            response.set_cookie(
+                STICKY_COOKIE, str(time.time() + sticky), max_age=sticky,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,62 @@
+"""Настройка соединений SQLite.
+
+По умолчанию SQLite пишет через rollback journal: пока идёт запись,
+читать базу нельзя, и при параллельных чтениях ``post_create`` ловит
+``database is locked``. Обработчик ``connection_created`` выполняет на
+каждом новом соединении PRAGMA из ``SQLITE_PRAGMAS``: журнал WAL
+(читатели не ждут писателя), ``synchronous=NORMAL`` (в WAL без потери
+целостности), кэш страниц, mmap и время ожидания блокировки.
+
+PRAGMA выполняются на сыром соединении sqlite3, мимо курсоров Django:
+они не попадают ни в ``connection.queries``, ни в бюджет запросов
+первого запроса на новом соединении.
+"""
+import sqlite3
+
+from django.conf import settings
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    # Отрицательное значение — размер в КиБ, а не в страницах.
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+
+
+def pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+
+
+def apply_pragmas(raw_connection, values):
+    """Выполняет PRAGMA name = value для каждой пары из values."""
+    for name, value in values.items():
+        value = str(value)
+        if not name.isidentifier() or not value.lstrip('-').isalnum():
+            raise ValueError(f'Недопустимая PRAGMA: {name} = {value}')
+        raw_connection.execute(f'PRAGMA {name} = {value}').fetchall()
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        # Отдельная база может дополнить общие PRAGMA своими.
+        apply_pragmas(connection.connection, {
+            **pragmas(), **connection.settings_dict.get('SQLITE_PRAGMAS', {}),
+        })
+
+
+def copy_database(source, target):
+    """Копирует базу из файла source в файл target через backup API.
+
+    Копия согласована: чтение source идёт в одной транзакции, а
+    читатели target видят либо старую базу, либо новую целиком.
+    """
+    source_connection = sqlite3.connect(source)
+    target_connection = sqlite3.connect(target)
+    try:
+        apply_pragmas(target_connection, pragmas())
+        source_connection.backup(target_connection)
+    finally:
+        target_connection.close()
+        source_connection.close()
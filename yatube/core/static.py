@@ -0,0 +1,168 @@
+"""Статика с хэшем в имени, заранее сжатая, с вечным кэшем.
+
+Сборка — обычный ``collectstatic``. ``CompressedManifestStaticFilesStorage``
+копирует файлы в ``STATIC_ROOT`` под именами с хэшем содержимого
+(``bootstrap.min.3f1a….css``), пишет манифест ``staticfiles.json``,
+а рядом с текстовыми файлами кладёт сжатые копии ``.gz`` и, если
+установлен пакет ``brotli``, ``.br``. Тег ``{% static %}`` по манифесту
+выдаёт имя с хэшем.
+
+``StaticFilesMiddleware`` отдаёт файлы из ``STATIC_ROOT`` без Django
+view и базы: копию ``.br`` или ``.gz`` по Accept-Encoding клиента,
+а файлам из манифеста — ``Cache-Control: immutable`` на год (при новом
+содержимом меняется и имя). При ``DEBUG`` статику раздаёт runserver
+из исходных каталогов, и middleware не вмешивается.
+"""
+import gzip
+import io
+import json
+import mimetypes
+import os
+import posixpath
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ico', '.txt', '.json', '.xml',
+                '.html', '.map')
+# Сжатая копия, которая меньше оригинала меньше чем на 5%, не нужна.
+MIN_RATIO = 0.95
+IMMUTABLE = 'public, max-age=31536000, immutable'
+DEFAULT_MAX_AGE = 60 * 60
+# Расширение копии -> Content-Encoding, в порядке предпочтения.
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+
+def gzip_compress(content):
+    # gzip.compress принимает mtime только с Python 3.8, а без него в
+    # заголовок попадает текущее время и копия меняется при каждой сборке.
+    buffer = io.BytesIO()
+    with gzip.GzipFile(
+        fileobj=buffer, mode='wb', compresslevel=9, mtime=0
+    ) as file:
+        file.write(content)
+    return buffer.getvalue()
+
+
+def compress(content):
+    """Сжатые варианты содержимого: {'.gz': bytes, '.br': bytes}."""
+    variants = {'.gz': gzip_compress(content)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(content)
+    return {
+        suffix: data for suffix, data in variants.items()
+        if len(data) < len(content) * MIN_RATIO
+    }
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Манифест с хэшами плюс сжатые копии текстовых файлов."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(
+            paths, dry_run, **options
+        ):
+            if hashed_name and not isinstance(processed, Exception):
+                names.update((name, hashed_name))
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE):
+                self._write_compressed(name)
+
+    def _write_compressed(self, name):
+        with self.open(name) as source:
+            variants = compress(source.read())
+        for suffix, data in variants.items():
+            path = self.path(name + suffix)
+            with open(path, 'wb') as target:
+                target.write(data)
+
+
+@lru_cache(maxsize=4)
+def _manifest_paths(manifest, mtime):
+    with open(manifest, encoding='utf-8') as source:
+        return frozenset(json.load(source).get('paths', {}).values())
+
+
+def immutable_names(root):
+    """Имена с хэшем из манифеста в root; перечитывается после сборки."""
+    manifest = os.path.join(root, 'staticfiles.json')
+    try:
+        mtime = os.stat(manifest).st_mtime
+    except OSError:
+        return frozenset()
+    return _manifest_paths(manifest, mtime)
+
+
+def _accepted(request):
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return {
+        part.split(';')[0].strip().lower() for part in header.split(',')
+    }
+
+
+class StaticFilesMiddleware:
+    """Отдаёт собранную статику из STATIC_ROOT вместо 404 от URLconf."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        prefix = settings.STATIC_URL
+        if (
+            settings.DEBUG or not settings.STATIC_ROOT
+            or request.method not in ('GET', 'HEAD')
+            or not request.path.startswith(prefix)
+        ):
+            return self.get_response(request)
+        response = self.serve(request, request.path[len(prefix):])
+        return response or self.get_response(request)
+
+    def serve(self, request, name):
+        name = posixpath.normpath(name).lstrip('/')
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        if not was_modified_since(
+            request.META.get('HTTP_IF_MODIFIED_SINCE'),
+            stat.st_mtime, stat.st_size,
+        ):
+            return HttpResponseNotModified()
+        content_type, _ = mimetypes.guess_type(path)
+        encoding = None
+        accepted = _accepted(request)
+        for suffix, candidate in ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + suffix):
+                path, encoding = path + suffix, candidate
+                break
+        response = FileResponse(
+            open(path, 'rb'),
+            content_type=content_type or 'application/octet-stream',
+        )
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Vary'] = 'Accept-Encoding'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if name in immutable_names(settings.STATIC_ROOT):
+            response['Cache-Control'] = IMMUTABLE
+        else:
+            response['Cache-Control'] = f'public, max-age={DEFAULT_MAX_AGE}'
+        return response
@@ -0,0 +1,15 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+register = template.Library()
+
+
+@register.simple_tag
+def preload_links():
+    """<link rel="preload"> для файлов из STATIC_PRELOAD, с хэшем в имени."""
+    return format_html_join(
+        '\n    ', '<link rel="preload" href="{}" as="{}">',
+        ((static(name), kind) for name, kind in settings.STATIC_PRELOAD),
+    )
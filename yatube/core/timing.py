@@ -0,0 +1,213 @@
+"""Server-Timing: из чего складывается время ответа.
+
+``ServerTimingMiddleware`` замеряет у запроса время view, SQL-запросов,
+рендеринга шаблонов (каждого шаблона и каждого ``{% include %}``) и
+контекст-процессоров. Итоги уходят в заголовок ``Server-Timing`` (их
+показывает вкладка Network браузера), а разбивка по шаблонам и
+процессорам — одной JSON-строкой в лог ``core.timing``.
+
+Замеряется только доля ``SERVER_TIMING_SAMPLE_RATE`` запросов:
+остальные проходят без обёрток, так что middleware можно держать
+включённым в продакшене.
+
+Фазы вложены друг в друга: view включает шаблоны, шаблоны —
+контекст-процессоры и запросы ленивых QuerySet, поэтому сумма фаз
+больше total. Процессор auth возвращает ленивые объекты, и их
+стоимость попадает в шаблон, а не в процессор.
+"""
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.template.base import Template
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 0.01
+
+_current = ContextVar('request_timer', default=None)
+_render = Template.render
+
+
+class RequestTimer:
+    """Замеры одного запроса, в секундах."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view = 0.0
+        self.db = 0.0
+        self.queries = 0
+        self.rendering = 0.0
+        # Имя шаблона → [число рендерингов, время с вложенными].
+        self.templates = defaultdict(lambda: [0, 0.0])
+        self.processors = defaultdict(float)
+        self._depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+    @contextmanager
+    def template(self, name):
+        self._depth += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._depth -= 1
+            self.templates[name][0] += 1
+            self.templates[name][1] += elapsed
+            if not self._depth:
+                self.rendering += elapsed
+
+    @contextmanager
+    def record(self):
+        """Включает замеры SQL и шаблонов на время блока."""
+        token = _current.set(self)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self))
+                yield self
+        finally:
+            _current.reset(token)
+
+    def metrics(self, total):
+        """(имя, секунды, описание) для заголовка Server-Timing."""
+        return [
+            ('total', total, ''),
+            ('view', self.view, ''),
+            ('db', self.db, f'{self.queries} queries'),
+            ('tpl', self.rendering, ''),
+            ('cp', sum(self.processors.values()), ''),
+        ]
+
+    def header(self, total):
+        return ', '.join(
+            f'{name};dur={seconds * 1000:.1f}'
+            + (f';desc="{desc}"' if desc else '')
+            for name, seconds, desc in self.metrics(total)
+        )
+
+    def log_record(self, request, response, total):
+        match = request.resolver_match
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': self.queries,
+        }
+        for name, seconds, _ in self.metrics(total):
+            record[f'{name}_ms'] = round(seconds * 1000, 2)
+        record['templates'] = {
+            name: {'count': count, 'ms': round(seconds * 1000, 2)}
+            for name, (count, seconds) in self.templates.items()
+        }
+        record['processors'] = {
+            name: round(seconds * 1000, 2)
+            for name, seconds in self.processors.items()
+        }
+        return record
+
+
+def template_name(template):
+    origin = getattr(template, 'origin', None)
+    return getattr(origin, 'template_name', None) or template.name or '<str>'
+
+
+def _timed_render(self, context):
+    # Template.render вызывается для шаблона, который рендерит view, и
+    # для каждого {% include %}; {% extends %} рендерит родителя иначе,
+    # и его время входит в дочерний шаблон.
+    timer = _current.get()
+    if timer is None:
+        return _render(self, context)
+    with timer.template(template_name(self)):
+        return _render(self, context)
+
+
+def timed_processor(processor):
+    name = f'{processor.__module__}.{processor.__qualname__}'
+
+    @wraps(processor)
+    def wrapper(request):
+        timer = _current.get()
+        if timer is None:
+            return processor(request)
+        started = time.perf_counter()
+        try:
+            return processor(request)
+        finally:
+            timer.processors[name] += time.perf_counter() - started
+
+    wrapper.timed = True
+    return wrapper
+
+
+def install():
+    """Оборачивает рендеринг шаблонов и контекст-процессоры движков.
+
+    Обёртки без активного замера сразу вызывают оригинал. Повторный
+    вызов ничего не делает.
+    """
+    Template.render = _timed_render
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        if engine is None:
+            continue
+        processors = engine.template_context_processors
+        if not all(getattr(p, 'timed', False) for p in processors):
+            engine.template_context_processors = tuple(
+                p if getattr(p, 'timed', False) else timed_processor(p)
+                for p in processors
+            )
+
+
+def sampled():
+    rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+    return rate > 0 and random.random() < rate
+
+
+class ServerTimingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        if not sampled():
+            return self.get_response(request)
+        timer = RequestTimer()
+        with timer.record():
+            response = self.get_response(request)
+        finished = time.perf_counter()
+        if timer.view_started is not None:
+            # До ответа view: сюда же попадает обработка ответа
+            # нижележащими middleware, но она дешёвая.
+            timer.view = finished - timer.view_started
+        total = finished - timer.started
+        response['Server-Timing'] = timer.header(total)
+        logger.info(json.dumps(
+            timer.log_record(request, response, total), ensure_ascii=False
+        ))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = _current.get()
+        if timer is not None:
+            timer.view_started = time.perf_counter()
@@ -1,5 +1,117 @@
+from datetime import datetime
+
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR
+from django.db.models import Q
+from django.forms.utils import flatatt
+from django.utils import timezone
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
 from .models import Group, Post
+from .paginator import EstimatedCountPaginator, decode_cursor, encode_cursor
+from .search import is_available, match_expression, matching_ids_sql
+
+CURSOR_VAR = 'after'
+
+
+def _month_start(year, month):
+    if month > 12:
+        year, month = year + 1, 1
+    return timezone.make_aware(datetime(year, month, 1))
+
+
+class PubDateHierarchyFilter(admin.SimpleListFilter):
+    """Годы и месяцы публикации, найденные поиском по индексу.
+
+    Стандартный date_hierarchy строит список лет через DISTINCT по всей
+    таблице. Здесь каждый следующий год (месяц) — это один переход по
+    индексу pub_date к первому посту после границы предыдущего.
+    """
+    title = 'Дата публикации'
+    parameter_name = 'published'
+
+    def lookups(self, request, model_admin):
+        value = self.value()
+        year = int(value[:4]) if value and value[:4].isdigit() else None
+        if year is None:
+            return [(str(start.year), str(start.year))
+                    for start in self._periods(lambda d: (d.year, 13))]
+        choices = [(str(year), f'{year}, все месяцы')]
+        for start in self._periods(
+            lambda d: (d.year, d.month + 1), _month_start(year, 1),
+            _month_start(year + 1, 1),
+        ):
+            choices.append((
+                f'{start.year}-{start.month:02}',
+                f'{start.year}-{start.month:02}',
+            ))
+        return choices
+
+    def _periods(self, next_period, lower=None, upper=None):
+        posts = Post.objects.order_by('pub_date')
+        if upper is not None:
+            posts = posts.filter(pub_date__lt=upper)
+        while True:
+            bounded = posts if lower is None else posts.filter(
+                pub_date__gte=lower
+            )
+            first = bounded.values_list('pub_date', flat=True).first()
+            if first is None:
+                return
+            first = timezone.localtime(first)
+            yield first
+            lower = _month_start(*next_period(first))
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        try:
+            if value and len(value) == 4:
+                start = _month_start(int(value), 1)
+                end = _month_start(int(value) + 1, 1)
+            elif value:
+                year, month = map(int, value.split('-'))
+                start = _month_start(year, month)
+                end = _month_start(year, month + 1)
+            else:
+                return queryset
+        except ValueError:
+            return queryset
+        return queryset.filter(pub_date__gte=start, pub_date__lt=end)
+
+
+class PrerenderedSelect(forms.Select):
+    """<select> из заранее отрендеренных <option>.
+
+    В list_editable один и тот же список групп выводится в каждой
+    строке, а шаблонный рендеринг опций занимал почти всё время
+    страницы. Здесь options — пары (значение, готовый HTML опции),
+    собранные один раз на запрос функцией prerender. Отдельный атрибут
+    нужен потому, что ModelChoiceField при копировании формы заново
+    подставляет в choices итератор по queryset.
+    """
+    options = ()
+
+    @staticmethod
+    def prerender(choices):
+        return [
+            (str(value), format_html(
+                '<option value="{}">{}</option>', value, label
+            ))
+            for value, label in choices
+        ]
+
+    def render(self, name, value, attrs=None, renderer=None):
+        attrs = self.build_attrs(self.attrs, attrs)
+        attrs['name'] = name
+        value = '' if value is None else str(value)
+        options = ''.join(
+            html.replace('<option ', '<option selected ', 1)
+            if choice == value else html
+            for choice, html in self.options
+        )
+        return mark_safe(f'<select{flatatt(attrs)}>{options}</select>')
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -11,9 +123,72 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    list_filter = ('pub_date', PubDateHierarchyFilter)
     empty_value_display = '-пусто-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).for_feed()
+        cursor = getattr(request, 'post_cursor', None)
+        if cursor is not None:
+            pub_date, pk = cursor
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+            )
+        return queryset
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name != 'group' or request is None:
+            return super().formfield_for_foreignkey(
+                db_field, request, **kwargs
+            )
+        kwargs.setdefault('widget', PrerenderedSelect)
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        # Список групп выбирается и рендерится один раз на страницу,
+        # а не отдельно для каждой строки list_editable.
+        options = getattr(request, 'group_options', None)
+        if options is None:
+            options = request.group_options = PrerenderedSelect.prerender(
+                formfield.choices
+            )
+        formfield.widget.options = options
+        return formfield
+
+    def changelist_view(self, request, extra_context=None):
+        # Курсор снимаем с GET до ChangeList: иначе админка сочтёт его
+        # неизвестным фильтром. Листание по курсору работает только при
+        # сортировке по умолчанию (-pub_date, -pk).
+        request.GET = request.GET.copy()
+        token = request.GET.pop(CURSOR_VAR, [None])[-1]
+        if token and ORDER_VAR not in request.GET:
+            request.post_cursor = decode_cursor(token)
+        response = super().changelist_view(request, extra_context)
+        context = getattr(response, 'context_data', None) or {}
+        cl = context.get('cl')
+        if cl is None or ORDER_VAR in request.GET:
+            return response
+        results = list(cl.result_list)
+        if len(results) == cl.list_per_page:
+            context['next_cursor_url'] = cl.get_query_string(
+                {CURSOR_VAR: encode_cursor(results[-1])}, [PAGE_VAR]
+            )
+        return response
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идёт через FTS-индекс, а не LIKE '%...%'.
+        match = match_expression(search_term)
+        if not match or not is_available():
+            return super().get_search_results(request, queryset, search_term)
+        queryset = queryset.extra(
+            where=[f'{Post._meta.db_table}.id IN ({matching_ids_sql()})'],
+            params=[match],
+        )
+        return queryset, False
 
 
 admin.site.register(Post, PostAdmin)
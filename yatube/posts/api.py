@@ -0,0 +1,248 @@
+"""JSON API только для чтения: посты, группы, профили.
+
+Списки листаются курсором ``?after=``/``?before=``, как HTML-ленты.
+Параметр ``fields=`` перечисляет нужные поля ответа, и из базы
+выбираются только их колонки (через ``values()``: строки сразу
+приходят словарями, без создания моделей и обращения к их
+атрибутам). Так ``text`` не читается, если клиент его не просил.
+Каждая страница — это один-два SQL-запроса независимо от её размера.
+
+При шардировании постов (``posts.shards``) список постов читается из
+всех шардов, а имена авторов и slug групп — отдельными запросами к
+основной базе: JOIN между базами невозможен.
+"""
+from functools import wraps
+from operator import itemgetter
+
+from django.http import Http404, JsonResponse
+
+from core.query_budget import query_budget
+
+from . import shards
+from .lookups import get_author_or_404, get_group_or_404
+from .models import Group, Post, PostCounter, User
+from .paginator import ValuesKeysetPaginator, decode_cursor
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Поле ответа -> путь для values(). None — поле считается отдельно.
+POST_FIELDS = {
+    'id': 'pk',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+}
+# Поле ответа -> (столбец id в шарде, модель, поле модели).
+SHARDED_POST_FIELDS = {
+    'author': ('author_id', User, 'username'),
+    'group': ('group_id', Group, 'slug'),
+}
+GROUP_FIELDS = {
+    'id': 'pk',
+    'title': 'title',
+    'slug': 'slug',
+    'description': 'description',
+    'posts_count': None,
+}
+PROFILE_FIELDS = {
+    'username': 'username',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'posts_count': None,
+}
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _json(data, status=200):
+    return JsonResponse(
+        data, status=status, json_dumps_params={'ensure_ascii': False}
+    )
+
+
+def json_errors(view_func):
+    """Превращает ApiError в JSON-ответ с кодом ошибки."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view_func(request, *args, **kwargs)
+        except ApiError as error:
+            return _json({'error': str(error)}, error.status)
+    return wrapper
+
+
+def requested_fields(request, available):
+    value = request.GET.get('fields')
+    if not value:
+        return list(available)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown or not fields:
+        raise ApiError(
+            'Неизвестные поля: ' + ', '.join(unknown)
+            + '. Доступны: ' + ', '.join(available)
+        )
+    return fields
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError('limit должен быть числом')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _page_url(request, **params):
+    query = request.GET.copy()
+    for name in ('after', 'before'):
+        query.pop(name, None)
+    query.update(params)
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+
+def _filter_id(lookup, value):
+    """id автора или группы для фильтра; 0, если их нет — постов не будет."""
+    try:
+        return lookup(value).pk
+    except Http404:
+        return 0
+
+
+def _attach_names(rows, fields):
+    """Подставляет в строки шарда имена авторов и slug групп по id."""
+    for name in fields:
+        if name not in SHARDED_POST_FIELDS:
+            continue
+        column, model, attname = SHARDED_POST_FIELDS[name]
+        ids = {row[column] for row in rows} - {None}
+        names = dict(shards.outside(model).filter(pk__in=ids).values_list(
+            'pk', attname
+        )) if ids else {}
+        for row in rows:
+            row[POST_FIELDS[name]] = names.get(row[column])
+
+
+def _post_rows(request, fields):
+    """values() постов с фильтрами запроса; при шардировании — всех шардов."""
+    queryset = Post.objects.all()
+    author = request.GET.get('author')
+    group = request.GET.get('group')
+    if not shards.aliases():
+        columns = {'pk', 'pub_date'} | {POST_FIELDS[name] for name in fields}
+        if author:
+            queryset = queryset.filter(author__username=author)
+        if group:
+            queryset = queryset.filter(group__slug=group)
+        return queryset.values(*columns)
+    # Авторы и группы в основной базе: из шарда берутся их id, id для
+    # фильтра — из кэша процесса (posts.lookups), посты автора — из его
+    # шарда.
+    columns = {'pk', 'pub_date'} | {
+        SHARDED_POST_FIELDS[name][0] if name in SHARDED_POST_FIELDS
+        else POST_FIELDS[name]
+        for name in fields
+    }
+    if group:
+        queryset = queryset.filter(
+            group_id=_filter_id(get_group_or_404, group)
+        )
+    if author:
+        author_id = _filter_id(get_author_or_404, author)
+        return queryset.filter(author_id=author_id).using(
+            shards.for_author(author_id)
+        ).values(*columns)
+    return shards.across(
+        queryset.values(*columns), key=itemgetter('pub_date', 'pk')
+    )
+
+
+@query_budget(shards.budget(2, per_shard=1, sharded=3))
+@json_errors
+def posts(request):
+    """Посты, новые первыми; фильтры ?author=<username>&group=<slug>."""
+    fields = requested_fields(request, POST_FIELDS)
+    rows = _post_rows(request, fields)
+    paginator = ValuesKeysetPaginator(rows, _limit(request))
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    for token in (after, before):
+        if token and decode_cursor(token) is None:
+            raise ApiError('Неверный курсор')
+    if after:
+        page = paginator.page_after(after)
+    elif before:
+        page = paginator.page_before(before)
+    else:
+        page = paginator.first_page()
+    if shards.aliases():
+        _attach_names(page.object_list, fields)
+    return _json({
+        'results': [
+            {name: row[POST_FIELDS[name]] for name in fields} for row in page
+        ],
+        'next': page.next_cursor and _page_url(
+            request, after=page.next_cursor
+        ),
+        'previous': page.previous_cursor and _page_url(
+            request, before=page.previous_cursor
+        ),
+    })
+
+
+@query_budget(shards.budget(2))
+@json_errors
+def groups(request):
+    """Группы по возрастанию id, курсор ?after=<id>."""
+    fields = requested_fields(request, GROUP_FIELDS)
+    limit = _limit(request)
+    columns = {'pk'} | {
+        GROUP_FIELDS[name] for name in fields if GROUP_FIELDS[name]
+    }
+    queryset = Group.objects.order_by('pk').values(*columns)
+    after = request.GET.get('after')
+    if after:
+        if not after.isdigit():
+            raise ApiError('Неверный курсор')
+        queryset = queryset.filter(pk__gt=int(after))
+    rows = list(queryset[:limit + 1])
+    has_next, rows = len(rows) > limit, rows[:limit]
+    if 'posts_count' in fields:
+        counts = PostCounter.objects.get_values(
+            PostCounter.GROUP, [row['pk'] for row in rows]
+        )
+        for row in rows:
+            row['posts_count'] = counts[row['pk']]
+    return _json({
+        'results': [
+            {name: row[GROUP_FIELDS[name] or name] for name in fields}
+            for row in rows
+        ],
+        'next': has_next and _page_url(request, after=rows[-1]['pk']) or None,
+    })
+
+
+@query_budget(2)
+@json_errors
+def profile(request, username):
+    fields = requested_fields(request, PROFILE_FIELDS)
+    columns = {'pk'} | {
+        PROFILE_FIELDS[name] for name in fields if PROFILE_FIELDS[name]
+    }
+    row = User.objects.filter(username=username).values(*columns).first()
+    if row is None:
+        raise ApiError('Пользователь не найден', 404)
+    if 'posts_count' in fields:
+        row['posts_count'] = PostCounter.objects.get_value(
+            PostCounter.AUTHOR, row['pk']
+        )
+    return _json({
+        name: row[PROFILE_FIELDS[name] or name] for name in fields
+    })
@@ -0,0 +1,334 @@
+"""Помощники для бенчмарков из management-команд.
+
+Всё здесь работает с настроенной базой данных, поэтому команды
+бенчмарков нужно запускать на отдельной копии, а не на боевой базе.
+"""
+import itertools
+import random
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import (OperationalError, connection, connections, router,
+                       transaction)
+from django.urls import reverse
+from django.utils import timezone
+from faker import Faker
+
+from core.query_budget import QueryRecorder
+
+from . import timelines
+from .models import Group, Post, PostCounter
+from .search import bulk_indexing
+from .shards import across
+
+User = get_user_model()
+
+# sqlite3 кэширует подготовленные выражения по тексту SQL и после DROP
+# INDEX вернул бы старый план, поэтому каждый EXPLAIN делаем уникальным.
+_explain_ids = itertools.count()
+
+
+def seed_posts(total, authors=100, groups=50, batch_size=10000, seed=0):
+    """Добивает таблицу постов до total строк и возвращает число новых.
+
+    Посты вставляются через Post.objects.insert_rows: bulk_create
+    перезаписал бы pub_date из-за auto_now_add, а ленты нужно мерить на
+    датах, разнесённых во времени. Счётчики после вставки пересобираются,
+    готовые ленты сбрасываются.
+    """
+    missing = total - Post.objects.count()
+    if missing <= 0:
+        return 0
+    rnd = random.Random(seed)
+    for i in range(User.objects.count(), authors):
+        User.objects.create_user(username=f'bench_author_{i}')
+    Group.objects.bulk_create(
+        Group(
+            title=f'Группа {i}', slug=f'bench-group-{i}',
+            description=f'Группа для бенчмарков {i}'
+        )
+        for i in range(Group.objects.count(), groups)
+    )
+    author_ids = list(User.objects.values_list('pk', flat=True))
+    group_ids = list(Group.objects.values_list('pk', flat=True)) + [None]
+    start = timezone.now() - timedelta(seconds=missing)
+    with transaction.atomic():
+        for offset in range(0, missing, batch_size):
+            count = min(batch_size, missing - offset)
+            Post.objects.insert_rows(
+                (
+                    f'Тестовый пост {offset + i}',
+                    start + timedelta(seconds=offset + i),
+                    rnd.choice(author_ids),
+                    rnd.choice(group_ids),
+                )
+                for i in range(count)
+            )
+    PostCounter.objects.rebuild()
+    timelines.forget(group_ids[:-1])
+    return missing
+
+
+# Фиксированная точка отсчёта дат, чтобы данные не зависели от дня запуска.
+SEED_EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+SEED_PASSWORD = 'bench-password'
+SENTENCE_POOL = 2000
+# bulk_create на SQLite собирает пачку в один составной SELECT, а в нём
+# не больше 500 частей.
+MODEL_BATCH_SIZE = 500
+
+
+def seed_data(users, groups, posts, seed=0, batch_size=10000):
+    """Добивает базу до users пользователей, groups групп и posts постов.
+
+    На пустой базе одинаковый seed даёт одинаковые данные. Faker
+    медленный, поэтому он генерирует только имена, группы и пул
+    предложений, а тексты постов собираются из пула. Все записи
+    вставляются пачками без сигналов, счётчики пересобираются в конце, а
+    готовые ленты сбрасываются.
+    Возвращает число добавленных пользователей, групп и постов.
+    """
+    fake = Faker('ru_RU')
+    fake.seed_instance(seed)
+    rnd = random.Random(seed)
+    password = make_password(SEED_PASSWORD, salt=f'seed{seed}')
+    start_users = User.objects.count()
+    User.objects.bulk_create(
+        (
+            User(
+                username=f'{fake.user_name()}_{i}',
+                first_name=fake.first_name(),
+                last_name=fake.last_name(),
+                password=password,
+                date_joined=SEED_EPOCH,
+            )
+            for i in range(start_users, users)
+        ),
+        batch_size=MODEL_BATCH_SIZE,
+    )
+    start_groups = Group.objects.count()
+    Group.objects.bulk_create(
+        (
+            Group(
+                title=fake.sentence(nb_words=3).rstrip('.'),
+                slug=f'group-{i}',
+                description=fake.paragraph(),
+            )
+            for i in range(start_groups, groups)
+        ),
+        batch_size=MODEL_BATCH_SIZE,
+    )
+    sentences = [
+        fake.sentence(nb_words=rnd.randint(4, 14))
+        for _ in range(SENTENCE_POOL)
+    ]
+    author_ids = list(User.objects.values_list('pk', flat=True))
+    group_ids = list(Group.objects.values_list('pk', flat=True)) + [None]
+    start_posts = Post.objects.count()
+    with transaction.atomic(), bulk_indexing():
+        for offset in range(start_posts, posts, batch_size):
+            Post.objects.insert_rows(
+                (
+                    ' '.join(rnd.choices(sentences, k=rnd.randint(1, 6))),
+                    SEED_EPOCH + timedelta(minutes=i, seconds=rnd.random()),
+                    rnd.choice(author_ids),
+                    rnd.choice(group_ids),
+                )
+                for i in range(offset, min(offset + batch_size, posts))
+            )
+    PostCounter.objects.rebuild()
+    timelines.forget(group_ids[:-1])
+    return (
+        max(users - start_users, 0),
+        max(groups - start_groups, 0),
+        max(posts - start_posts, 0),
+    )
+
+
+def timings(func, repeat):
+    """Время выполнения func в миллисекундах, repeat замеров."""
+    result = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        result.append((time.perf_counter() - started) * 1000)
+    return result
+
+
+def percentiles(values):
+    values = sorted(values)
+
+    def pick(share):
+        return values[min(len(values) - 1, int(len(values) * share))]
+
+    return {
+        'p50': statistics.median(values),
+        'p95': pick(0.95),
+        'p99': pick(0.99),
+    }
+
+
+def concurrent_load(readers, writers, seconds, authors):
+    """Читатели листают главную, писатели добавляют посты seconds секунд.
+
+    Писатель i пишет от имени authors[i % len(authors)]. Каждый поток
+    работает со своим соединением. Возвращает операции в секунду и
+    число ошибок ``database is locked`` у тех и других.
+    """
+    deadline = time.monotonic() + seconds
+    totals = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+    lock = threading.Lock()
+
+    def read():
+        list(across(Post.objects.for_feed())[:10])
+
+    def write(author):
+        post = Post(author=author, text='Пост из бенчмарка')
+        with transaction.atomic(
+            using=router.db_for_write(Post, instance=post)
+        ):
+            post.save()
+
+    def run(operation, kind, *args):
+        done = errors = 0
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    operation(*args)
+                    done += 1
+                except OperationalError:
+                    errors += 1
+        finally:
+            connections.close_all()
+        with lock:
+            totals[kind + 's'] += done
+            totals[kind + '_errors'] += errors
+
+    threads = [
+        threading.Thread(target=run, args=(read, 'read'))
+        for _ in range(readers)
+    ] + [
+        threading.Thread(
+            target=run, args=(write, 'write', authors[i % len(authors)])
+        )
+        for i in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        'reads_per_s': totals['reads'] / seconds,
+        'writes_per_s': totals['writes'] / seconds,
+        'read_errors': totals['read_errors'],
+        'write_errors': totals['write_errors'],
+    }
+
+
+def query_plan(queryset):
+    """Строки EXPLAIN QUERY PLAN для запроса queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'EXPLAIN QUERY PLAN /* {next(_explain_ids)} */ {sql}', params
+        )
+        return [row[-1] for row in cursor.fetchall()]
+
+
+# Маршруты, которые обходит bench_urls.
+BENCH_URLCONFS = ('posts.urls', 'users.urls', 'about.urls')
+
+
+def url_targets(post):
+    """(имя маршрута, URL) для всех маршрутов BENCH_URLCONFS.
+
+    Параметры маршрутов и строки запроса берутся у post: его группа,
+    автор, id и первое слово текста.
+    """
+    samples = {
+        'slug': post.group.slug,
+        'username': post.author.username,
+        'post_id': post.pk,
+    }
+    queries = {
+        'posts:search': {'q': post.text.split()[0]},
+        'posts:export': {'author': post.author.username},
+    }
+    for module_name in BENCH_URLCONFS:
+        module = import_module(module_name)
+        for pattern in module.urlpatterns:
+            name = f'{module.app_name}:{pattern.name}'
+            kwargs = {key: samples[key] for key in pattern.pattern.converters}
+            url = reverse(name, kwargs=kwargs)
+            if name in queries:
+                url += '?' + urlencode(queries[name])
+            yield name, url
+
+
+def measure_url(client, url, repeat, cold=False):
+    """Время, число SQL-запросов и размер ответа для repeat запросов.
+
+    При cold перед каждым запросом очищается кэш: так меряется
+    отрисовка страницы, а не чтение готовой страницы из кэша.
+    """
+    durations, queries, sizes = [], [], []
+    for _ in range(repeat):
+        if cold:
+            cache.clear()
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recorder.record():
+            response = client.get(url)
+            body = (
+                b''.join(response.streaming_content) if response.streaming
+                else response.content
+            )
+        durations.append((time.perf_counter() - started) * 1000)
+        queries.append(len(recorder))
+        sizes.append(len(body))
+    return {
+        'url': url,
+        'status': response.status_code,
+        **percentiles(durations),
+        'queries': max(queries),
+        'bytes': max(sizes),
+    }
+
+
+def regressions(results, baseline, tolerance, min_ms):
+    """Ухудшения results относительно baseline в виде строк отчёта.
+
+    Время сравнивается по p95 с допуском tolerance (доля), но не меньше
+    min_ms: на страницах в пару миллисекунд шум больше допуска.
+    Число запросов не должно расти вовсе.
+    """
+    problems = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if result['status'] != old['status']:
+            problems.append(
+                f'{name}: статус {old["status"]} -> {result["status"]}'
+            )
+        if result['queries'] > old['queries']:
+            problems.append(
+                f'{name}: запросов {old["queries"]} -> {result["queries"]}'
+            )
+        limit = max(old['p95'] * (1 + tolerance), old['p95'] + min_ms)
+        if result['p95'] > limit:
+            problems.append(
+                f'{name}: p95 {old["p95"]:.1f} -> {result["p95"]:.1f} мс'
+            )
+        if result['bytes'] > old['bytes'] * (1 + tolerance):
+            problems.append(
+                f'{name}: размер {old["bytes"]} -> {result["bytes"]} байт'
+            )
+    return problems
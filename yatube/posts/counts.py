@@ -0,0 +1,66 @@
+"""Число постов лент из кэша с фоновым обновлением.
+
+Страница ленты спрашивает число постов на каждом запросе. Оно берётся
+из кэша, если ему меньше ``COUNT_CACHE_TTL`` секунд. Устаревшее
+значение отдаётся сразу, а пересчёт (обычно чтение PostCounter)
+запускается в фоновом потоке, и только один на ленту. Синхронно число
+считается, только если в кэше его нет совсем.
+
+При ``COUNT_REFRESH_IN_BACKGROUND = False`` (разработка и тесты)
+пересчёт идёт в том же запросе: фоновый поток не видит транзакцию
+теста.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+COUNT_KEY = 'count:{name}'
+REFRESH_KEY = 'count:refresh:{name}'
+DEFAULT_TTL = 30
+# Сколько хранить устаревшее значение, которое ещё можно показать.
+STALE_TIMEOUT = 60 * 60
+
+
+def _ttl():
+    return getattr(settings, 'COUNT_CACHE_TTL', DEFAULT_TTL)
+
+
+def _store(name, compute):
+    value = compute()
+    cache.set(
+        COUNT_KEY.format(name=name), (value, time.time() + _ttl()),
+        STALE_TIMEOUT,
+    )
+    return value
+
+
+def _refresh_in_thread(name, compute):
+    try:
+        _store(name, compute)
+    finally:
+        cache.delete(REFRESH_KEY.format(name=name))
+        connections.close_all()
+
+
+def cached_count(name, compute):
+    """Число для ленты name; compute() считает его заново."""
+    entry = cache.get(COUNT_KEY.format(name=name))
+    if entry is None:
+        return _store(name, compute)
+    value, fresh_until = entry
+    if fresh_until > time.time():
+        return value
+    # add() атомарен: обновление запускает только первый запрос,
+    # увидевший устаревшее значение.
+    if cache.add(REFRESH_KEY.format(name=name), True, _ttl()):
+        if getattr(settings, 'COUNT_REFRESH_IN_BACKGROUND', True):
+            threading.Thread(
+                target=_refresh_in_thread, args=(name, compute), daemon=True
+            ).start()
+        else:
+            cache.delete(REFRESH_KEY.format(name=name))
+            return _store(name, compute)
+    return value
@@ -0,0 +1,102 @@
+"""Потоковая выгрузка постов в JSONL и CSV.
+
+Посты читаются через ``.iterator()`` порциями по ``CHUNK_SIZE`` строк,
+а выгрузка отдаётся построчно, так что память не растёт с числом
+постов, а первая строка уходит сразу после первой порции. Поля те же,
+что понимает команда import_posts: выгрузку можно загрузить обратно.
+
+Строки постов несут id автора и группы: при шардировании автора и
+группы в базе шарда нет. Имена и slug подставляются по порции одним
+запросом к основной базе на каждую модель.
+"""
+import csv
+import itertools
+import json
+from operator import itemgetter
+
+from django.http import Http404
+
+from . import shards
+from .lookups import get_author_or_404, get_group_or_404
+from .models import Group, Post, User
+
+FORMATS = ('jsonl', 'csv')
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+FIELDS = ('id', 'text', 'author', 'group', 'pub_date')
+COLUMNS = ('pk', 'text', 'author_id', 'group_id', 'pub_date')
+CHUNK_SIZE = 2000
+
+
+def _filter_id(lookup, value):
+    """id автора или группы для фильтра; 0, если их нет — постов не будет."""
+    try:
+        return lookup(value).pk
+    except Http404:
+        return 0
+
+
+def posts_for_export(author=None, group=None):
+    """Посты автора и/или группы по username и slug, новые первыми.
+
+    Посты автора читаются из его шарда, остальные — из всех шардов.
+    """
+    posts = Post.objects.order_by('-pub_date', '-pk')
+    if group is not None:
+        posts = posts.filter(group_id=_filter_id(get_group_or_404, group))
+    if author is not None:
+        author_id = _filter_id(get_author_or_404, author)
+        return posts.filter(author_id=author_id).using(
+            shards.for_author(author_id)
+        ).values_list(*COLUMNS)
+    return shards.across(posts.values_list(*COLUMNS), key=itemgetter(4, 0))
+
+
+def _named(rows):
+    """Строки с username и slug вместо id, порциями по CHUNK_SIZE."""
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return
+        authors = dict(shards.outside(User).filter(
+            pk__in={row[2] for row in chunk}
+        ).values_list('pk', 'username'))
+        group_ids = {row[3] for row in chunk} - {None}
+        groups = dict(shards.outside(Group).filter(
+            pk__in=group_ids
+        ).values_list('pk', 'slug')) if group_ids else {}
+        for pk, text, author_id, group_id, pub_date in chunk:
+            yield (
+                pk, text, authors.get(author_id), groups.get(group_id),
+                pub_date,
+            )
+
+
+class _Line:
+    """Файлоподобный объект для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(rows, fmt):
+    """Строки выгрузки по одной: для ответа и для команды."""
+    rows = _named(rows.iterator(chunk_size=CHUNK_SIZE))
+    if fmt == 'csv':
+        writer = csv.writer(_Line())
+        yield writer.writerow(FIELDS)
+        for pk, text, author, group, pub_date in rows:
+            yield writer.writerow(
+                (pk, text, author, group or '', pub_date.isoformat())
+            )
+        return
+    for pk, text, author, group, pub_date in rows:
+        yield json.dumps({
+            'id': pk,
+            'text': text,
+            'author': author,
+            'group': group,
+            'pub_date': pub_date.isoformat(),
+        }, ensure_ascii=False) + '\n'
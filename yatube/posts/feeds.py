@@ -0,0 +1,158 @@
+"""RSS, Atom и JSON Feed для главной, групп и профилей.
+
+Ленты строятся на тех же запросах, что и HTML-страницы
+(``Post.objects.for_feed()``), и кэшируются тем же
+``cache_anonymous_page``: у каждой ленты общая версия с её
+HTML-страницей, поэтому запись поста сбрасывает ровно те ленты, где он
+виден, а агрегатор с ETag или If-Modified-Since получает 304 без
+запросов к базе.
+"""
+import json
+
+from django.contrib.syndication.views import Feed
+from django.urls import reverse
+from django.utils.feedgenerator import (Atom1Feed, Rss201rev2Feed,
+                                        SyndicationFeed)
+from django.utils.html import linebreaks
+from django.utils.text import Truncator
+
+from core.query_budget import query_budget
+
+from .lookups import get_author_or_404, get_group_or_404
+from .models import Post
+from .page_cache import (cache_anonymous_page, group_feed, index_feed,
+                         profile_feed)
+from .shards import across, budget
+
+FEED_SIZE = 20
+TITLE_WORDS = 8
+
+
+class JsonFeed(SyndicationFeed):
+    """JSON Feed 1.1 (https://jsonfeed.org/version/1.1)."""
+    content_type = 'application/feed+json; charset=utf-8'
+
+    def write(self, outfile, encoding):
+        feed = {
+            'version': 'https://jsonfeed.org/version/1.1',
+            'title': self.feed['title'],
+            'home_page_url': self.feed['link'],
+            'feed_url': self.feed['feed_url'],
+            'description': self.feed['description'],
+            'language': self.feed['language'],
+            'items': [self.item(item) for item in self.items],
+        }
+        outfile.write(json.dumps(feed, ensure_ascii=False))
+
+    @staticmethod
+    def item(item):
+        result = {
+            'id': item['unique_id'] or item['link'],
+            'url': item['link'],
+            'title': item['title'],
+            'content_html': item['description'],
+            'date_published': item['pubdate'].isoformat(),
+            'authors': [{'name': item['author_name']}],
+        }
+        if item['categories']:
+            result['tags'] = list(item['categories'])
+        return result
+
+
+FEED_TYPES = {
+    'rss': Rss201rev2Feed,
+    'atom': Atom1Feed,
+    'json': JsonFeed,
+}
+
+
+class PostsFeed(Feed):
+    """Общая часть лент: последние FEED_SIZE постов с карточек."""
+
+    def items(self, obj):
+        return self.posts(obj)[:FEED_SIZE]
+
+    def item_title(self, item):
+        return Truncator(item.text).words(TITLE_WORDS)
+
+    def item_description(self, item):
+        # Описание в лентах — HTML: текст поста экранируется, как на сайте.
+        return linebreaks(item.text, autoescape=True)
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', kwargs={'post_id': item.pk})
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_categories(self, item):
+        return [item.group.title] if item.group_id else []
+
+
+class IndexFeed(PostsFeed):
+    title = 'Yatube: последние записи'
+    description = 'Новые записи всех авторов'
+
+    def link(self):
+        return reverse('posts:main')
+
+    def posts(self, obj):
+        return across(Post.objects.for_feed())
+
+
+class GroupFeed(PostsFeed):
+
+    def get_object(self, request, slug):
+        return get_group_or_404(slug)
+
+    def title(self, obj):
+        return f'Yatube: {obj.title}'
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse('posts:group_posts', kwargs={'slug': obj.slug})
+
+    def posts(self, obj):
+        return across(obj.posts.for_feed())
+
+
+class ProfileFeed(PostsFeed):
+
+    def get_object(self, request, username):
+        return get_author_or_404(username)
+
+    def title(self, obj):
+        return f'Yatube: записи {obj.get_full_name() or obj.username}'
+
+    def description(self, obj):
+        return f'Новые записи пользователя {obj.username}'
+
+    def link(self, obj):
+        return reverse('posts:profile', kwargs={'username': obj.username})
+
+    def posts(self, obj):
+        return Post.objects.for_feed().of_author(obj)
+
+
+def feed_views(feed_class, feed, max_queries):
+    """View ленты в каждом формате из FEED_TYPES, с кэшем и бюджетом."""
+    views = {}
+    for kind, feed_type in FEED_TYPES.items():
+        view = feed_class()
+        view.feed_type = feed_type
+        views[kind] = query_budget(max_queries)(
+            cache_anonymous_page(feed)(view)
+        )
+    return views
+
+
+index = feed_views(IndexFeed, index_feed, budget(3, per_shard=3, sharded=2))
+group = feed_views(GroupFeed, group_feed, budget(4, per_shard=2, sharded=1))
+profile = feed_views(
+    ProfileFeed, profile_feed, budget(4, per_shard=0, sharded=2)
+)
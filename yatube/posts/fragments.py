@@ -0,0 +1,76 @@
+"""Кэш отрендеренных карточек постов.
+
+Ключ карточки содержит версии поста, его автора и группы. Версии
+лежат в том же кэше и меняются сигналами (см. posts.signals), так что
+после правки поста, группы или имени автора карточка просто получает
+новый ключ, а старая вытесняется по таймауту. Лента рендерится двумя
+get_many: версии и сами карточки; рендерятся только промахи.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+CARD_TEMPLATE = 'includes/post_card.html'
+CARD_TIMEOUT = 60 * 60 * 24
+VERSION_KEY = 'post_card:version:{kind}:{pk}'
+CARD_KEY = 'post_card:{variant}:{language}:{pk}:{versions}'
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def bump_version(kind, pk):
+    """Сбрасывает все карточки, зависящие от поста, автора или группы."""
+    cache.set(VERSION_KEY.format(kind=kind, pk=pk), _new_version(), None)
+
+
+def _version_keys(post):
+    return (
+        VERSION_KEY.format(kind='post', pk=post.pk),
+        VERSION_KEY.format(kind='author', pk=post.author_id),
+        VERSION_KEY.format(kind='group', pk=post.group_id),
+    )
+
+
+def _versions(posts):
+    keys = {key for post in posts for key in _version_keys(post)}
+    versions = cache.get_many(keys)
+    # Пропавшую версию нельзя считать нулевой: под ней могла остаться
+    # устаревшая карточка. Заводим новую.
+    missing = {key: _new_version() for key in keys - versions.keys()}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return versions
+
+
+def render_cards(posts, variant):
+    """HTML карточек для страницы ленты, по одной строке на пост."""
+    posts = list(posts)
+    versions = _versions(posts)
+    language = get_language()
+    keys = [
+        CARD_KEY.format(
+            variant=variant,
+            language=language,
+            pk=post.pk,
+            versions='.'.join(versions[key] for key in _version_keys(post)),
+        )
+        for post in posts
+    ]
+    cards = cache.get_many(keys)
+    rendered = {
+        key: render_to_string(
+            CARD_TEMPLATE, {'post': post, 'variant': variant}
+        )
+        for key, post in zip(keys, posts)
+        if key not in cards
+    }
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+        cards.update(rendered)
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,165 @@
+"""Фоновые задачи записи постов (core.jobs).
+
+Сигналы сохранения и удаления поста (``posts.signals``) ставят задачу
+в базу поста, в той же транзакции. Задачи одного поста идут одной
+пачкой: счётчики сдвигаются на итоговую разницу, версии карточки и
+лент меняются по разу, а готовые ленты получают события по порядку.
+
+Задача ставится по изменённым полям (``Post.changed_fields``): правка
+одного текста (автор и группа те же) ставится с ключом идемпотентности —
+сколько бы раз пост ни правили, пока задача ждёт, ленты и карточка
+сбросятся один раз; запись, не изменившая ни текст, ни автора, ни
+группу, задач не ставит.
+
+Загрузка постов (import_posts) сигналов не отправляет и ставит одну
+задачу на транзакцию: сбросить ленты затронутых авторов и групп.
+"""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.utils.dateparse import parse_datetime
+
+from core import jobs
+
+from . import timelines
+from .fragments import bump_version
+from .models import Group, Post, PostCounter
+from .page_cache import bump_feeds, group_feed, index_feed, profile_feed
+
+User = get_user_model()
+
+POST_CHANGED = 'posts.post_changed'
+POST_EDITED = 'posts.post_edited'
+POSTS_IMPORTED = 'posts.posts_imported'
+
+
+def post_batch(pk):
+    return f'post:{pk}'
+
+
+# Поля, которые видны в карточках и лентах.
+SHOWN_FIELDS = {'text', 'author_id', 'group_id'}
+
+
+def enqueue_saved(post, created):
+    old_author_id = getattr(post, '_loaded_author_id', None)
+    old_group_id = getattr(post, '_loaded_group_id', None)
+    using = post._state.db
+    changed = SHOWN_FIELDS.intersection(post.changed_fields())
+    if not created and not changed:
+        return
+    if not created and changed == {'text'}:
+        jobs.enqueue(
+            POST_EDITED, {'pk': post.pk},
+            key=f'{POST_EDITED}:{using}:{post.pk}',
+            batch=post_batch(post.pk), using=using,
+        )
+        return
+    jobs.enqueue(POST_CHANGED, {
+        'event': 'saved',
+        'created': created,
+        'pk': post.pk,
+        'pub_date': post.pub_date,
+        'author_id': post.author_id,
+        'group_id': post.group_id,
+        'old_author_id': None if created else old_author_id,
+        'old_group_id': None if created else old_group_id,
+    }, batch=post_batch(post.pk), using=using)
+
+
+def enqueue_deleted(post):
+    jobs.enqueue(POST_CHANGED, {
+        'event': 'deleted',
+        'pk': post.pk,
+        'pub_date': post.pub_date,
+        'author_id': post.author_id,
+        'group_id': post.group_id,
+        'old_group_id': getattr(post, '_loaded_group_id', None),
+    }, batch=post_batch(post.pk), using=post._state.db)
+
+
+def count_deltas(events):
+    """Итоговые сдвиги счётчиков по событиям поста."""
+    deltas = Counter()
+    for event in events:
+        if event['event'] == 'deleted':
+            sign = -1
+        elif event['created']:
+            sign = 1
+        else:
+            if event['old_author_id'] != event['author_id']:
+                deltas[PostCounter.AUTHOR, event['old_author_id']] -= 1
+                deltas[PostCounter.AUTHOR, event['author_id']] += 1
+            if event['old_group_id'] != event['group_id']:
+                deltas[PostCounter.GROUP, event['old_group_id']] -= 1
+                deltas[PostCounter.GROUP, event['group_id']] += 1
+            continue
+        deltas[PostCounter.ALL, 0] += sign
+        deltas[PostCounter.AUTHOR, event['author_id']] += sign
+        deltas[PostCounter.GROUP, event['group_id']] += sign
+    return {
+        (scope, key): delta for (scope, key), delta in deltas.items()
+        if key is not None and delta
+    }
+
+
+def bump_post_feeds(post_ids, author_ids, group_ids):
+    """Сбрасывает карточки постов и ленты, в которых они были."""
+    for pk in post_ids:
+        bump_version('post', pk)
+    usernames = User.objects.filter(pk__in=author_ids).values_list(
+        'username', flat=True
+    )
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True
+    )
+    bump_feeds(
+        index_feed(), *map(profile_feed, usernames), *map(group_feed, slugs)
+    )
+
+
+@jobs.handler(POST_CHANGED)
+def post_changed(events, using):
+    counters = PostCounter.objects.db_manager(using)
+    for (scope, key), delta in count_deltas(events).items():
+        counters.add(scope, key, delta)
+    for event in events:
+        post = Post(
+            pk=event['pk'], pub_date=parse_datetime(event['pub_date']),
+            group_id=event['group_id'],
+        )
+        if event['event'] == 'deleted':
+            timelines.post_deleted(post, {
+                event['group_id'], event['old_group_id']
+            } - {None})
+        else:
+            timelines.post_saved(post, event['created'], event['old_group_id'])
+    bump_post_feeds(
+        {event['pk'] for event in events},
+        {event[name] for event in events
+         for name in ('author_id', 'old_author_id') if event.get(name)},
+        {event[name] for event in events
+         for name in ('group_id', 'old_group_id') if event.get(name)},
+    )
+
+
+@jobs.handler(POST_EDITED)
+def post_edited(payloads, using):
+    pks = {payload['pk'] for payload in payloads}
+    rows = list(Post.objects.using(using).filter(pk__in=pks).values_list(
+        'author_id', 'group_id'
+    ))
+    bump_post_feeds(
+        pks, {author_id for author_id, _ in rows},
+        {group_id for _, group_id in rows if group_id},
+    )
+
+
+@jobs.handler(POSTS_IMPORTED)
+def posts_imported(payloads, using):
+    group_ids = {pk for payload in payloads for pk in payload['group_ids']}
+    timelines.forget(group_ids)
+    bump_post_feeds(
+        (), {pk for payload in payloads for pk in payload['author_ids']},
+        group_ids,
+    )
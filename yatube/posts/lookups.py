@@ -0,0 +1,61 @@
+"""Группа по slug и автор по username из кэша процесса.
+
+Страницы и ленты групп и профилей начинаются с поиска этой строки, а
+меняется она редко. Кэш — ``core.lru.LRUCache`` на процесс; записи
+сбрасывают обработчики сигналов Group и User в ``posts.signals``.
+
+В кэше лежат значения полей, а не сами модели: каждый вызов собирает
+новый экземпляр через ``from_db``, так что запросы не делят между собой
+объект и его кэш связанных объектов.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404
+
+from core.lru import LRUCache
+
+from .models import Group, User
+
+DEFAULT_SIZE = 1024
+DEFAULT_TTL = 300
+
+
+def _cache():
+    return LRUCache(
+        getattr(settings, 'LOOKUP_CACHE_SIZE', DEFAULT_SIZE),
+        getattr(settings, 'LOOKUP_CACHE_TTL', DEFAULT_TTL),
+    )
+
+
+groups = _cache()
+authors = _cache()
+
+
+def _field_names(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def _cached(cache, model, **lookup):
+    names = _field_names(model)
+    # Читаем из основной базы: реплика после переименования ещё отдала бы
+    # старую строку, и она прожила бы в кэше до истечения TTL.
+    queryset = model.objects.using(DEFAULT_DB_ALIAS).filter(**lookup)
+    values = cache.get_or_set(
+        *lookup.values(), lambda: queryset.values_list(*names).first(),
+    )
+    if values is None:
+        raise Http404(f'{model._meta.object_name} не найден')
+    return model.from_db(DEFAULT_DB_ALIAS, names, values)
+
+
+def get_group_or_404(slug):
+    return _cached(groups, Group, slug=slug)
+
+
+def get_author_or_404(username):
+    return _cached(authors, User, username=username)
+
+
+def clear():
+    groups.clear()
+    authors.clear()
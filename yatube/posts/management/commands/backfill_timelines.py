@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts import timelines
+from posts.models import Group
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит готовые ленты главной и групп (posts.timelines) заново '
+        'по постам'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--group', nargs='+', metavar='SLUG',
+            help='Только ленты этих групп, без главной',
+        )
+
+    def handle(self, *args, **options):
+        groups = Group.objects.order_by('pk')
+        group_ids = [None]
+        if options['group']:
+            groups = groups.filter(slug__in=options['group'])
+            group_ids = []
+        group_ids += list(groups.values_list('pk', flat=True))
+        for group_id in group_ids:
+            timelines.rebuild(group_id)
+        self.stdout.write(f'Построено лент: {len(group_ids)}')
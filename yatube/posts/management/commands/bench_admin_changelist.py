@@ -0,0 +1,80 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.benchmarks import percentiles, seed_posts, timings
+from posts.models import Post
+from posts.paginator import encode_cursor
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время страниц списка постов в админке и падает, если '
+        'p95 выше порога. Меряет с DEBUG=False, как в продакшене. Пишет '
+        'в настроенную базу: запускать на копии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--max-ms', type=float, default=500.0,
+            help='Допустимое p95 одной страницы, мс',
+        )
+
+    def handle(self, *args, **options):
+        seeded = seed_posts(options['posts'])
+        self.stdout.write(f'Добавлено постов: {seeded}')
+        admin, _ = User.objects.get_or_create(
+            username='bench_admin',
+            defaults={'is_staff': True, 'is_superuser': True},
+        )
+        client = Client()
+        client.force_login(admin)
+        url = reverse('admin:posts_post_changelist')
+        middle = Post.objects.order_by('-pub_date', '-pk')[
+            Post.objects.count() // 2
+        ]
+        pages = {
+            'первая страница': {},
+            'вторая страница': {'p': 1},
+            'середина таблицы по курсору': {'after': encode_cursor(middle)},
+            'месяц в иерархии дат': {
+                'published': f'{timezone.localtime(middle.pub_date):%Y-%m}',
+            },
+            'поиск': {'q': f'пост {middle.pk}'},
+        }
+        # Порог задан для продакшена: с DEBUG шаблоны не кэшируются, а
+        # Server-Timing оборачивает каждый рендеринг, и страница выходит
+        # в разы медленнее. Настройки, которые settings.py выводит из
+        # DEBUG, переопределяются вместе с ним.
+        with override_settings(
+            DEBUG=False, SERVER_TIMING_SAMPLE_RATE=0,
+            QUERY_BUDGET_STRICT=False,
+        ):
+            failed = self.measure(client, url, pages, options)
+        if failed:
+            raise CommandError(
+                f'p95 выше {options["max_ms"]} мс: ' + ', '.join(failed)
+            )
+
+    def measure(self, client, url, pages, options):
+        """Печатает перцентили страниц и возвращает имена медленных."""
+        failed = []
+        for name, params in pages.items():
+            response = client.get(url, params)
+            if response.status_code != 200:
+                raise CommandError(f'{name}: ответ {response.status_code}')
+            stats = percentiles(timings(
+                lambda: client.get(url, params), options['repeat']
+            ))
+            self.stdout.write(f'{name}: ' + ', '.join(
+                f'{key}={value:.1f} мс' for key, value in stats.items()
+            ))
+            if stats['p95'] > options['max_ms']:
+                failed.append(name)
+        return failed
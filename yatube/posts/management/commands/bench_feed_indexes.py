@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.benchmarks import percentiles, query_plan, seed_posts, timings
+from posts.models import Post
+from posts.views import AMOUNT
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает планы и время запросов лент с индексами Post.Meta '
+        'и без них. Пишет в настроенную базу: запускать на копии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        seeded = seed_posts(options['posts'])
+        self.stdout.write(f'Добавлено постов: {seeded}')
+        queries = self.feed_queries()
+        self.report('С индексами', queries, options['repeat'])
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in Post._meta.indexes:
+                        cursor.execute('DROP INDEX {}'.format(
+                            connection.ops.quote_name(index.name)
+                        ))
+                self.report('Без индексов', queries, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def feed_queries(self):
+        feed = Post.objects.order_by('-pub_date', '-pk')
+        post = feed[feed.count() // 2]
+        deep = feed.filter(pub_date__lt=post.pub_date)
+        return {
+            'index': lambda: feed[:AMOUNT],
+            'index, глубокая страница по курсору': lambda: deep[:AMOUNT],
+            'group': lambda: feed.filter(group_id=post.group_id)[:AMOUNT],
+            'profile': lambda: feed.filter(author_id=post.author_id)[:AMOUNT],
+        }
+
+    def report(self, title, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, build in queries.items():
+            plan = query_plan(build())
+            stats = percentiles(timings(lambda: list(build()), repeat))
+            self.stdout.write(f'  {name}:')
+            for row in plan:
+                self.stdout.write(f'    {row}')
+            self.stdout.write('    ' + ', '.join(
+                f'{key}={value:.2f} мс' for key, value in stats.items()
+            ))
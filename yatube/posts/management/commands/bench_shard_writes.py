@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import override_settings
+
+from core.sqlite import copy_database
+from posts import shards
+from posts.benchmarks import concurrent_load
+
+User = get_user_model()
+
+
+def add_database(alias, name):
+    """Регистрирует базу SQLite шарда в DATABASES на время процесса."""
+    settings.DATABASES[alias] = {
+        **settings.DATABASES[DEFAULT_DB_ALIAS],
+        'NAME': name,
+        'SQLITE_PRAGMAS': {'foreign_keys': 'off'},
+    }
+    connections.ensure_defaults(alias)
+    connections.prepare_test_settings(alias)
+
+
+def write_in_process(author, seconds):
+    # Потоки одного процесса упираются в GIL раньше, чем в блокировку
+    # SQLite, поэтому каждый писатель — отдельный процесс.
+    return concurrent_load(0, 1, seconds, [author])
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет скорость параллельного создания постов при разном числе '
+        'шардов, каждый писатель — отдельный процесс. Шарды — временные '
+        'файлы SQLite; авторов создаёт в настроенной базе: запускать на '
+        'копии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shards', type=int, nargs='+', default=[1, 2, 4],
+        )
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Нужна база SQLite')
+        authors = [
+            User.objects.get_or_create(username=f'bench_writer_{i}')[0]
+            for i in range(options['writers'])
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            # Схему мигрируем один раз и копируем в каждый шард.
+            template = os.path.join(directory, 'template.sqlite3')
+            add_database('bench_template', template)
+            call_command(
+                'migrate', database='bench_template', verbosity=0,
+                interactive=False,
+            )
+            connections['bench_template'].close()
+            baseline = None
+            for count in options['shards']:
+                aliases = tuple(
+                    f'bench_{count}_{i}' for i in range(count)
+                )
+                with override_settings(POST_SHARDS=aliases):
+                    for alias in aliases:
+                        name = os.path.join(directory, f'{alias}.sqlite3')
+                        copy_database(template, name)
+                        add_database(alias, name)
+                        shards.prepare_sequence(alias)
+                    # Процессы получают копию настроек, но не соединения.
+                    connections.close_all()
+                    with multiprocessing.get_context('fork').Pool(
+                        options['writers']
+                    ) as pool:
+                        results = pool.starmap(write_in_process, [
+                            (author, options['seconds']) for author in authors
+                        ])
+                writes = sum(result['writes_per_s'] for result in results)
+                errors = sum(result['write_errors'] for result in results)
+                baseline = baseline or writes
+                self.stdout.write(
+                    f'шардов {count}: записей {writes:.0f}/с '
+                    f'(x{writes / baseline:.1f}), '
+                    f'ошибок {errors}'
+                )
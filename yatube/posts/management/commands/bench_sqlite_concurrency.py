@@ -0,0 +1,62 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import override_settings
+
+from core.sqlite import pragmas
+from posts.benchmarks import concurrent_load, seed_posts
+
+User = get_user_model()
+
+# Как SQLite работает без настройки: rollback journal и полный fsync.
+DEFAULT_SQLITE = {
+    'journal_mode': 'delete',
+    'synchronous': 'full',
+    'cache_size': -2000,
+    'mmap_size': 0,
+    'busy_timeout': 5000,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность параллельных чтений и записей '
+        'постов на SQLite без настройки и с SQLITE_PRAGMAS. Пишет в '
+        'настроенную базу: запускать на копии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10_000)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            raise CommandError('Нужна база SQLite в файле')
+        seed_posts(options['posts'])
+        author, _ = User.objects.get_or_create(username='bench_writer')
+        results = {}
+        for name, values in (
+            ('без настройки', DEFAULT_SQLITE),
+            ('SQLITE_PRAGMAS', pragmas()),
+        ):
+            # Новые PRAGMA применяются к новым соединениям.
+            connections.close_all()
+            with override_settings(SQLITE_PRAGMAS=values):
+                results[name] = result = concurrent_load(
+                    options['readers'], options['writers'],
+                    options['seconds'], [author],
+                )
+            self.stdout.write(
+                f'{name}: чтений {result["reads_per_s"]:.0f}/с, '
+                f'записей {result["writes_per_s"]:.0f}/с, '
+                f'ошибок {result["read_errors"]}/{result["write_errors"]}'
+            )
+        connections.close_all()
+        before, after = results.values()
+        for kind in ('reads_per_s', 'writes_per_s'):
+            if before[kind]:
+                self.stdout.write(
+                    f'{kind}: x{after[kind] / before[kind]:.1f}'
+                )
@@ -0,0 +1,102 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.utils import timezone
+
+from posts.benchmarks import measure_url, regressions, url_targets
+from posts.models import Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет p50/p95/p99, число SQL-запросов и размер ответа для всех '
+        'адресов posts, users и about, пишет результат в JSON и сравнивает '
+        'его с прошлым запуском. Делает автора тестового поста '
+        'сотрудником: запускать на копии базы после seed_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', default='bench.json')
+        parser.add_argument(
+            '--baseline',
+            help='JSON прошлого запуска; при ухудшении команда падает',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Допустимый рост p95 и размера ответа, доля',
+        )
+        parser.add_argument(
+            '--min-ms', type=float, default=2.0,
+            help='Рост p95, который всегда считается шумом, мс',
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом',
+        )
+
+    def handle(self, *args, **options):
+        post = Post.objects.select_related('author', 'group').filter(
+            group__isnull=False
+        ).order_by('-pub_date', '-pk').first()
+        if post is None:
+            raise CommandError(
+                'Нет постов с группой: сначала выполните seed_data'
+            )
+        if settings.DEBUG:
+            self.stderr.write(
+                'DEBUG=True: шаблоны не кэшируются, время будет завышено'
+            )
+        # Адреса для авторизованных (создание, правка, выгрузка) меряются
+        # от имени автора поста, анонимные — без входа.
+        User.objects.filter(pk=post.author_id).update(is_staff=True)
+        anonymous, author = Client(), Client()
+        author.force_login(post.author)
+        results = {}
+        for name, url in url_targets(post):
+            client = anonymous
+            response = anonymous.get(url)
+            if response.status_code == 302 and 'login' in response.url:
+                client = author
+            result = measure_url(
+                client, url, options['repeat'], options['cold']
+            )
+            result['client'] = 'author' if client is author else 'anonymous'
+            results[name] = result
+            self.stdout.write(
+                f'{name:24} {result["status"]} '
+                f'p50={result["p50"]:.1f} p95={result["p95"]:.1f} '
+                f'p99={result["p99"]:.1f} мс, '
+                f'запросов: {result["queries"]}, байт: {result["bytes"]}'
+            )
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'debug': settings.DEBUG,
+                'posts': Post.objects.count(),
+                'repeat': options['repeat'],
+                'cold': options['cold'],
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты записаны в {options["output"]}')
+        if not options['baseline']:
+            return
+        try:
+            with open(options['baseline'], encoding='utf-8') as source:
+                baseline = json.load(source)['results']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать baseline: {error}')
+        problems = regressions(
+            results, baseline, options['tolerance'], options['min_ms']
+        )
+        if problems:
+            raise CommandError('Ухудшения:\n' + '\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Ухудшений нет'))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import timelines
+from posts.models import Group
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет готовые ленты главной и групп (posts.timelines) с '
+        'постами; падает, если есть расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Перестроить разошедшиеся ленты',
+        )
+
+    def handle(self, *args, **options):
+        group_ids = [None, *Group.objects.order_by('pk').values_list(
+            'pk', flat=True
+        )]
+        checked = missing = 0
+        broken = []
+        for group_id in group_ids:
+            result = timelines.check(group_id)
+            if result is None:
+                missing += 1
+                continue
+            checked += 1
+            if not result:
+                broken.append(group_id)
+                self.stdout.write(
+                    f'Разошлась лента {timelines.feed_name(group_id)}'
+                )
+                if options['fix']:
+                    timelines.rebuild(group_id)
+        self.stdout.write(
+            f'Проверено: {checked}, разошлось: {len(broken)}, '
+            f'ещё не построено: {missing}'
+        )
+        if broken and not options['fix']:
+            raise CommandError('Ленты разошлись с постами: запустите --fix')
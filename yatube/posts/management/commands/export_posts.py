@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import FORMATS, export_lines, posts_for_export
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты автора и/или группы в JSONL или CSV без загрузки '
+        'всей выборки в память.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--author', help='username автора')
+        parser.add_argument('--group', help='slug группы')
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument(
+            '--output', default='-', help='Путь к файлу, «-» — stdout',
+        )
+
+    def handle(self, *args, **options):
+        path = options['output']
+        lines = export_lines(
+            posts_for_export(options['author'], options['group']),
+            options['format'],
+        )
+        if path == '-':
+            self.stdout.writelines(lines)
+            return
+        try:
+            with open(path, 'w', encoding='utf-8', newline='') as output:
+                output.writelines(lines)
+        except OSError as error:
+            raise CommandError(f'Не удалось записать {path}: {error}')
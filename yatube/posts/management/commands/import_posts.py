@@ -0,0 +1,215 @@
+import csv
+import io
+import itertools
+import json
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import jobs
+from posts import shards
+from posts.jobs import POSTS_IMPORTED
+from posts.models import Group, Post, PostCounter
+from posts.search import bulk_indexing
+
+User = get_user_model()
+
+FORMATS = ('jsonl', 'csv')
+# Сколько ошибочных строк показать, прежде чем только считать их.
+SHOWN_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает посты из JSONL или CSV (файл или stdin). Поля записи: '
+        'text, author (username), group (slug, необязательно), pub_date '
+        '(ISO 8601, необязательно).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Путь к файлу, «-» — читать stdin',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат входа; по умолчанию по расширению файла, для '
+                 'stdin — jsonl',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Строк в одном INSERT',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=50000,
+            help='Строк в одной транзакции',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl'
+        )
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        else:
+            try:
+                stream = open(path, encoding='utf-8', newline='')
+            except OSError as error:
+                raise CommandError(f'Не удалось открыть {path}: {error}')
+        self.authors = {}
+        self.groups = {}
+        self.errors = 0
+        self.total = 0
+        started = time.perf_counter()
+        with stream:
+            records = self.read(stream, fmt)
+            while True:
+                chunk = itertools.islice(records, options['chunk_size'])
+                with ExitStack() as stack:
+                    # Посты и счётчики — в шардах, задача — в основной.
+                    for alias in {DEFAULT_DB_ALIAS, *shards.aliases()}:
+                        stack.enter_context(transaction.atomic(using=alias))
+                    stack.enter_context(bulk_indexing())
+                    read = self.insert_chunk(chunk, options['batch_size'])
+                if not read:
+                    break
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'Загружено {self.total} постов, '
+                    f'{self.total / elapsed:.0f} в секунду'
+                )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {self.total} постов за {elapsed:.1f} с '
+            f'({self.total / max(elapsed, 1e-9):.0f} в секунду), '
+            f'пропущено строк: {self.errors}'
+        ))
+
+    def read(self, stream, fmt):
+        """Записи входа по одной: весь файл в памяти не держим."""
+        if fmt == 'csv':
+            # Номер строки в DictReader — это номер записи плюс заголовок.
+            for number, record in enumerate(csv.DictReader(stream), 2):
+                yield number, record
+            return
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                self.skip(number, f'не JSON: {error}')
+                continue
+            if not isinstance(record, dict):
+                self.skip(number, 'ожидался JSON-объект')
+                continue
+            yield number, record
+
+    def skip(self, number, reason):
+        self.errors += 1
+        if self.errors <= SHOWN_ERRORS:
+            self.stderr.write(f'Строка {number} пропущена: {reason}')
+
+    def resolve(self, batch):
+        """Дополняет карты username → id и slug → id одним запросом."""
+        usernames = {record.get('author') for _, record in batch}
+        usernames -= self.authors.keys()
+        self.authors.update(User.objects.filter(
+            username__in=usernames - {None}
+        ).values_list('username', 'pk'))
+        slugs = {record.get('group') for _, record in batch}
+        slugs -= self.groups.keys() | {None, ''}
+        self.groups.update(Group.objects.filter(
+            slug__in=slugs
+        ).values_list('slug', 'pk'))
+
+    def to_row(self, number, record, now):
+        text = record.get('text')
+        if not text:
+            self.skip(number, 'пустой text')
+            return None
+        author_id = self.authors.get(record.get('author'))
+        if author_id is None:
+            self.skip(number, f'нет автора {record.get("author")!r}')
+            return None
+        slug = record.get('group') or None
+        group_id = None
+        if slug is not None:
+            group_id = self.groups.get(slug)
+            if group_id is None:
+                self.skip(number, f'нет группы {slug!r}')
+                return None
+        pub_date = now
+        if record.get('pub_date'):
+            try:
+                pub_date = parse_datetime(record['pub_date'])
+            except ValueError:
+                pub_date = None
+            if pub_date is None:
+                self.skip(number, f'дата {record["pub_date"]!r} не ISO 8601')
+                return None
+            if timezone.is_naive(pub_date):
+                pub_date = timezone.make_aware(pub_date)
+        return text, pub_date, author_id, group_id
+
+    def insert_chunk(self, records, batch_size):
+        """Вставляет записи пачками и возвращает число прочитанных."""
+        # Post.objects.insert_rows не отправляет сигналы: счётчики
+        # сдвигаются, а сброс лент ставится задачей в транзакции
+        # порции, поисковый индекс обновляется одним запросом на неё.
+        seen = 0
+        deltas = Counter()
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                self.finish_chunk(deltas)
+                return seen
+            seen += len(batch)
+            self.resolve(batch)
+            now = timezone.now()
+            rows = [
+                row for row in (
+                    self.to_row(number, record, now)
+                    for number, record in batch
+                ) if row is not None
+            ]
+            Post.objects.insert_rows(rows)
+            self.total += len(rows)
+            for _, _, author_id, group_id in rows:
+                # Счётчики лежат в шарде постов автора.
+                alias = shards.for_author(author_id)
+                deltas[alias, PostCounter.ALL, 0] += 1
+                deltas[alias, PostCounter.AUTHOR, author_id] += 1
+                if group_id is not None:
+                    deltas[alias, PostCounter.GROUP, group_id] += 1
+
+    def finish_chunk(self, deltas):
+        """Счётчики и сброс лент порции — в её же транзакции.
+
+        Ленты сбрасывает задача (core.jobs), а не сама команда: без
+        JOBS_EAGER её выполнит run_jobs в общем с сайтом кэше. При
+        JOBS_EAGER задача выполняется здесь же, и сайт увидит сброс,
+        только если кэш общий между процессами (не LocMemCache).
+        """
+        if not deltas:
+            return
+        for (alias, scope, key), delta in deltas.items():
+            PostCounter.objects.db_manager(alias).add(scope, key, delta)
+        jobs.enqueue(POSTS_IMPORTED, {
+            'author_ids': sorted({
+                key for _, scope, key in deltas
+                if scope == PostCounter.AUTHOR
+            }),
+            'group_ids': sorted({
+                key for _, scope, key in deltas
+                if scope == PostCounter.GROUP
+            }),
+        })
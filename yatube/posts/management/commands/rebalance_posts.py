@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import shards
+from posts.models import PostCounter
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты в шарды их авторов после изменения POST_SHARDS '
+        'и пересобирает счётчики постов в шардах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать посты не на своём месте',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not shards.aliases():
+            raise CommandError('Шардирование выключено: POST_SHARDS пуст')
+        for alias in shards.aliases():
+            if options['dry_run']:
+                count = shards.misplaced(alias).count()
+                self.stdout.write(f'{alias}: не на своём месте {count}')
+                continue
+            moved = shards.move_posts(alias, options['batch_size'])
+            self.stdout.write(f'{alias}: перенесено {moved}')
+        if not options['dry_run']:
+            created, updated, _ = PostCounter.objects.rebuild()
+            self.stdout.write(
+                f'Счётчики: создано {created}, исправлено {updated}'
+            )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import PostCounter
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов авторов и групп и чинит расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не записывать',
+        )
+
+    def handle(self, *args, **options):
+        created, updated, deleted = PostCounter.objects.rebuild(
+            dry_run=options['dry_run']
+        )
+        self.stdout.write(
+            f'Создано: {created}, исправлено: {updated}, удалено: {deleted}'
+        )
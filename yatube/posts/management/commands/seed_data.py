@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.benchmarks import SEED_PASSWORD, seed_data
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу пользователями, группами и постами с текстами '
+        'Faker. На пустой базе результат зависит только от --seed. '
+        'Пишет в настроенную базу: запускать на копии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        users, groups, posts = seed_data(
+            options['users'], options['groups'], options['posts'],
+            seed=options['seed'],
+        )
+        self.stdout.write(
+            f'Добавлено пользователей: {users}, групп: {groups}, '
+            f'постов: {posts} за {time.perf_counter() - started:.1f} с. '
+            f'Пароль пользователей: {SEED_PASSWORD}'
+        )
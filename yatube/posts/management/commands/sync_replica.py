@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.sqlite import copy_database
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в реплику из DATABASES. С '
+        '--interval повторяет копирование каждые N секунд.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='replica')
+        parser.add_argument(
+            '--interval', type=float,
+            help='Копировать заново каждые N секунд, пока не остановят',
+        )
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in settings.DATABASES or alias == DEFAULT_DB_ALIAS:
+            raise CommandError(f'Нет базы-реплики {alias} в DATABASES')
+        databases = (
+            settings.DATABASES[DEFAULT_DB_ALIAS], settings.DATABASES[alias]
+        )
+        if any('sqlite3' not in db['ENGINE'] for db in databases):
+            raise CommandError('Копировать можно только базы SQLite')
+        source, target = (db['NAME'] for db in databases)
+        while True:
+            started = time.perf_counter()
+            copy_database(source, target)
+            self.stdout.write(
+                f'{alias}: скопировано за '
+                f'{(time.perf_counter() - started) * 1000:.0f} мс'
+            )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.19 on 2026-10-17 04:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostCounter = apps.get_model('posts', 'PostCounter')
+    db_alias = schema_editor.connection.alias
+    posts = Post.objects.using(db_alias).order_by()
+    counters = [PostCounter(scope='all', key=0, value=posts.count())]
+    for scope, field in (('author', 'author_id'), ('group', 'group_id')):
+        rows = posts.exclude(**{field: None}).values(field).annotate(
+            total=models.Count('pk')
+        ).values_list(field, 'total')
+        counters.extend(
+            PostCounter(scope=scope, key=key, value=total)
+            for key, total in rows
+        )
+    PostCounter.objects.using(db_alias).bulk_create(counters, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_auto_20220822_1058'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='post',
+            options={'ordering': ['-pub_date']},
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='group',
+            field=models.ForeignKey(blank=True, help_text='Группа, к которой будет относиться пост', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='posts', to='posts.Group', verbose_name='Группа'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='pub_date',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Дата публикации'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='text',
+            field=models.TextField(help_text='Введите текст поста', verbose_name='Текст поста'),
+        ),
+        migrations.CreateModel(
+            name='PostCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('all', 'Все посты'), ('author', 'Автор'), ('group', 'Группа')], max_length=16, verbose_name='Область')),
+                ('key', models.PositiveIntegerField(default=0, help_text='id автора или группы, 0 для всех постов', verbose_name='Идентификатор')),
+                ('value', models.IntegerField(default=0, verbose_name='Количество постов')),
+            ],
+            options={
+                'unique_together': {('scope', 'key')},
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
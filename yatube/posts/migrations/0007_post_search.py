@@ -0,0 +1,54 @@
+from django.db import migrations
+
+FTS_TABLE = 'posts_post_fts'
+
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"text, content='posts_post', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2')",
+)
+TRIGGERS_SQL = (
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+    f"VALUES ('delete', old.id, old.text); END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF text ON posts_post "
+    f"BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+    f"VALUES ('delete', old.id, old.text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END",
+)
+REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+DROP_SQL = (
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+)
+
+
+def create_index(apps, schema_editor):
+    # Индекс нужен только на SQLite, на других базах поиск идёт LIKE.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL + TRIGGERS_SQL + (REBUILD_SQL,):
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.19 on 2026-10-17 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_post_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Timeline',
+            fields=[
+                ('feed', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Лента')),
+                ('complete', models.BooleanField(default=False, help_text='Старше последней записи ленты постов нет', verbose_name='Все посты ленты')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feed', models.CharField(max_length=64, verbose_name='Лента')),
+                ('post_id', models.BigIntegerField(verbose_name='id поста')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['feed', '-pub_date', '-post_id'], name='timeline_feed_pub_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('feed', 'post_id')},
+        ),
+    ]
@@ -0,0 +1,35 @@
+from importlib import import_module
+
+from django.db import migrations, models
+
+# Добавление столбца на SQLite пересоздаёт таблицу posts_post, и
+# триггеры поискового индекса (0007_post_search) пропадают вместе со
+# старой таблицей.
+search = import_module('posts.migrations.0007_post_search')
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    drop = [sql for sql in search.DROP_SQL if 'TRIGGER' in sql]
+    for sql in drop + list(search.TRIGGERS_SQL):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_timelines'),
+    ]
+
+    # Триггеры создаются заново после пересоздания таблицы в обе стороны:
+    # откат тоже пересоздаёт её, удаляя столбец.
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, create_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Растёт с каждой записью поста', verbose_name='Версия'),
+        ),
+        migrations.RunPython(create_triggers, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+from collections import defaultdict
+
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import Count, F, Prefetch, Q
 from django.contrib.auth import get_user_model
 
+from . import shards
+
 User = get_user_model()
 MAX_LENGHT = 15
 
@@ -14,10 +19,102 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    # Поля, которые шаблоны карточек и страницы поста читают у поста,
+    # автора и группы: всё остальное не выбираем.
+    CARD_FIELDS = (
+        'text',
+        'pub_date',
+        'author__username',
+        'author__first_name',
+        'author__last_name',
+        'group__title',
+        'group__slug',
+        'group__description',
+    )
+
+    def for_feed(self):
+        """Посты для лент: автор и группа одним JOIN."""
+        if shards.aliases():
+            # Авторы и группы лежат в основной базе, а посты в шардах:
+            # JOIN между базами невозможен, они подгружаются отдельно.
+            # База указана явно: иначе Django читал бы их из шарда поста.
+            return self.prefetch_related(
+                Prefetch('author', queryset=shards.outside(User)),
+                Prefetch('group', queryset=shards.outside(Group)),
+            )
+        return self.select_related('author', 'group').only(*self.CARD_FIELDS)
+
+    def create(self, **kwargs):
+        # QuerySet.create сохраняет в базу запроса, минуя роутер: без
+        # явной базы пост должен попасть в шард автора.
+        if self._db is None and shards.aliases():
+            post = self.model(**kwargs)
+            post.save(force_insert=True)
+            return post
+        return super().create(**kwargs)
+
+    def of_author(self, author):
+        """Посты автора: при шардировании — из его шарда."""
+        return self.filter(author=author).using(shards.for_author(author.pk))
+
+    def for_detail(self):
+        """Пост для отдельной страницы: шаблон читает те же поля."""
+        return self.for_feed()
+
+    def insert_rows(self, rows, ids=False):
+        """Вставляет строки (text, pub_date, author_id, group_id) пачкой.
+
+        В отличие от bulk_create сохраняет pub_date, который auto_now_add
+        перезаписал бы, и не отправляет сигналы: счётчики и версии лент
+        вызывающий код обновляет сам. С ids=True первым в строке идёт id.
+        При шардировании строки раскладываются по шардам авторов.
+        """
+        if self._db is None and shards.aliases():
+            by_shard = defaultdict(list)
+            for row in rows:
+                by_shard[shards.for_author(row[-2])].append(row)
+            for alias, shard_rows in by_shard.items():
+                self.using(alias).insert_rows(shard_rows, ids)
+            return
+        connection = connections[self._db or router.db_for_write(Post)]
+        columns = ('id',) * ids + ('text', 'pub_date', 'author_id', 'group_id')
+        # Значения по умолчанию Django подставляет сам, в схеме их нет.
+        sql = (
+            f'INSERT INTO {Post._meta.db_table} '
+            f'({", ".join(columns)}, version) '
+            f'VALUES ({", ".join(["%s"] * len(columns))}, 1)'
+        )
+        adapt = connection.ops.adapt_datetimefield_value
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, [
+                (*row[:-3], adapt(row[-3]), *row[-2:]) for row in rows
+            ])
+
+
+class EditConflict(Exception):
+    """Пост изменили (или удалили) после того, как его открыли на правку."""
+
+
 class Post(models.Model):
 
     class Meta:
         ordering = ['-pub_date']
+        # Индексы повторяют сортировку и фильтры лент: главной,
+        # группы и профиля (см. posts.paginator).
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+        ]
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста'
@@ -40,6 +137,295 @@ class Post(models.Model):
         verbose_name='Группа',
         help_text='Группа, к которой будет относиться пост'
     )
+    version = models.PositiveIntegerField(
+        'Версия',
+        default=1,
+        editable=False,
+        help_text='Растёт с каждой записью поста'
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:MAX_LENGHT]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_state()
+        return instance
+
+    def remember_state(self):
+        """Запоминает значения полей, с которыми пост лежит в базе."""
+        self._loaded_values = {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+        }
+        self._loaded_author_id = self._loaded_values.get('author_id')
+        self._loaded_group_id = self._loaded_values.get('group_id')
+
+    def changed_fields(self):
+        """Поля (attname), отличающиеся от прочитанных из базы.
+
+        У поста, которого ещё нет в базе, изменены все поля.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key
+            ]
+        return [
+            name for name, value in loaded.items()
+            if self.__dict__.get(name, value) != value
+        ]
+
+    def save(self, *args, **kwargs):
+        # Любая запись существующего поста, в том числе из админки,
+        # меняет версию: форма, открытая до неё, устаревает.
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        version = self.version
+        self.version = getattr(self, '_loaded_values', {}).get(
+            'version', version
+        ) + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        try:
+            return super().save(*args, **kwargs)
+        except Exception:
+            self.version = version
+            raise
+
+    def save_changes(self, version=None):
+        """Записывает изменённые поля одним UPDATE только этих колонок.
+
+        Возвращает список изменённых полей; если он пуст, записи не
+        было. С version запись проходит, только если в базе пост всё
+        ещё этой версии, иначе — EditConflict.
+        """
+        changed = [
+            name for name in self.changed_fields() if name != 'version'
+        ]
+        if not changed:
+            return []
+        self._expected_version = version
+        try:
+            self.save(update_fields=changed)
+        finally:
+            self._expected_version = None
+        return changed
+
+    def _do_update(self, base_qs, *args, **kwargs):
+        version = getattr(self, '_expected_version', None)
+        if version is None:
+            return super()._do_update(base_qs, *args, **kwargs)
+        # Версия проверяется в том же UPDATE: между проверкой и записью
+        # пост никто не успеет изменить.
+        updated = super()._do_update(
+            base_qs.filter(version=version), *args, **kwargs
+        )
+        if not updated:
+            raise EditConflict(self.pk, version)
+        return updated
+
+
+class PostCounterManager(models.Manager):
+
+    def get_value(self, scope, key=0, exact=False):
+        """Значение счётчика; exact=True пересчитывает его COUNT(*).
+
+        Если строки счётчика нет, она создаётся пересчётом один раз,
+        а не при каждом чтении. При шардировании значения шардов
+        складываются; счётчик автора лежит только в его шарде.
+        """
+        if self._db is None and shards.aliases():
+            aliases = shards.aliases()
+            if scope == PostCounter.AUTHOR:
+                aliases = (shards.for_author(key),)
+            return sum(
+                self.db_manager(alias).get_value(scope, key, exact)
+                for alias in aliases
+            )
+        if not exact:
+            value = self.filter(scope=scope, key=key).values_list(
+                'value', flat=True
+            ).first()
+            if value is not None:
+                return value
+        value = self.recount(scope, key)
+        self.update_or_create(
+            scope=scope, key=key, defaults={'value': value}
+        )
+        return value
+
+    def get_values(self, scope, keys):
+        """Счётчики для keys пачкой; недостающие досчитываются по одному."""
+        if shards.aliases():
+            return {key: self.get_value(scope, key) for key in keys}
+        values = dict(self.filter(
+            scope=scope, key__in=keys
+        ).values_list('key', 'value'))
+        for key in set(keys) - values.keys():
+            values[key] = self.get_value(scope, key)
+        return values
+
+    def recount(self, scope, key=0):
+        """Точный COUNT(*) по постам области."""
+        posts = Post.objects.using(self._db).order_by()
+        if scope == PostCounter.AUTHOR:
+            posts = posts.filter(author_id=key)
+        elif scope == PostCounter.GROUP:
+            posts = posts.filter(group_id=key)
+        return posts.count()
+
+    def add(self, scope, key, delta):
+        """Сдвигает счётчик на delta одним UPDATE.
+
+        Если строки ещё нет, она создаётся с точным значением: сигнал
+        вызывается уже после записи поста, так что пересчёт его учтёт.
+        При отрицательном delta строка не создаётся: так задачи постов,
+        удалённых каскадом вместе с автором или группой, не вернут их
+        удалённый счётчик, а get_value досчитает строку при чтении.
+        """
+        updated = self.filter(scope=scope, key=key).update(
+            value=F('value') + delta
+        )
+        if updated or delta < 0:
+            return
+        value = self.recount(scope, key)
+        try:
+            with transaction.atomic(using=self._db):
+                self.create(scope=scope, key=key, value=value)
+        except IntegrityError:
+            self.filter(scope=scope, key=key).update(value=value)
+
+    def reset(self, scope, key):
+        """Обнуляет счётчик новой группы или автора."""
+        if self._db is None and shards.aliases():
+            for alias in shards.aliases():
+                self.db_manager(alias).reset(scope, key)
+            return
+        if not self.filter(scope=scope, key=key).update(value=0):
+            self.create(scope=scope, key=key, value=0)
+
+    def expected(self):
+        """Правильные значения всех счётчиков, посчитанные по постам."""
+        posts = Post.objects.using(self._db).order_by()
+        values = {(PostCounter.ALL, 0): posts.count()}
+        for scope, field in (
+            (PostCounter.AUTHOR, 'author_id'),
+            (PostCounter.GROUP, 'group_id'),
+        ):
+            rows = posts.exclude(**{field: None}).values(field).annotate(
+                total=Count('pk')
+            ).values_list(field, 'total')
+            for key, total in rows:
+                values[(scope, key)] = total
+        return values
+
+    def rebuild(self, dry_run=False):
+        """Чинит разошедшиеся счётчики пачкой запросов.
+
+        Возвращает количество созданных, исправленных и удалённых строк.
+        При шардировании чинит счётчики каждого шарда.
+        """
+        if self._db is None and shards.aliases():
+            return tuple(map(sum, zip(*(
+                self.db_manager(alias).rebuild(dry_run)
+                for alias in shards.aliases()
+            ))))
+        with transaction.atomic(using=self._db):
+            expected = self.expected()
+            if shards.aliases():
+                # Авторов и групп в базе шарда нет: счётчики удалённых
+                # не удаляются, а обнуляются ниже.
+                stale = []
+            else:
+                stale = list(self.filter(
+                    Q(scope=PostCounter.AUTHOR)
+                    & ~Q(key__in=User.objects.values('pk'))
+                    | Q(scope=PostCounter.GROUP)
+                    & ~Q(key__in=Group.objects.values('pk'))
+                ).values_list('pk', flat=True))
+            to_update = []
+            for counter in self.exclude(pk__in=stale):
+                # Нет строки в expected — у автора или группы нет постов.
+                value = expected.pop((counter.scope, counter.key), 0)
+                if counter.value != value:
+                    counter.value = value
+                    to_update.append(counter)
+            to_create = [
+                PostCounter(scope=scope, key=key, value=value)
+                for (scope, key), value in expected.items()
+            ]
+            if not dry_run:
+                self.bulk_create(to_create, batch_size=500)
+                self.bulk_update(to_update, ['value'], batch_size=500)
+                self.filter(pk__in=stale).delete()
+        return len(to_create), len(to_update), len(stale)
+
+
+class PostCounter(models.Model):
+    """Денормализованное число постов: всего, у автора и в группе."""
+    ALL = 'all'
+    AUTHOR = 'author'
+    GROUP = 'group'
+    SCOPES = (
+        (ALL, 'Все посты'),
+        (AUTHOR, 'Автор'),
+        (GROUP, 'Группа'),
+    )
+
+    scope = models.CharField('Область', max_length=16, choices=SCOPES)
+    key = models.PositiveIntegerField(
+        'Идентификатор',
+        default=0,
+        help_text='id автора или группы, 0 для всех постов'
+    )
+    value = models.IntegerField('Количество постов', default=0)
+
+    objects = PostCounterManager()
+
+    class Meta:
+        unique_together = ('scope', 'key')
+
+    def __str__(self):
+        return f'{self.scope}:{self.key}={self.value}'
+
+
+class Timeline(models.Model):
+    """Готовая лента в DatabaseTimelineStore (posts.timelines)."""
+    feed = models.CharField('Лента', max_length=64, primary_key=True)
+    complete = models.BooleanField(
+        'Все посты ленты',
+        default=False,
+        help_text='Старше последней записи ленты постов нет'
+    )
+
+    def __str__(self):
+        return self.feed
+
+
+class TimelineEntry(models.Model):
+    """Пост готовой ленты.
+
+    post_id без внешнего ключа: при шардировании пост лежит в другой
+    базе (posts.shards).
+    """
+    feed = models.CharField('Лента', max_length=64)
+    post_id = models.BigIntegerField('id поста')
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        unique_together = ('feed', 'post_id')
+        indexes = [
+            models.Index(
+                fields=['feed', '-pub_date', '-post_id'],
+                name='timeline_feed_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.feed}:{self.post_id}'
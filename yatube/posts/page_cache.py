@@ -0,0 +1,109 @@
+"""Кэш целых страниц лент для анонимных читателей.
+
+Каждая лента (главная, группа, профиль) имеет версию — время последней
+записи в ней в целых секундах. Версия входит в ключ закэшированной
+страницы, в ETag и в Last-Modified, поэтому повторный визит с
+If-None-Match получает 304 по одному обращению к кэшу, без запросов к
+базе. Сигналы из posts.signals обновляют версии только тех лент, в
+которых изменился пост.
+"""
+import hashlib
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from core.routers import read_from_primary, sticky_seconds
+
+FEED_VERSION_KEY = 'feed:version:{feed}'
+PAGE_KEY = 'feed:page:{feed}:{version}:{path}'
+PAGE_TIMEOUT = 60 * 10
+
+
+def index_feed():
+    return 'index'
+
+
+def group_feed(slug):
+    return f'group:{slug}'
+
+
+def profile_feed(username):
+    return f'profile:{username}'
+
+
+def bump_feeds(*feeds):
+    """Помечает ленты изменёнными: их страницы и ETag устаревают.
+
+    Last-Modified идёт с точностью до секунды, поэтому версия растёт
+    хотя бы на секунду: иначе после двух правок за одну секунду клиент
+    с If-Modified-Since получил бы 304 на устаревшую ленту.
+    """
+    keys = [FEED_VERSION_KEY.format(feed=feed) for feed in feeds]
+    now = math.ceil(time.time())
+    versions = cache.get_many(keys)
+    cache.set_many(
+        {key: max(now, versions.get(key, 0) + 1) for key in keys}, None
+    )
+
+
+def feed_version(feed):
+    key = FEED_VERSION_KEY.format(feed=feed)
+    version = cache.get(key)
+    if version is None:
+        version = math.ceil(time.time())
+        cache.set(key, version, None)
+    return version
+
+
+def _is_anonymous(request):
+    # Без cookie сессии пользователь точно анонимный, и не нужно
+    # поднимать сессию из базы.
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return True
+    return not request.user.is_authenticated
+
+
+def cache_anonymous_page(feed):
+    """Кэширует страницы ленты для анонимов и отвечает 304 по ETag.
+
+    feed получает именованные аргументы view и возвращает имя ленты.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not _is_anonymous(
+                request
+            ):
+                return view_func(request, *args, **kwargs)
+            name = feed(**kwargs)
+            version = feed_version(name)
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = PAGE_KEY.format(feed=name, version=version, path=path)
+            etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+            response = get_conditional_response(
+                request, etag=etag, last_modified=version
+            )
+            if response is None:
+                response = cache.get(key)
+            if response is None:
+                if time.time() - version < sticky_seconds():
+                    # Реплика могла ещё не получить запись, сменившую
+                    # версию, а страница под этой версией живёт долго.
+                    read_from_primary()
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200 or response.cookies:
+                    return response
+                cache.set(key, response, PAGE_TIMEOUT)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(version)
+            patch_vary_headers(response, ('Cookie',))
+            patch_cache_control(response, max_age=0)
+            return response
+        return wrapper
+    return decorator
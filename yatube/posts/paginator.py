@@ -0,0 +1,359 @@
+"""Keyset-пагинация лент постов.
+
+Страницы адресуются непрозрачными курсорами ``?after=``/``?before=``,
+построенными по паре (pub_date, id) граничного поста. Выборка по
+курсору — это ``WHERE`` по индексу и ``LIMIT`` без ``OFFSET`` и без
+``COUNT(*)``, поэтому пятитысячная страница стоит столько же,
+сколько первая. Нумерованные ``?page=N`` по-прежнему работают, но
+навигация ссылается номерами только на страницы рядом с текущей, а
+последнюю открывает ``?page=last`` — та же выборка в обратном порядке.
+"""
+import base64
+import binascii
+import hashlib
+
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from .counts import cached_count
+from .models import PostCounter
+
+LAST_PAGE = 'last'
+
+
+def encode_cursor(post):
+    """Упаковывает (pub_date, id) поста в токен для URL."""
+    return cursor_token(post.pub_date, post.pk)
+
+
+def cursor_token(pub_date, pk):
+    raw = f'{pub_date.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, id) или None, если токен битый."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class KeysetPage(Page):
+    """Страница, которая знает курсоры соседних страниц.
+
+    У страниц, полученных по курсору, номер неизвестен (``number`` равен
+    None), а наличие соседей определяется по лишней выбранной строке.
+    """
+
+    def __init__(self, object_list, number, paginator,
+                 has_next=None, has_previous=None):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def has_next(self):
+        if self._has_next is None:
+            return super().has_next()
+        return self._has_next
+
+    def has_previous(self):
+        if self._has_previous is None:
+            return super().has_previous()
+        return self._has_previous
+
+    @property
+    def window(self):
+        """Номера страниц для навигации, None — пропуск («…»)."""
+        if not self.number:
+            return []
+        # Приблизительное число постов может отставать от текущей
+        # страницы: она и следующая за ней в окне есть всегда.
+        last = max(self.paginator.num_pages, self.number + self.has_next())
+        return list(self.paginator.page_window(self.number, last))
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not len(self):
+            return None
+        return self.paginator.cursor(self[-1])
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous() or not len(self):
+            return None
+        return self.paginator.cursor(self[0])
+
+
+class KeysetPaginator(Paginator):
+    """Paginator с переходами по курсору (pub_date, id).
+
+    Номерные страницы (``page``/``get_page``) адресуются как у обычного
+    Paginator, но тоже отдают курсоры, так что дальше навигация идёт
+    без OFFSET. Число постов (``count``) может быть приблизительным: от
+    него зависят только номера в навигации, а содержимое страницы и
+    наличие следующей определяются по лишней выбранной строке.
+    """
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(
+            object_list.order_by('-pub_date', '-pk'), per_page, **kwargs
+        )
+        self._count = count
+
+    @cached_property
+    def count(self):
+        """Число постов из переданной функции (счётчика) или COUNT(*)."""
+        if self._count is None:
+            return self.exact_count()
+        return self._count()
+
+    def exact_count(self):
+        """Точный COUNT(*) — только для тех, кто просит его явно."""
+        return self.object_list.order_by().count()
+
+    def page_window(self, number, last=None, on_each_side=2):
+        """Номера страниц рядом с number; None — пропуск до края ленты.
+
+        Номеров дальних страниц в окне нет: ``?page=N`` читается через
+        OFFSET, а первая и последняя открываются ссылками ``?page=1`` и
+        ``?page=last`` (выборка с конца индекса, см. ``last_page``).
+        """
+        last = last or self.num_pages
+        left = max(number - on_each_side, 1)
+        right = min(number + on_each_side, last)
+        if left > 1:
+            yield None
+        yield from range(left, right + 1)
+        if right < last:
+            yield None
+
+    def _get_page(self, *args, **kwargs):
+        return KeysetPage(*args, **kwargs)
+
+    def cursor(self, row):
+        """Курсор строки страницы."""
+        return encode_cursor(row)
+
+    def rows(self, start, stop):
+        """Строки ленты с start по stop, от новых к старым."""
+        return list(self.object_list[start:stop])
+
+    def rows_after(self, pub_date, pk, limit):
+        """limit строк, опубликованных раньше (pub_date, pk)."""
+        return list(self.object_list.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk)
+        )[:limit])
+
+    def rows_before(self, pub_date, pk, limit):
+        """limit ближайших строк новее (pub_date, pk), от старых к новым."""
+        return list(self.object_list.filter(
+            Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, pk__gt=pk)
+        ).reverse()[:limit])
+
+    def rows_last(self, limit):
+        """limit самых старых строк, от старых к новым."""
+        return list(self.object_list.reverse()[:limit])
+
+    def validate_number(self, number):
+        # В отличие от Paginator номер не сверяется с num_pages: число
+        # постов приблизительное, пустую страницу покажет page().
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы не целое число')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = self.rows(bottom, bottom + self.per_page + 1)
+        if not rows and number > 1:
+            raise EmptyPage('На этой странице нет постов')
+        return self._get_page(
+            rows[:self.per_page], number, self,
+            has_next=len(rows) > self.per_page, has_previous=number > 1,
+        )
+
+    def get_page(self, number):
+        if number == LAST_PAGE:
+            return self.last_page()
+        try:
+            return self.page(number)
+        except PageNotAnInteger:
+            return self.page(1)
+        except EmptyPage:
+            return self.last_page()
+
+    def page_after(self, token):
+        """Страница постов, опубликованных раньше поста из курсора."""
+        cursor = decode_cursor(token)
+        if cursor is None:
+            return self.get_page(1)
+        rows = self.rows_after(*cursor, self.per_page + 1)
+        return self._get_page(
+            rows[:self.per_page], None, self,
+            has_next=len(rows) > self.per_page, has_previous=True,
+        )
+
+    def page_before(self, token):
+        """Страница постов, опубликованных позже поста из курсора."""
+        cursor = decode_cursor(token)
+        if cursor is None:
+            return self.get_page(1)
+        rows = self.rows_before(*cursor, self.per_page + 1)
+        return self._get_page(
+            rows[:self.per_page][::-1], None, self,
+            has_next=True, has_previous=len(rows) > self.per_page,
+        )
+
+    def first_page(self):
+        """Самые новые посты без COUNT(*), который делает page(1)."""
+        rows = self.rows(0, self.per_page + 1)
+        return self._get_page(
+            rows[:self.per_page], None, self,
+            has_next=len(rows) > self.per_page, has_previous=False,
+        )
+
+    def last_page(self):
+        """Самые старые посты: та же выборка с конца индекса."""
+        rows = self.rows_last(self.per_page + 1)
+        return self._get_page(
+            rows[:self.per_page][::-1], None, self,
+            has_next=False, has_previous=len(rows) > self.per_page,
+        )
+
+
+class ValuesKeysetPaginator(KeysetPaginator):
+    """KeysetPaginator над ``values()``: строки — словари с pub_date и pk."""
+
+    def cursor(self, row):
+        return cursor_token(row['pub_date'], row['pk'])
+
+
+class TimelinePaginator(KeysetPaginator):
+    """KeysetPaginator, который берёт id постов из готовой ленты.
+
+    timeline — ``posts.timelines.Snapshot``: (pub_date, id) самых новых
+    постов ленты. Страница в пределах списка — один запрос ``pk__in``.
+    Страницы глубже списка, а также страницы, посты которых разошлись со
+    списком (пост удалён, id занят другим постом), читаются обычным
+    запросом KeysetPaginator.
+    """
+
+    def __init__(self, object_list, per_page, timeline, count=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, count, **kwargs)
+        self.timeline = timeline
+
+    def _fetch(self, entries):
+        """Посты entries в их порядке или None, если список устарел."""
+        posts = {
+            post.pk: post for post in self.object_list.filter(
+                pk__in=[pk for _, pk in entries]
+            )
+        }
+        rows = []
+        for pub_date, pk in entries:
+            post = posts.get(pk)
+            if post is None or post.pub_date != pub_date:
+                return None
+            rows.append(post)
+        return rows
+
+    def _covers(self, stop):
+        return stop <= len(self.timeline.entries) or self.timeline.complete
+
+    def rows(self, start, stop):
+        if self._covers(stop):
+            rows = self._fetch(self.timeline.entries[start:stop])
+            if rows is not None:
+                return rows
+        return super().rows(start, stop)
+
+    def rows_after(self, pub_date, pk, limit):
+        entries = self.timeline.entries
+        start = next((
+            index for index, entry in enumerate(entries)
+            if entry < (pub_date, pk)
+        ), len(entries))
+        if self._covers(start + limit):
+            rows = self._fetch(entries[start:start + limit])
+            if rows is not None:
+                return rows
+        return super().rows_after(pub_date, pk, limit)
+
+    def rows_before(self, pub_date, pk, limit):
+        entries = self.timeline.entries
+        stop = next((
+            index for index, entry in enumerate(entries)
+            if entry <= (pub_date, pk)
+        ), len(entries))
+        # Список — начало ленты без пропусков: всё, что новее курсора
+        # внутри списка, в нём есть.
+        if stop < len(entries) or self.timeline.complete:
+            rows = self._fetch(entries[max(stop - limit, 0):stop][::-1])
+            if rows is not None:
+                return rows
+        return super().rows_before(pub_date, pk, limit)
+
+    def rows_last(self, limit):
+        if self.timeline.complete:
+            rows = self._fetch(self.timeline.entries[::-1][:limit])
+            if rows is not None:
+                return rows
+        return super().rows_last(limit)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator для многомиллионной таблицы постов.
+
+    Без фильтров число постов берётся из PostCounter. С фильтрами
+    строки считаются не дальше ``count_limit``: дальше админка листает
+    курсором, а точное число на таких объёмах никто не читает.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.has_filters():
+            return PostCounter.objects.get_value(PostCounter.ALL)
+        # Одни и те же фильтры админка запрашивает подряд при листании,
+        # поэтому ограниченный подсчёт кэшируется по тексту запроса.
+        capped = self.object_list.order_by()[:self.count_limit]
+        name = 'admin:' + hashlib.md5(str(capped.query).encode()).hexdigest()
+        return cached_count(name, capped.count)
+
+
+def paginate(request, queryset, per_page, count=None, timeline=None):
+    """Возвращает страницу ленты по параметрам запроса.
+
+    ``after``/``before`` имеют приоритет над ``page``. count — функция,
+    возвращающая число постов ленты (обычно из PostCounter); она
+    вызывается, только если число нужно номерной странице. timeline —
+    готовый список постов ленты (posts.timelines), если он есть.
+    """
+    if timeline is None:
+        paginator = KeysetPaginator(queryset, per_page, count)
+    else:
+        paginator = TimelinePaginator(queryset, per_page, timeline, count)
+    after = request.GET.get('after')
+    if after:
+        return paginator.page_after(after)
+    before = request.GET.get('before')
+    if before:
+        return paginator.page_before(before)
+    return paginator.get_page(request.GET.get('page'))
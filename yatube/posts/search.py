@@ -0,0 +1,196 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Индекс — внешняя FTS5-таблица над posts_post. Её синхронизируют
+триггеры на вставку, удаление и изменение текста, поэтому в индекс
+попадают и bulk_create, и правки через админку. Результаты
+упорядочены по bm25 и листаются курсором (ранг, id), так что
+глубокие страницы не требуют OFFSET.
+
+Таблица и триггеры создаются миграцией 0007_post_search. Миграции,
+которые пересоздают posts_post (на SQLite это почти любое изменение
+схемы), удаляют триггеры, и такие миграции должны создавать их заново.
+
+При шардировании у каждого шарда своя FTS-таблица: запрос уходит во
+все шарды, а строки сливаются по (ранг, id). bm25 считается по
+статистике своего шарда, так что ранги шардов сравнимы лишь примерно.
+"""
+import base64
+import binascii
+import heapq
+import itertools
+import re
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from operator import itemgetter
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from . import shards
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+INSERT_TRIGGER = f'{FTS_TABLE}_ai'
+# Тот же триггер, что в миграции 0007_post_search.
+INSERT_TRIGGER_SQL = (
+    f"CREATE TRIGGER {INSERT_TRIGGER} AFTER INSERT ON posts_post BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text); END"
+)
+SNIPPET_TOKENS = 24
+# Маркеры подсветки из snippet(): текст поста экранируется в Python,
+# а маркеры потом заменяются на <mark>, так что HTML из поста не пройдёт.
+_MARK_OPEN = '\x02'
+_MARK_CLOSE = '\x03'
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Запрос пользователя в синтаксисе FTS5.
+
+    Каждое слово берётся в кавычки, чтобы операторы FTS5 в запросе не
+    работали, последнее слово ищется как префикс.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += ' *'
+    return ' '.join(terms)
+
+
+def encode_cursor(score, pk):
+    raw = f'{score!r}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        score, pk = base64.urlsafe_b64decode(padded.encode()).decode().split(
+            '|'
+        )
+        return float(score), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(_MARK_OPEN, '<mark>')
+        .replace(_MARK_CLOSE, '</mark>')
+    )
+
+
+def matching_ids_sql():
+    """Подзапрос id постов по MATCH с одним параметром — выражением."""
+    return f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+
+
+@contextmanager
+def bulk_indexing():
+    """Индексирует посты, вставленные в блоке, одним запросом в конце.
+
+    Построчный триггер на массовой загрузке занимает больше половины
+    времени вставки. Внутри блока триггер снят, а в конце новые строки
+    (id больше прежнего максимума) попадают в индекс одним
+    INSERT ... SELECT. Всё происходит в одной транзакции, так что другие
+    записи в это время ждут блокировку и не могут обойти индекс.
+    """
+    if not is_available():
+        yield
+        return
+    table = Post._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+        last_id = cursor.fetchone()[0]
+        cursor.execute(f'DROP TRIGGER IF EXISTS {INSERT_TRIGGER}')
+        yield
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE}(rowid, text) '
+            f'SELECT id, text FROM {table} WHERE id > %s', [last_id]
+        )
+        cursor.execute(INSERT_TRIGGER_SQL)
+
+
+@dataclass
+class SearchResult:
+    post: Post
+    snippet: str
+
+
+@dataclass
+class SearchPage:
+    results: list
+    next_cursor: str = None
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _matches(using, match, cursor, limit):
+    """(id, ранг, сниппет, база) первых limit совпадений в базе using."""
+    sql = (
+        f"SELECT rowid, rank, snippet({FTS_TABLE}, 0, %s, %s, '…', %s) "
+        f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    )
+    params = [_MARK_OPEN, _MARK_CLOSE, SNIPPET_TOKENS, match]
+    if cursor is not None:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [cursor[0], cursor[0], cursor[1]]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(limit)
+    with connections[using].cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        return [(*row, using) for row in db_cursor.fetchall()]
+
+
+def search(query, after=None, per_page=10):
+    """Страница результатов поиска по релевантности (во всех шардах)."""
+    match = match_expression(query)
+    if not match:
+        return SearchPage([])
+    if not is_available():
+        return _search_without_fts(query, after, per_page)
+    cursor = decode_cursor(after) if after else None
+    rows = list(itertools.islice(heapq.merge(
+        *(_matches(using or DEFAULT_DB_ALIAS, match, cursor, per_page + 1)
+          for using in shards.each()),
+        key=itemgetter(1, 0),
+    ), per_page + 1))
+    page_rows = rows[:per_page]
+    by_shard = defaultdict(list)
+    for pk, _, _, using in page_rows:
+        by_shard[using].append(pk)
+    posts = {}
+    for using, pks in by_shard.items():
+        posts.update(Post.objects.for_feed().using(using).in_bulk(pks))
+    results = [
+        SearchResult(posts[pk], highlight(snippet))
+        for pk, _, snippet, _ in page_rows
+        if pk in posts
+    ]
+    next_cursor = None
+    if len(rows) > per_page:
+        pk, score, _, _ = page_rows[-1]
+        next_cursor = encode_cursor(score, pk)
+    return SearchPage(results, next_cursor)
+
+
+def _search_without_fts(query, after, per_page):
+    # Запасной путь для баз без FTS5: LIKE и курсор по id.
+    posts = Post.objects.for_feed().filter(text__icontains=query)
+    cursor = decode_cursor(after) if after else None
+    if cursor is not None:
+        posts = posts.filter(pk__gt=cursor[1])
+    posts = list(posts.order_by('pk')[:per_page + 1])
+    results = [SearchResult(post, post.text) for post in posts[:per_page]]
+    next_cursor = None
+    if len(posts) > per_page:
+        next_cursor = encode_cursor(0.0, posts[per_page - 1].pk)
+    return SearchPage(results, next_cursor)
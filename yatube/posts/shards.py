@@ -0,0 +1,293 @@
+"""Посты, разложенные по нескольким базам по автору.
+
+Включается списком алиасов баз ``POST_SHARDS`` (пустой — шардов нет,
+все посты в основной базе). Пост автора лежит в шарде
+``POST_SHARDS[author_id % len(POST_SHARDS)]``: лента профиля читает
+один шард, а запись постов разных авторов идёт в разные файлы SQLite и
+не ждёт одну блокировку. Счётчики постов (PostCounter) лежат в том же
+шарде, что и посты, и обновляются в той же транзакции.
+
+Пользователи, группы и всё остальное живут в основной базе. Поэтому:
+
+* у шардов отключены внешние ключи (``'SQLITE_PRAGMAS': {'foreign_keys':
+  'off'}`` в их ``DATABASES``): автора поста в таблице шарда нет;
+* ленты подгружают авторов и групп отдельным запросом к основной базе,
+  а не JOIN (см. ``PostQuerySet.for_feed``), а ``post.author`` и
+  ``post.group`` роутер читает оттуда же;
+* главная, лента группы и API постов — это ``across()``: запрос к
+  каждому шарду и слияние уже отсортированных строк по (pub_date, id)
+  через heapq;
+* бюджеты запросов таких view растут с числом шардов (``budget()``).
+
+Шарду с номером i принадлежат id от ``i << SHARD_ID_BITS``, так что id
+поста уникальны между шардами, а шард поста по id находится без
+запросов. Пост, переехавший при смене числа шардов (rebalance_posts),
+сохраняет id и находится перебором остальных шардов.
+
+Поиск по сайту и выгрузка читают все шарды, а админка постов — только
+основную базу (о чём предупреждает проверка core.W001).
+"""
+import heapq
+import itertools
+from collections import defaultdict
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models.functions import Mod
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+SHARD_ID_BITS = 40
+POST_MODEL = 'posts.post'
+post_key = attrgetter('pub_date', 'pk')
+
+
+def aliases():
+    """Алиасы шардов; пустой кортеж — шардирование выключено."""
+    return tuple(getattr(settings, 'POST_SHARDS', ()))
+
+
+def each():
+    """Базы, где искать посты: шарды или None — база по роутерам."""
+    return aliases() or (None,)
+
+
+def for_author(author_id):
+    """Шард постов автора; None без шардирования."""
+    shards = aliases()
+    if not shards:
+        return None
+    return shards[author_id % len(shards)]
+
+
+def for_pk(pk):
+    """Шард, в котором пост с этим id был создан."""
+    shards = aliases()
+    index = pk >> SHARD_ID_BITS
+    if index < len(shards):
+        return shards[index]
+    return None
+
+
+def outside(model):
+    """Запрос к модели не из шардов (пользователи, группы).
+
+    База выбирается роутерами без подсказки-поста: основная или реплика.
+    """
+    return model._default_manager.using(router.db_for_read(model))
+
+
+def budget(queries, per_shard=1, sharded=0):
+    """Бюджет запросов view (core.query_budget), читающей все шарды.
+
+    queries — без шардирования; с ним добавляется per_shard запросов на
+    каждый шард сверх первого и sharded — на то, что без шардов делал
+    JOIN (авторы и группы читаются отдельно).
+    """
+    def limit():
+        shards = aliases()
+        if not shards:
+            return queries
+        return queries + sharded + per_shard * (len(shards) - 1)
+    return limit
+
+
+def prepare_sequence(using):
+    """Сдвигает автоинкремент постов шарда в его диапазон id."""
+    shards = aliases()
+    if using not in shards or not shards.index(using):
+        return
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        raise NotImplementedError('Диапазоны id шардов есть только у SQLite')
+    start = shards.index(using) << SHARD_ID_BITS
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'posts_post'"
+        )
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) '
+                "VALUES ('posts_post', %s)", [start]
+            )
+        elif row[0] < start:
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = %s '
+                "WHERE name = 'posts_post'", [start]
+            )
+
+
+def _is_post(model):
+    meta = getattr(model, '_meta', None)
+    return meta is not None and meta.label_lower == POST_MODEL
+
+
+class ShardRouter:
+    """Запись поста — в шард автора, чтение по экземпляру — из его базы.
+
+    Связанные с постом автор и группа читаются не из шарда, а из базы,
+    которую для них выберут остальные роутеры. Запросы без экземпляра
+    роутер не трогает: их шард выбирают явно (``using(for_author(...))``,
+    ``across()``).
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if not aliases() or not _is_post(type(instance)):
+            return None
+        if _is_post(model):
+            return instance._state.db or for_author(instance.author_id)
+        # Автор или группа поста (post.author): по умолчанию Django
+        # читал бы их из базы поста, а их там нет.
+        return router.db_for_read(model)
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if aliases() and _is_post(model) and _is_post(type(instance)):
+            # Пост, прочитанный из шарда, сохраняется туда же, даже если
+            # сменил автора: переносит его rebalance_posts.
+            if instance._state.db and not instance._state.adding:
+                return instance._state.db
+            return for_author(instance.author_id)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if aliases() and (_is_post(type(obj1)) or _is_post(type(obj2))):
+            return True
+        return None
+
+
+class ShardedQuerySet:
+    """Запрос ко всем шардам сразу, строки слиты по ключу сортировки.
+
+    Поддерживает то, что нужно KeysetPaginator, лентам и выгрузке:
+    filter/exclude/order_by/reverse, срезы, count и iterator. Запросы
+    шардов должны быть отсортированы по key в одну сторону.
+    """
+    ordered = True
+
+    def __init__(self, querysets, key=post_key, descending=True):
+        self.querysets = list(querysets)
+        self.key = key
+        self.descending = descending
+
+    def _clone(self, querysets, descending=None):
+        if descending is None:
+            descending = self.descending
+        return type(self)(querysets, self.key, descending)
+
+    def _each(self, method, *args, **kwargs):
+        return [
+            getattr(queryset, method)(*args, **kwargs)
+            for queryset in self.querysets
+        ]
+
+    def filter(self, *args, **kwargs):
+        return self._clone(self._each('filter', *args, **kwargs))
+
+    def exclude(self, *args, **kwargs):
+        return self._clone(self._each('exclude', *args, **kwargs))
+
+    def order_by(self, *fields):
+        descending = not fields or fields[0].startswith('-')
+        return self._clone(self._each('order_by', *fields), descending)
+
+    def reverse(self):
+        return self._clone(self._each('reverse'), not self.descending)
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def _merge(self, iterables):
+        return heapq.merge(*iterables, key=self.key, reverse=self.descending)
+
+    def __iter__(self):
+        return self._merge(self.querysets)
+
+    def iterator(self, chunk_size=2000):
+        return self._merge(self._each('iterator', chunk_size=chunk_size))
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        if item.step is not None or item.stop is None:
+            raise ValueError('Нужен срез [start:stop] без шага')
+        # Первые stop строк слияния — среди первых stop строк каждого
+        # шарда, так что глубже stop ни один шард не читается.
+        return list(itertools.islice(
+            self._merge(queryset[:item.stop] for queryset in self.querysets),
+            item.start or 0, item.stop,
+        ))
+
+
+def across(queryset, key=post_key):
+    """Запрос постов ко всем шардам; без шардирования — сам queryset."""
+    shards = aliases()
+    if not shards:
+        return queryset
+    return ShardedQuerySet(
+        [queryset.using(alias) for alias in shards], key
+    )
+
+
+def get_post_or_404(queryset, pk):
+    """Пост по id: сначала из шарда, где он создан, потом из остальных."""
+    shards = aliases()
+    if not shards:
+        return get_object_or_404(queryset, pk=pk)
+    home = for_pk(pk)
+    post = next(filter(None, (
+        queryset.using(alias).filter(pk=pk).first()
+        for alias in sorted(shards, key=lambda alias: alias != home)
+    )), None)
+    if post is None:
+        raise Http404('Пост не найден')
+    return post
+
+
+def misplaced(alias):
+    """Посты шарда alias, автор которых по числу шардов живёт в другом."""
+    from .models import Post
+    shards = aliases()
+    return Post.objects.using(alias).annotate(
+        home=Mod('author_id', len(shards))
+    ).exclude(home=shards.index(alias))
+
+
+def move_posts(alias, batch_size=500):
+    """Переносит чужие посты шарда alias в шарды их авторов.
+
+    Пачка сначала копируется (с теми же id и pub_date), потом удаляется
+    из alias. Если перенос прервётся между этими шагами, повторный
+    запуск не скопирует пост дважды. Сигналы не отправляются: счётчики
+    после переноса пересобирает вызывающий код. Возвращает число постов.
+    """
+    from .models import Post
+    moved = 0
+    while True:
+        rows = list(misplaced(alias).order_by('pk').values_list(
+            'pk', 'text', 'pub_date', 'author_id', 'group_id'
+        )[:batch_size])
+        if not rows:
+            return moved
+        by_shard = defaultdict(list)
+        for row in rows:
+            by_shard[for_author(row[3])].append(row)
+        for target, target_rows in by_shard.items():
+            copied = set(Post.objects.using(target).filter(
+                pk__in=[row[0] for row in target_rows]
+            ).values_list('pk', flat=True))
+            with transaction.atomic(using=target):
+                Post.objects.using(target).insert_rows(
+                    [row for row in target_rows if row[0] not in copied],
+                    ids=True,
+                )
+        pks = [row[0] for row in rows]
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {Post._meta.db_table} WHERE id IN '
+                f'({", ".join(["%s"] * len(pks))})', pks
+            )
+        moved += len(rows)
@@ -0,0 +1,168 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (post_delete, post_migrate, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import lookups, shards, timelines
+from .fragments import bump_version
+from .jobs import enqueue_deleted, enqueue_saved
+from .models import Group, Post, PostCounter
+from .page_cache import bump_feeds, group_feed, index_feed, profile_feed
+
+User = get_user_model()
+
+
+# Счётчики, карточки, версии лент и готовые ленты обновляет фоновая
+# задача (posts.jobs), поставленная в транзакции записи поста.
+@receiver(post_save, sender=Post)
+def enqueue_post_saved(sender, instance, created, **kwargs):
+    enqueue_saved(instance, created)
+
+
+@receiver(post_delete, sender=Post)
+def enqueue_post_deleted(sender, instance, **kwargs):
+    enqueue_deleted(instance)
+
+
+@receiver(post_delete, sender=Group)
+def drop_group_timeline(sender, instance, **kwargs):
+    timelines.get_store().delete(timelines.feed_name(instance.pk))
+
+
+@receiver(post_save, sender=Group)
+def create_group_counter(sender, instance, created, raw, **kwargs):
+    # Заводим строку сразу, чтобы первый пост обошёлся одним UPDATE.
+    if created and not raw:
+        PostCounter.objects.reset(PostCounter.GROUP, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def create_author_counter(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        PostCounter.objects.reset(PostCounter.AUTHOR, instance.pk)
+
+
+@receiver(pre_delete, sender=Group)
+def detach_sharded_group_posts(sender, instance, **kwargs):
+    # Каскад Django видит только базу группы, посты других шардов
+    # отвязываются здесь.
+    for alias in set(shards.aliases()) - {instance._state.db}:
+        Post.objects.using(alias).filter(group=instance).update(group=None)
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_author_posts(sender, instance, **kwargs):
+    for alias in set(shards.aliases()) - {instance._state.db}:
+        Post.objects.using(alias).filter(author=instance).delete()
+
+
+@receiver(post_delete, sender=Group)
+def drop_group_counter(sender, instance, **kwargs):
+    # Посты группы к этому моменту уже отвязаны (SET_NULL) без сигналов.
+    for alias in shards.each():
+        PostCounter.objects.using(alias).filter(
+            scope=PostCounter.GROUP, key=instance.pk
+        ).delete()
+
+
+@receiver(post_delete, sender=User)
+def drop_author_counter(sender, instance, **kwargs):
+    for alias in shards.each():
+        PostCounter.objects.using(alias).filter(
+            scope=PostCounter.AUTHOR, key=instance.pk
+        ).delete()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_cards(sender, instance, **kwargs):
+    bump_version('group', instance.pk)
+
+
+def _only_last_login(update_fields):
+    # Вход пользователя обновляет только last_login — страницы не меняются.
+    return bool(update_fields) and set(update_fields) <= {'last_login'}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_author_cards(sender, instance, update_fields=None, **kwargs):
+    if not _only_last_login(update_fields):
+        bump_version('author', instance.pk)
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, **kwargs):
+    instance._saved_slug = Group.objects.filter(pk=instance.pk).values_list(
+        'slug', flat=True
+    ).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feeds(sender, instance, **kwargs):
+    # Описание группы выводится и в карточках главной страницы.
+    slugs = {instance.slug, getattr(instance, '_saved_slug', None)} - {None}
+    bump_feeds(index_feed(), *map(group_feed, slugs))
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, update_fields=None, **kwargs):
+    if not _only_last_login(update_fields):
+        instance._saved_username = User.objects.filter(
+            pk=instance.pk
+        ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_author_feeds(sender, instance, created=False,
+                            update_fields=None, **kwargs):
+    if created or _only_last_login(update_fields):
+        return
+    usernames = {instance.username, getattr(instance, '_saved_username', None)}
+    # Посты автора могут лежать в шардах, а группы — в основной базе:
+    # id групп собираются по каждому шарду, без JOIN.
+    group_ids = set()
+    for alias in shards.each():
+        group_ids.update(Post.objects.using(alias).filter(
+            author_id=instance.pk, group__isnull=False,
+        ).values_list('group_id', flat=True).distinct())
+    slugs = Group.objects.filter(pk__in=group_ids).values_list(
+        'slug', flat=True
+    ) if group_ids else ()
+    bump_feeds(
+        index_feed(),
+        *map(profile_feed, usernames - {None}),
+        *map(group_feed, slugs),
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_group(sender, instance, **kwargs):
+    lookups.groups.delete(
+        instance.slug, getattr(instance, '_saved_slug', None)
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_author(sender, instance, update_fields=None, **kwargs):
+    if not _only_last_login(update_fields):
+        lookups.authors.delete(
+            instance.username, getattr(instance, '_saved_username', None)
+        )
+
+
+@receiver(post_migrate)
+def prepare_post_shard(sender, using, **kwargs):
+    if sender.name == 'posts':
+        shards.prepare_sequence(using)
+
+
+# Должен оставаться последним обработчиком post_save у Post: остальные
+# читают сохранённые в from_db автора и группу поста.
+@receiver(post_save, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    instance.remember_state()
@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.query_budget import assert_query_budget
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(25):
+            Post.objects.create(
+                author=cls.user,
+                text=f'Тестовый пост {i}',
+                group=cls.group if i % 2 else None,
+            )
+        cls.ordered = list(Post.objects.order_by(
+            '-pub_date', '-pk'
+        ).values_list('pk', flat=True))
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_posts_walk_by_cursor(self):
+        url = reverse('posts:api_posts') + '?limit=10&fields=id'
+        seen = []
+        while url:
+            with assert_query_budget(1):
+                data = self.client.get(url).json()
+            seen.extend(row['id'] for row in data['results'])
+            url = data['next']
+        self.assertEqual(seen, self.ordered)
+        back = self.client.get(data['previous']).json()
+        self.assertEqual(
+            [row['id'] for row in back['results']], self.ordered[10:20]
+        )
+
+    def test_fields_limit_selected_columns(self):
+        with assert_query_budget(1) as recorder:
+            data = self.client.get(
+                reverse('posts:api_posts'),
+                {'fields': 'id,author', 'group': 'test-slug'},
+            ).json()
+        self.assertNotIn('"text"', recorder.queries[0])
+        self.assertEqual(len(data['results']), 12)
+        self.assertEqual(data['results'][0].keys(), {'id', 'author'})
+        self.assertEqual(data['results'][0]['author'], 'auth')
+
+    def test_bad_parameters(self):
+        for params in ({'fields': 'password'}, {'after': 'xxx'},
+                       {'limit': 'many'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('posts:api_posts'), params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_groups_and_profile(self):
+        data = self.client.get(reverse('posts:api_groups')).json()
+        self.assertEqual(data['results'], [{
+            'id': self.group.pk,
+            'title': 'Тестовая группа',
+            'slug': 'test-slug',
+            'description': 'Тестовое описание',
+            'posts_count': 12,
+        }])
+        self.assertIsNone(data['next'])
+        data = self.client.get(
+            reverse('posts:api_profile', args=['auth']),
+            {'fields': 'first_name,posts_count'},
+        ).json()
+        self.assertEqual(data, {'first_name': 'Лев', 'posts_count': 25})
+        response = self.client.get(
+            reverse('posts:api_profile', args=['nobody'])
+        )
+        self.assertEqual(response.status_code, 404)
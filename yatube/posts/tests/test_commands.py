@@ -0,0 +1,286 @@
+import csv
+import gzip
+import io
+import json
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.templatetags.static import static
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Job
+from core.static import IMMUTABLE, gzip_compress
+from posts import timelines
+from posts.jobs import POSTS_IMPORTED
+from posts.models import Group, Post, PostCounter
+from posts.page_cache import feed_version, group_feed, profile_feed
+from posts.search import search
+
+User = get_user_model()
+
+
+class ImportPostsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def run_import(self, content, suffix):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix=suffix, encoding='utf-8'
+        ) as source:
+            source.write(content)
+            source.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command(
+                'import_posts', source.name, batch_size=2, chunk_size=3,
+                stdout=out, stderr=err,
+            )
+        return err.getvalue()
+
+    def test_jsonl(self):
+        lines = [
+            {'text': 'Импорт первый', 'author': 'auth', 'group': 'test-slug',
+             'pub_date': '2020-01-02T03:04:05'},
+            {'text': 'Импорт второй', 'author': 'auth'},
+            {'text': 'Чужой', 'author': 'nobody'},
+            {'text': 'Без группы', 'author': 'auth', 'group': 'nope'},
+        ]
+        content = '\n'.join(
+            json.dumps(line, ensure_ascii=False) for line in lines
+        ) + '\nне json\n'
+        profile = feed_version(profile_feed('auth'))
+        group = feed_version(group_feed('test-slug'))
+        errors = self.run_import(content, '.jsonl')
+        self.assertEqual(errors.count('пропущена'), 3)
+        first = Post.objects.get(text='Импорт первый')
+        self.assertEqual(first.group, self.group)
+        self.assertEqual(first.pub_date.year, 2020)
+        self.assertEqual(
+            PostCounter.objects.get_value(PostCounter.AUTHOR, self.user.pk), 2
+        )
+        self.assertEqual(PostCounter.objects.rebuild(dry_run=True), (0, 0, 0))
+        self.assertEqual(len(search('импорт').results), 2)
+        self.assertGreater(feed_version(profile_feed('auth')), profile)
+        self.assertGreater(feed_version(group_feed('test-slug')), group)
+
+    def test_csv(self):
+        rows = ''.join(f'Пост {i},auth,test-slug\n' for i in range(7))
+        self.run_import('text,author,group\n' + rows, '.csv')
+        self.assertEqual(Post.objects.filter(group=self.group).count(), 7)
+        self.assertEqual(
+            PostCounter.objects.get_value(PostCounter.GROUP, self.group.pk), 7
+        )
+        self.assertEqual(len(search('пост').results), 7)
+
+    def test_failed_chunk_keeps_counters_of_committed_ones(self):
+        lines = [{'text': f'Пост {i}', 'author': 'auth'} for i in range(3)]
+        # Список вместо строки база не примет: вторая порция откатится.
+        lines.append({'text': ['не строка'], 'author': 'auth'})
+        content = '\n'.join(json.dumps(line) for line in lines)
+        with self.assertRaises(DatabaseError):
+            self.run_import(content, '.jsonl')
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual(
+            PostCounter.objects.get_value(PostCounter.AUTHOR, self.user.pk), 3
+        )
+        self.assertEqual(PostCounter.objects.rebuild(dry_run=True), (0, 0, 0))
+
+    @override_settings(JOBS_EAGER=False)
+    def test_chunk_enqueues_feed_reset(self):
+        rows = ''.join(f'Пост {i},auth,test-slug\n' for i in range(4))
+        self.run_import('text,author,group\n' + rows, '.csv')
+        payloads = [
+            json.loads(payload) for payload in Job.objects.filter(
+                name=POSTS_IMPORTED
+            ).order_by('pk').values_list('payload', flat=True)
+        ]
+        self.assertEqual(payloads, [
+            {'author_ids': [self.user.pk], 'group_ids': [self.group.pk]},
+        ] * 2)
+
+
+class ExportPostsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+        )
+        for i in range(5):
+            Post.objects.create(
+                author=cls.user, text=f'Пост, "{i}"', group=cls.group
+            )
+        Post.objects.create(author=cls.user, text='Без группы')
+
+    def test_command_jsonl(self):
+        out = io.StringIO()
+        call_command('export_posts', group='test-slug', stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [row['id'] for row in rows],
+            list(Post.objects.filter(group=self.group).order_by(
+                '-pub_date', '-pk'
+            ).values_list('pk', flat=True)),
+        )
+        self.assertEqual(rows[0]['author'], 'auth')
+
+    def test_endpoint_streams_csv_for_staff_only(self):
+        url = reverse('posts:export')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(url, {'author': 'auth', 'format': 'csv'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(
+            io.StringIO(b''.join(response.streaming_content).decode())
+        ))
+        self.assertEqual(len(rows), 6)
+        self.assertIn('Пост, "4"', [row['text'] for row in rows])
+
+
+class BenchmarkCommandsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_data_is_deterministic(self):
+        call_command(
+            'seed_data', users=5, groups=2, posts=30, stdout=io.StringIO()
+        )
+        first = list(Post.objects.order_by('pk').values_list(
+            'text', 'pub_date', 'author__username', 'group__slug'
+        ))
+        self.assertEqual(len(first), 30)
+        self.assertEqual(PostCounter.objects.rebuild(dry_run=True), (0, 0, 0))
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        call_command(
+            'seed_data', users=5, groups=2, posts=30, stdout=io.StringIO()
+        )
+        self.assertEqual(first, list(Post.objects.order_by('pk').values_list(
+            'text', 'pub_date', 'author__username', 'group__slug'
+        )))
+
+    def test_bench_urls_reports_and_compares(self):
+        call_command(
+            'seed_data', users=3, groups=2, posts=20, stdout=io.StringIO()
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/bench.json'
+            call_command(
+                'bench_urls', repeat=1, output=output,
+                stdout=io.StringIO(), stderr=io.StringIO(),
+            )
+            with open(output, encoding='utf-8') as source:
+                report = json.load(source)
+            results = report['results']
+            self.assertEqual(results['posts:post_edit']['client'], 'author')
+            self.assertEqual(
+                {result['status'] for result in results.values()}, {200}
+            )
+            results['posts:main']['queries'] = -1
+            with open(output, 'w', encoding='utf-8') as target:
+                json.dump(report, target)
+            with self.assertRaisesMessage(CommandError, 'posts:main'):
+                call_command(
+                    'bench_urls', repeat=1, output=f'{directory}/new.json',
+                    baseline=output, stdout=io.StringIO(),
+                    stderr=io.StringIO(),
+                )
+
+
+class TimelineCommandsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+        )
+        for i in range(3):
+            Post.objects.create(
+                author=cls.user, text=f'Тестовый пост{i}', group=cls.group,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(TIMELINE_STORE='posts.timelines.DatabaseTimelineStore')
+    def test_backfill_and_check(self):
+        out = io.StringIO()
+        call_command('backfill_timelines', stdout=out)
+        self.assertIn('Построено лент: 2', out.getvalue())
+        call_command('check_timelines', stdout=io.StringIO())
+        # Вставка в обход сигналов.
+        Post.objects.insert_rows([
+            ('Импорт', timezone.now(), self.user.pk, self.group.pk)
+        ])
+        with self.assertRaises(CommandError):
+            call_command('check_timelines', stdout=io.StringIO())
+        out = io.StringIO()
+        call_command('check_timelines', fix=True, stdout=out)
+        self.assertIn('разошлось: 2', out.getvalue())
+        self.assertTrue(timelines.check())
+        self.assertTrue(timelines.check(self.group.pk))
+
+
+class StaticFilesTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            DEBUG=False,
+            STATIC_ROOT=directory.name,
+            STATICFILES_STORAGE=(
+                'core.static.CompressedManifestStaticFilesStorage'
+            ),
+            STATICFILES_FINDERS=(
+                'django.contrib.staticfiles.finders.FileSystemFinder',
+            ),
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cache.clear()
+
+    def test_pages_link_hashed_files_with_preload(self):
+        url = static('css/bootstrap.min.css')
+        self.assertRegex(url, r'^/static/css/bootstrap\.min\.\w{12}\.css$')
+        response = Client().get(reverse('posts:main'))
+        self.assertContains(response, f'rel="preload" href="{url}"')
+        self.assertContains(response, f'rel="stylesheet" href="{url}"')
+
+    def test_serves_negotiated_precompressed_copy(self):
+        url = static('css/bootstrap.min.css')
+        response = Client().get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        content = gzip.decompress(b''.join(response.streaming_content))
+        response = Client().get(url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), content)
+        response = Client().get('/static/css/bootstrap.min.css')
+        self.assertNotEqual(response['Cache-Control'], IMMUTABLE)
+        self.assertEqual(Client().get('/static/../manage.py').status_code, 404)
+
+    def test_gzip_copy_is_reproducible(self):
+        content = b'body { color: black; }' * 100
+        copy = gzip_compress(content)
+        self.assertEqual(copy, gzip_compress(content))
+        self.assertEqual(gzip.decompress(copy), content)
@@ -1,7 +1,9 @@
 from posts.forms import PostForm
 from ..models import Post
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 User = get_user_model()
@@ -54,3 +56,52 @@ class PostCreateFormTests(TestCase):
             ).exists()
         )
         self.assertEqual(posts_count, Post.objects.count())
+
+    def edit(self, **data):
+        return self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            data=data,
+        )
+
+    def post_updates(self, queries):
+        return [
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE "posts_post"')
+        ]
+
+    def test_edit_updates_only_changed_fields(self):
+        self.post.refresh_from_db()
+        with CaptureQueriesContext(connection) as queries:
+            self.edit(text='Исправленный текст', version=self.post.version)
+        updates = self.post_updates(queries)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"text"', updates[0])
+        self.assertNotIn('"group_id"', updates[0])
+        self.assertNotIn('"pub_date"', updates[0])
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, 'Исправленный текст')
+        self.assertEqual(post.version, self.post.version + 1)
+
+    def test_edit_without_changes_skips_write(self):
+        self.post.refresh_from_db()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.edit(
+                text=self.post.text, version=self.post.version
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.post_updates(queries), [])
+
+    def test_stale_edit_is_rejected(self):
+        self.post.refresh_from_db()
+        stale = self.post.version
+        self.edit(text='Первая правка', version=stale)
+        response = self.edit(text='Вторая правка', version=stale)
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(response.context['form'].non_field_errors())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, 'Первая правка')
+        self.assertEqual(response.context['version'], post.version)
+        self.edit(text='Вторая правка', version=post.version)
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).text, 'Вторая правка'
+        )
@@ -0,0 +1,192 @@
+import io
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core import jobs
+from core.checks import check_cache_add, check_jobs_cache
+from core.models import Job
+from posts import lookups, timelines
+from posts.models import Group, Post, PostCounter
+from posts.page_cache import feed_version, group_feed
+
+User = get_user_model()
+
+
+@override_settings(JOBS_EAGER=False)
+class PostJobsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа', slug='other-slug',
+        )
+
+    def setUp(self):
+        cache.clear()
+        lookups.clear()
+
+    def counters(self):
+        return (
+            PostCounter.objects.get_value(PostCounter.ALL),
+            PostCounter.objects.get_value(PostCounter.GROUP, self.group.pk),
+            PostCounter.objects.get_value(
+                PostCounter.GROUP, self.other_group.pk
+            ),
+        )
+
+    def test_write_only_enqueues_and_worker_applies(self):
+        before = self.counters()
+        timelines.read(self.group.pk)
+        version = feed_version(group_feed(self.group.slug))
+        post = Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group,
+        )
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertEqual(self.counters(), before)
+        self.assertEqual(timelines.read(self.group.pk).entries, ())
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(self.counters(), (1, 1, 0))
+        self.assertEqual(
+            timelines.read(self.group.pk).entries[0], (post.pub_date, post.pk)
+        )
+        self.assertNotEqual(
+            feed_version(group_feed(self.group.slug)), version
+        )
+
+    def test_deleted_author_counter_is_not_recreated(self):
+        author = User.objects.create_user(username='gone')
+        Post.objects.create(author=author, text='Пост', group=self.group)
+        jobs.run_pending()
+        group = self.counters()[1]
+        author_id = author.pk
+        author.delete()
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertFalse(PostCounter.objects.filter(
+            scope=PostCounter.AUTHOR, key=author_id
+        ).exists())
+        self.assertEqual(self.counters()[1], group - 1)
+        self.assertEqual(PostCounter.objects.rebuild(dry_run=True), (0, 0, 0))
+
+    def test_jobs_of_one_post_run_as_one_batch(self):
+        timelines.read(self.other_group.pk)
+        post = Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group,
+        )
+        post.group = self.other_group
+        post.save()
+        post.delete()
+        batches = jobs.claim('default', 10)
+        self.assertEqual([len(batch) for batch in batches], [3])
+        self.assertTrue(jobs.run(batches[0], 'default'))
+        self.assertEqual(self.counters(), (0, 0, 0))
+        self.assertTrue(timelines.check(self.other_group.pk))
+
+    def test_text_edits_are_enqueued_once(self):
+        post = Post.objects.create(author=self.user, text='Новый пост')
+        jobs.run_pending()
+        for text in ('Правка', 'Ещё правка'):
+            post.text = text
+            post.save()
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertEqual(jobs.run_pending(), 1)
+
+    def test_save_without_shown_changes_enqueues_nothing(self):
+        post = Post.objects.create(author=self.user, text='Новый пост')
+        jobs.run_pending()
+        post.save()
+        self.assertEqual(post.save_changes(), [])
+        self.assertFalse(Job.objects.exists())
+        post.group = self.group
+        self.assertEqual(post.save_changes(), ['group_id'])
+        self.assertEqual(
+            json.loads(Job.objects.get().payload)['old_group_id'], None
+        )
+
+    def test_edit_during_run_is_enqueued_again(self):
+        post = Post.objects.create(author=self.user, text='Новый пост')
+        jobs.run_pending()
+        post.text = 'Правка'
+        post.save()
+        batches = jobs.claim('default', 10)
+        post.text = 'Правка во время выполнения'
+        post.save()
+        self.assertEqual(Job.objects.count(), 2)
+        self.assertTrue(jobs.run(batches[0], 'default'))
+        self.assertEqual(jobs.run_pending(), 1)
+
+    @override_settings(JOBS_MAX_ATTEMPTS=2)
+    def test_failed_batch_is_retried_then_parked(self):
+        jobs.enqueue('posts.no_such_job', {}, key='broken')
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending(), 0)
+        job = Job.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertFalse(job.failed)
+        self.assertGreater(job.run_after, timezone.now())
+        Job.objects.update(run_after=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertTrue(job.failed)
+        self.assertIsNone(job.key)
+        self.assertIn('KeyError', job.error)
+        self.assertTrue(jobs.enqueue('posts.no_such_job', {}, key='broken'))
+
+    def test_stats_and_worker_command(self):
+        Post.objects.create(author=self.user, text='Новый пост')
+        Job.objects.update(created=timezone.now() - timedelta(seconds=30))
+        stats = jobs.stats()
+        self.assertEqual(stats['depth'], 1)
+        self.assertGreaterEqual(stats['lag'], 30)
+        out = io.StringIO()
+        call_command('run_jobs', stats=True, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['depth'], 1)
+
+    def test_queue_requires_shared_cache(self):
+        self.assertEqual(
+            [error.id for error in check_jobs_cache(None)], ['core.E001']
+        )
+        with override_settings(JOBS_EAGER=True):
+            self.assertEqual(check_jobs_cache(None), [])
+        shared = {'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/yatube-test-cache',
+        }}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_jobs_cache(None), [])
+            self.assertEqual(
+                [warning.id for warning in check_cache_add(None)],
+                ['core.W002'],
+            )
+        self.assertEqual(check_cache_add(None), [])
+
+
+@override_settings(JOBS_EAGER=False)
+class WorkerCommandTests(TransactionTestCase):
+    # Потоки исполнителя ходят в базу своими соединениями и видят только
+    # закоммиченное, поэтому здесь без транзакции теста. Поток один:
+    # тестовая база в памяти с общим кэшем на параллельную запись
+    # отвечает «table is locked», не дожидаясь busy_timeout.
+
+    def test_worker_runs_queue_in_threads(self):
+        cache.clear()
+        user = User.objects.create_user(username='auth')
+        for i in range(3):
+            Post.objects.create(author=user, text=f'Тестовый пост{i}')
+        self.assertEqual(jobs.stats()['depth'], 3)
+        out = io.StringIO()
+        call_command('run_jobs', once=True, threads=1, stdout=out)
+        self.assertIn('выполнено 3', out.getvalue())
+        self.assertEqual(jobs.stats()['depth'], 0)
+        self.assertEqual(PostCounter.objects.get_value(PostCounter.ALL), 3)
@@ -1,7 +1,14 @@
+import sqlite3
+import tempfile
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from core.sqlite import apply_pragmas, copy_database
+from posts import shards
 
-from ..models import Group, Post
+from ..models import Group, Post, PostCounter
 
 User = get_user_model()
 
@@ -57,3 +64,170 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+
+class PostCounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def assertCounters(self, author, group, other_group):
+        values = {
+            (PostCounter.AUTHOR, self.user.pk): author,
+            (PostCounter.GROUP, self.group.pk): group,
+            (PostCounter.GROUP, self.other_group.pk): other_group,
+        }
+        for (scope, key), expected in values.items():
+            with self.subTest(scope=scope, key=key):
+                self.assertEqual(
+                    PostCounter.objects.get_value(scope, key), expected
+                )
+
+    def test_counters_follow_post_writes(self):
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group
+        )
+        Post.objects.create(author=self.user, text='Пост без группы')
+        self.assertCounters(author=2, group=1, other_group=0)
+        post = Post.objects.get(pk=post.pk)
+        post.group = self.other_group
+        post.save()
+        self.assertCounters(author=2, group=0, other_group=1)
+        post.delete()
+        self.assertCounters(author=1, group=0, other_group=0)
+
+    def test_group_delete_drops_counter(self):
+        Post.objects.create(author=self.user, text='Пост', group=self.group)
+        Group.objects.get(pk=self.group.pk).delete()
+        self.assertFalse(PostCounter.objects.filter(
+            scope=PostCounter.GROUP, key=self.group.pk
+        ).exists())
+
+    def test_rebuild_repairs_drift(self):
+        Post.objects.create(author=self.user, text='Пост', group=self.group)
+        PostCounter.objects.filter(scope=PostCounter.AUTHOR).update(value=42)
+        PostCounter.objects.create(scope=PostCounter.GROUP, key=999, value=3)
+        self.assertEqual(PostCounter.objects.rebuild(), (0, 1, 1))
+        self.assertCounters(author=1, group=1, other_group=0)
+        self.assertEqual(PostCounter.objects.rebuild(), (0, 0, 0))
+
+
+class PostQuerySetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(5):
+            Post.objects.create(
+                author=User.objects.create_user(username=f'author{i}'),
+                text=f'Тестовый пост{i}',
+                group=group,
+            )
+
+    def test_feed_renders_in_one_query(self):
+        """Всё, что читают шаблоны карточек, приходит одним запросом."""
+        with self.assertNumQueries(1):
+            for post in Post.objects.for_feed():
+                post.text, post.pub_date, post.author.get_full_name()
+                str(post.author), post.group.slug, post.group.description
+
+
+class ShardsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.authors = [
+            User.objects.create_user(username=f'author{i}') for i in range(2)
+        ]
+        for i in range(6):
+            Post.objects.create(
+                author=cls.authors[i % 2], text=f'Тестовый пост{i}'
+            )
+
+    @override_settings(POST_SHARDS=('default', 'other'))
+    def test_shard_by_author_and_id(self):
+        self.assertEqual(shards.for_author(4), 'default')
+        self.assertEqual(shards.for_author(5), 'other')
+        self.assertEqual(shards.for_pk(7), 'default')
+        self.assertEqual(
+            shards.for_pk((1 << shards.SHARD_ID_BITS) + 7), 'other'
+        )
+        self.assertIsNone(shards.for_pk(2 << shards.SHARD_ID_BITS))
+        router = shards.ShardRouter()
+        post = Post(author_id=5, text='Новый пост')
+        self.assertEqual(router.db_for_write(Post, instance=post), 'other')
+        saved = Post.objects.first()
+        saved.author_id = 5
+        self.assertEqual(router.db_for_write(Post, instance=saved), 'default')
+        self.assertIsNone(router.db_for_write(Group))
+
+    def test_unsharded(self):
+        self.assertIsNone(shards.for_author(1))
+        queryset = Post.objects.all()
+        self.assertIs(shards.across(queryset), queryset)
+
+    def test_merge_matches_single_query(self):
+        """Слияние запросов по авторам совпадает с одним общим запросом."""
+        ordered = list(Post.objects.order_by('-pub_date', '-pk'))
+        merged = shards.ShardedQuerySet(
+            Post.objects.filter(author=author).order_by('-pub_date', '-pk')
+            for author in self.authors
+        )
+        self.assertEqual(list(merged), ordered)
+        self.assertEqual(merged[2:5], ordered[2:5])
+        self.assertEqual(merged[0], ordered[0])
+        self.assertEqual(merged.count(), len(ordered))
+        self.assertEqual(
+            list(merged.order_by('pub_date', 'pk')), ordered[::-1]
+        )
+        self.assertEqual(
+            list(merged.filter(pk__lt=ordered[1].pk)), ordered[2:]
+        )
+
+
+class SqlitePragmasTest(TestCase):
+
+    def test_new_connections_get_configured_pragmas(self):
+        cursor = connection.connection.execute('PRAGMA busy_timeout')
+        self.assertEqual(cursor.fetchone()[0], 5000)
+        with tempfile.NamedTemporaryFile(suffix='.sqlite3') as database:
+            raw = sqlite3.connect(database.name)
+            self.addCleanup(raw.close)
+            apply_pragmas(raw, {'journal_mode': 'wal', 'synchronous': 1})
+            self.assertEqual(
+                raw.execute('PRAGMA journal_mode').fetchone()[0], 'wal'
+            )
+            self.assertEqual(
+                raw.execute('PRAGMA synchronous').fetchone()[0], 1
+            )
+            with self.assertRaises(ValueError):
+                apply_pragmas(raw, {'journal_mode': 'wal; DROP TABLE x'})
+
+    def test_copy_database(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source, target = f'{directory}/db.sqlite3', f'{directory}/copy'
+            with sqlite3.connect(source) as raw:
+                raw.execute('CREATE TABLE t (value INTEGER)')
+                raw.execute('INSERT INTO t VALUES (1)')
+            raw.close()
+            copy_database(source, target)
+            copy = sqlite3.connect(target)
+            self.addCleanup(copy.close)
+            self.assertEqual(
+                copy.execute('SELECT value FROM t').fetchall(), [(1,)]
+            )
@@ -0,0 +1,274 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.query_budget import assert_query_budget
+from posts import lookups, timelines
+from posts.counts import cached_count
+from posts.models import Group, Post
+from posts.paginator import (KeysetPaginator, TimelinePaginator,
+                             decode_cursor, encode_cursor)
+
+User = get_user_model()
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(25):
+            Post.objects.create(
+                author=cls.user,
+                text=f'Тестовый пост{i}',
+                group=cls.group,
+            )
+        cls.ordered = list(Post.objects.order_by('-pub_date', '-pk'))
+
+    def setUp(self):
+        cache.clear()
+        lookups.clear()
+        self.guest_client = Client()
+        self.addresses = (
+            reverse('posts:main'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+
+    def test_cursor_roundtrip(self):
+        post = self.ordered[0]
+        self.assertEqual(
+            decode_cursor(encode_cursor(post)), (post.pub_date, post.pk)
+        )
+        self.assertIsNone(decode_cursor('не-курсор'))
+
+    def test_walk_forward_and_back_by_cursor(self):
+        """Переходы по курсорам обходят ленту без пропусков и повторов."""
+        for address in self.addresses:
+            with self.subTest(address=address):
+                page = self.guest_client.get(address).context['page_obj']
+                seen = list(page)
+                while page.has_next():
+                    page = self.guest_client.get(
+                        address, {'after': page.next_cursor}
+                    ).context['page_obj']
+                    seen.extend(page)
+                self.assertEqual(seen, self.ordered)
+                back = self.guest_client.get(
+                    address, {'before': page.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(list(back), self.ordered[10:20])
+
+    def test_last_page(self):
+        page = self.guest_client.get(
+            self.addresses[0], {'page': 'last'}
+        ).context['page_obj']
+        self.assertEqual(list(page), self.ordered[-10:])
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        page = self.guest_client.get(
+            self.addresses[0], {'after': '%%%'}
+        ).context['page_obj']
+        self.assertEqual(list(page), self.ordered[:10])
+
+    def test_page_window(self):
+        paginator = KeysetPaginator(Post.objects.all(), 1, count=lambda: 100)
+        self.assertEqual(
+            list(paginator.page_window(50)), [None, 48, 49, 50, 51, 52, None],
+        )
+        self.assertEqual(
+            list(paginator.page_window(3)), [1, 2, 3, 4, 5, None]
+        )
+        self.assertEqual(
+            list(paginator.page_window(100)), [None, 98, 99, 100]
+        )
+        paginator = KeysetPaginator(Post.objects.all(), 10, count=lambda: 25)
+        self.assertEqual(list(paginator.page_window(2)), [1, 2, 3])
+
+    def test_last_page_link_is_not_numbered(self):
+        paginator = KeysetPaginator(
+            Post.objects.all(), 1, count=lambda: len(self.ordered)
+        )
+        page = paginator.page(2)
+        self.assertEqual(page.window, [1, 2, 3, 4, None])
+        html = render_to_string('includes/paginator.html', {'page_obj': page})
+        self.assertIn('?page=last', html)
+        self.assertNotIn(f'?page={len(self.ordered)}"', html)
+
+    def test_numbered_pages_use_counter(self):
+        with assert_query_budget() as recorder:
+            response = self.guest_client.get(
+                self.addresses[1], {'page': 2}
+            )
+        self.assertFalse(any('COUNT(' in sql for sql in recorder.queries))
+        self.assertEqual(
+            response.context['page_obj'].window, [1, 2, 3]
+        )
+        self.assertContains(response, '?page=3')
+
+    def test_cached_count_serves_stale_value_and_refreshes(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(cached_count('test', compute), 1)
+        self.assertEqual(cached_count('test', compute), 1)
+        self.assertEqual(len(calls), 1)
+        with override_settings(COUNT_CACHE_TTL=-1):
+            cached_count('other', compute)
+            self.assertEqual(cached_count('other', compute), 3)
+
+    def test_stale_count_does_not_truncate_pages(self):
+        cached_count('index', lambda: 1)
+        with assert_query_budget() as recorder:
+            page = self.guest_client.get(
+                self.addresses[0], {'page': 2}
+            ).context['page_obj']
+        self.assertFalse(any('COUNT(' in sql for sql in recorder.queries))
+        self.assertFalse(
+            any('posts_postcounter' in sql for sql in recorder.queries)
+        )
+        self.assertEqual(list(page), self.ordered[10:20])
+        self.assertEqual(page.window, [1, 2, 3])
+
+
+STORES = (
+    'posts.timelines.CacheTimelineStore',
+    'posts.timelines.DatabaseTimelineStore',
+)
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа', slug='other-slug',
+        )
+        for i in range(15):
+            Post.objects.create(
+                author=cls.user, text=f'Тестовый пост{i}', group=cls.group,
+            )
+
+    def setUp(self):
+        cache.clear()
+        lookups.clear()
+
+    def entries(self, posts):
+        return tuple((post.pub_date, post.pk) for post in posts)
+
+    def newest(self, queryset):
+        return list(queryset.order_by('-pub_date', '-pk'))
+
+    def test_post_saved_during_rebuild_is_not_lost(self):
+        store = timelines.CacheTimelineStore()
+        feed = timelines.feed_name(self.group.pk)
+        post = Post(
+            pk=1000, pub_date=timezone.now(), group_id=self.group.pk,
+        )
+        writer = threading.Thread(
+            target=timelines.post_saved, args=(post, True)
+        )
+
+        def build():
+            snapshot = timelines.build(self.group.pk)
+            # Запись ждёт блокировку, пока лента не сохранена.
+            writer.start()
+            writer.join(0.1)
+            self.assertTrue(writer.is_alive())
+            return snapshot
+
+        store.fill(feed, build)
+        writer.join()
+        self.assertEqual(store.get(feed).entries[0], (post.pub_date, post.pk))
+
+    def test_writes_update_timelines(self):
+        for store in STORES:
+            with self.subTest(store=store), override_settings(
+                TIMELINE_STORE=store, TIMELINE_SIZE=10,
+            ):
+                timelines.forget([self.group.pk, self.other_group.pk])
+                index = timelines.read()
+                self.assertEqual(
+                    index.entries,
+                    self.entries(self.newest(Post.objects.all())[:10]),
+                )
+                self.assertFalse(index.complete)
+                self.assertTrue(timelines.read(self.other_group.pk).complete)
+                post = Post.objects.create(
+                    author=self.user, text='Новый пост', group=self.group,
+                )
+                self.assertEqual(timelines.read().entries[0][1], post.pk)
+                self.assertEqual(
+                    timelines.read(self.group.pk).entries[0][1], post.pk
+                )
+                post.group = self.other_group
+                post.save()
+                self.assertNotIn(post.pk, [
+                    pk for _, pk in timelines.read(self.group.pk).entries
+                ])
+                self.assertEqual(
+                    timelines.read(self.other_group.pk).entries[0][1],
+                    post.pk,
+                )
+                post.delete()
+                for group_id in (None, self.group.pk, self.other_group.pk):
+                    self.assertTrue(timelines.check(group_id))
+                self.assertEqual(len(timelines.read().entries), 9)
+
+    @override_settings(TIMELINE_SIZE=12)
+    def test_pages_match_query_inside_and_beyond_timeline(self):
+        address = reverse('posts:group_posts', args=[self.group.slug])
+        ordered = self.newest(self.group.posts.all())
+        pages = [
+            self.client.get(address, {'page': number}).context['page_obj']
+            for number in (1, 2)
+        ]
+        self.assertEqual([*pages[0], *pages[1]], ordered)
+        after = self.client.get(
+            address, {'after': pages[0].next_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(after), ordered[10:])
+        before = self.client.get(
+            address, {'before': after.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(before), ordered[:10])
+
+    def test_page_inside_timeline_is_one_query(self):
+        ordered = self.newest(Post.objects.all())
+        paginator = TimelinePaginator(Post.objects.all(), 5, timelines.read())
+        with self.assertNumQueries(1):
+            page = paginator.first_page()
+        self.assertEqual(list(page), ordered[:5])
+        with self.assertNumQueries(1):
+            page = paginator.page_after(page.next_cursor)
+        self.assertEqual(list(page), ordered[5:10])
+
+    def test_stale_timeline_falls_back_to_query(self):
+        timeline = timelines.read()
+        # Удаление в обход сигналов: в списке остаётся чужой id.
+        Post.objects.filter(pk=timeline.entries[0][1])._raw_delete('default')
+        paginator = TimelinePaginator(Post.objects.all(), 5, timeline)
+        self.assertEqual(
+            list(paginator.first_page()),
+            self.newest(Post.objects.all())[:5],
+        )
+        self.assertFalse(timelines.check())
@@ -0,0 +1,266 @@
+import io
+import json
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import router
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from core.checks import check_post_shards
+from core.routers import STICKY_COOKIE, ReplicaMiddleware
+from posts import lookups, shards
+from posts.models import Group, Post, PostCounter
+from posts.page_cache import feed_version, group_feed
+
+User = get_user_model()
+
+
+@override_settings(POST_SHARDS=('default', 'posts_1'))
+class ShardedSiteTests(TestCase):
+    databases = {'default', 'posts_1'}
+
+    def _should_check_constraints(self, connection):
+        # Авторы и группы постов шарда лежат в основной базе, поэтому
+        # внешние ключи в шарде отключены и проверять их нечего.
+        return (
+            connection.alias != 'posts_1'
+            and super()._should_check_constraints(connection)
+        )
+
+    @classmethod
+    def setUpTestData(cls):
+        shards.prepare_sequence('posts_1')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', first_name='Автор', last_name=f'№{i}',
+            )
+            for i in range(2)
+        ]
+        cls.posts = [
+            Post.objects.create(
+                author=cls.authors[i % 2], text=f'Тестовый пост{i}',
+                group=cls.group,
+            )
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        lookups.clear()
+        self.client = Client()
+
+    def test_posts_live_in_author_shards(self):
+        aliases = {post._state.db for post in self.posts}
+        self.assertEqual(aliases, {'default', 'posts_1'})
+        self.assertFalse(
+            User.objects.using('posts_1').filter(
+                pk__in=[author.pk for author in self.authors]
+            ).exists()
+        )
+
+    def test_feeds_show_authors_from_every_shard(self):
+        addresses = (
+            reverse('posts:main'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                page = response.context['page_obj']
+                self.assertEqual(len(page), len(self.posts))
+                for post in page:
+                    self.assertEqual(post.author.pk, post.author_id)
+                for author in self.authors:
+                    self.assertContains(response, author.get_full_name())
+
+    def test_post_detail_from_second_shard(self):
+        for post in self.posts:
+            with self.subTest(shard=post._state.db):
+                response = self.client.get(
+                    reverse('posts:post_detail', kwargs={'post_id': post.pk})
+                )
+                self.assertEqual(response.context['post'].author, post.author)
+                self.assertContains(response, post.text)
+
+    def test_syndication_feeds(self):
+        addresses = {
+            reverse('posts:index_rss'): self.authors,
+            reverse('posts:group_atom', kwargs={
+                'slug': self.group.slug,
+            }): self.authors,
+            reverse('posts:profile_json', kwargs={
+                'username': self.authors[0].username,
+            }): self.authors[:1],
+        }
+        for address, authors in addresses.items():
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertEqual(response.status_code, 200)
+                for author in authors:
+                    self.assertContains(response, author.get_full_name())
+
+    def test_api_reads_every_shard(self):
+        response = self.client.get(
+            reverse('posts:api_posts'), {'limit': 3}
+        )
+        data = json.loads(response.content)
+        expected = sorted(
+            self.posts, key=lambda post: (post.pub_date, post.pk),
+            reverse=True,
+        )
+        self.assertEqual(
+            [row['id'] for row in data['results']],
+            [post.pk for post in expected[:3]],
+        )
+        self.assertEqual(
+            {row['author'] for row in data['results']},
+            {author.username for author in self.authors},
+        )
+        self.assertEqual(data['results'][0]['group'], self.group.slug)
+        rest = json.loads(self.client.get(data['next']).content)
+        self.assertEqual(
+            [row['id'] for row in rest['results']], [expected[3].pk]
+        )
+        for author in self.authors:
+            response = self.client.get(
+                reverse('posts:api_posts'),
+                {'author': author.username, 'group': self.group.slug},
+            )
+            self.assertEqual(
+                {row['author'] for row in json.loads(response.content)[
+                    'results'
+                ]},
+                {author.username},
+            )
+
+    def test_rename_bumps_group_feeds_of_sharded_posts(self):
+        author = User.objects.get(
+            pk=next(author.pk for author in self.authors
+                    if shards.for_author(author.pk) == 'posts_1')
+        )
+        version = feed_version(group_feed(self.group.slug))
+        author.username = 'renamed'
+        author.save()
+        self.assertNotEqual(
+            feed_version(group_feed(self.group.slug)), version
+        )
+
+    def test_import_counts_posts_in_their_shards(self):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.jsonl', encoding='utf-8'
+        ) as source:
+            for i in range(5):
+                source.write(json.dumps({
+                    'text': f'Импорт {i}', 'group': self.group.slug,
+                    'author': self.authors[i % 2].username,
+                }) + '\n')
+            source.flush()
+            call_command(
+                'import_posts', source.name, chunk_size=2,
+                stdout=io.StringIO(),
+            )
+        self.assertEqual(PostCounter.objects.rebuild(dry_run=True), (0, 0, 0))
+        self.assertEqual(
+            PostCounter.objects.get_value(PostCounter.GROUP, self.group.pk), 9
+        )
+
+    def test_export_reads_every_shard(self):
+        def export(**options):
+            out = io.StringIO()
+            call_command('export_posts', stdout=out, **options)
+            return [json.loads(line) for line in out.getvalue().splitlines()]
+
+        expected = sorted(
+            self.posts, key=lambda post: (post.pub_date, post.pk),
+            reverse=True,
+        )
+        rows = export()
+        self.assertEqual(
+            [row['id'] for row in rows], [post.pk for post in expected]
+        )
+        self.assertEqual(
+            {row['author'] for row in rows},
+            {author.username for author in self.authors},
+        )
+        self.assertEqual({row['group'] for row in rows}, {self.group.slug})
+        for author in self.authors:
+            with self.subTest(shard=shards.for_author(author.pk)):
+                rows = export(author=author.username, group=self.group.slug)
+                self.assertEqual(len(rows), 2)
+                self.assertEqual(
+                    {row['author'] for row in rows}, {author.username}
+                )
+        self.assertEqual(export(author='nobody'), [])
+
+    def test_search_reads_every_shard(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'тестовый'})
+        page = response.context['page']
+        self.assertEqual(
+            {result.post.pk for result in page.results},
+            {post.pk for post in self.posts},
+        )
+        for result in page.results:
+            self.assertEqual(result.post.author.pk, result.post.author_id)
+
+    def test_admin_warns_about_shards(self):
+        self.assertEqual(
+            [message.id for message in check_post_shards(None)],
+            ['core.W001'],
+        )
+
+
+@override_settings(DATABASE_REPLICAS=('replica',))
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def route(self, request, write=False, reads=1):
+        def view(request):
+            if write:
+                router.db_for_write(Post)
+            return HttpResponse(','.join(
+                router.db_for_read(Post) for _ in range(reads)
+            ))
+        return ReplicaMiddleware(view)(request)
+
+    def test_reads_go_to_replica_until_client_writes(self):
+        factory = RequestFactory()
+        self.assertEqual(router.db_for_read(Post), 'default')
+        self.assertEqual(self.route(factory.get('/')).content, b'replica')
+        self.assertEqual(self.route(factory.post('/')).content, b'default')
+        response = self.route(factory.post('/'), write=True)
+        self.assertEqual(response.content, b'default')
+        request = factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = response.cookies[STICKY_COOKIE].value
+        self.assertEqual(self.route(request).content, b'default')
+        request.COOKIES[STICKY_COOKIE] = '0'
+        self.assertEqual(self.route(request).content, b'replica')
+
+    def test_incidental_write_of_get_does_not_pin_client(self):
+        response = self.route(RequestFactory().get('/'), write=True)
+        self.assertEqual(response.content, b'default')
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=('replica', 'replica_2'))
+    def test_request_reads_one_replica(self):
+        for _ in range(10):
+            response = self.route(RequestFactory().get('/'), reads=20)
+            self.assertEqual(len(set(response.content.split(b','))), 1)
+
+    def test_new_post_pins_author_to_primary(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.post(
+            reverse('posts:post_create'), {'text': 'Новый пост'}
+        )
+        self.assertIn(STICKY_COOKIE, response.cookies)
@@ -0,0 +1,54 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts import lookups
+from posts.models import Post
+
+User = get_user_model()
+
+
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        lookups.clear()
+        self.address = reverse(
+            'posts:profile', kwargs={'username': self.user.username}
+        )
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1.0)
+    def test_phases_in_header_and_log(self):
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            response = self.client.get(self.address)
+        metrics = {
+            item.split(';')[0]: item
+            for item in response['Server-Timing'].split(', ')
+        }
+        self.assertEqual(
+            set(metrics), {'total', 'view', 'db', 'tpl', 'cp'}
+        )
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'posts:profile')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertIn(f'desc="{record["queries"]} queries"', metrics['db'])
+        for name in ('posts/profile.html', 'includes/paginator.html',
+                     'includes/header.html'):
+            self.assertEqual(record['templates'][name]['count'], 1)
+        self.assertIn(
+            'core.context_processors.year.year', record['processors']
+        )
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_timed(self):
+        response = self.client.get(self.address)
+        self.assertFalse(response.has_header('Server-Timing'))
@@ -1,8 +1,16 @@
+from django import forms
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from django import forms
-from posts.models import Post, Group
+
+from core.lru import MISSING, LRUCache
+from core.query_budget import QueryBudgetExceeded, assert_query_budget
+from posts import lookups, timelines
+from posts.models import Group, Post
+from posts.page_cache import bump_feeds, index_feed
 
 User = get_user_model()
 
@@ -164,3 +172,444 @@ class PaginatorViewsTest(TestCase):
                 response = self.guest_client.get(address + '?page=2')
                 context_page = response.context['page_obj']
                 self.assertEqual(len(context_page), 5)
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(15):
+            cls.post = Post.objects.create(
+                author=User.objects.create_user(username=f'author{i}'),
+                text=f'Тестовый пост{i}',
+                group=cls.group,
+            )
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_feeds_fit_budget(self):
+        """Ленты укладываются в бюджет при авторах у каждого поста."""
+        addresses = (
+            reverse('posts:main'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.post.author}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.authorized_client.get(address)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.wsgi_request.query_recorder.repeated(3), {}
+                )
+
+    def test_n_plus_one_detected(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_query_budget():
+                for post in Post.objects.all():
+                    post.author.username
+
+    def test_budget_exceeded(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with assert_query_budget(max_queries=1):
+                Post.objects.count()
+                Group.objects.count()
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        lookups.clear()
+        self.guest_client = Client()
+
+    def get_index(self):
+        return self.guest_client.get(reverse('posts:main')).content.decode()
+
+    def test_cached_card_is_reused(self):
+        self.get_index()
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигнала')
+        self.assertIn('Тестовый пост', self.get_index())
+
+    def test_post_group_and_author_changes_invalidate_card(self):
+        self.get_index()
+        changes = (
+            (self.post, 'text', 'Новый текст'),
+            (self.group, 'description', 'Новое описание'),
+            (self.user, 'first_name', 'Алексей'),
+        )
+        for instance, field, value in changes:
+            with self.subTest(field=field):
+                setattr(instance, field, value)
+                instance.save()
+                self.assertIn(value, self.get_index())
+
+
+class AnonymousPageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый пост',
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        lookups.clear()
+        self.guest_client = Client()
+        self.addresses = (
+            reverse('posts:main'),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+
+    def test_repeat_visit_gets_304_without_queries(self):
+        for address in self.addresses:
+            with self.subTest(address=address):
+                etag = self.guest_client.get(address)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(
+                        address, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+
+    def test_cached_page_served_without_queries(self):
+        first = self.guest_client.get(self.addresses[0])
+        with self.assertNumQueries(0):
+            second = self.guest_client.get(self.addresses[0])
+        self.assertEqual(first.content, second.content)
+
+    def test_new_post_invalidates_its_feeds(self):
+        etags = {
+            address: self.guest_client.get(address)['ETag']
+            for address in self.addresses
+        }
+        other = User.objects.create_user(username='other')
+        Post.objects.create(author=other, text='Чужой пост')
+        response = self.guest_client.get(
+            self.addresses[1], HTTP_IF_NONE_MATCH=etags[self.addresses[1]]
+        )
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(
+            author=self.user, text='Новый пост', group=self.group
+        )
+        for address, etag in etags.items():
+            with self.subTest(address=address):
+                response = self.guest_client.get(
+                    address, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Новый пост')
+
+    def test_two_bumps_in_one_second_change_last_modified(self):
+        address = self.addresses[0]
+        last_modified = self.guest_client.get(address)['Last-Modified']
+        bump_feeds(index_feed())
+        response = self.guest_client.get(
+            address, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 200)
+        bump_feeds(index_feed())
+        response = self.guest_client.get(
+            address, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_authorized_user_bypasses_cache(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(self.addresses[0])
+        self.assertFalse(response.has_header('ETag'))
+
+
+class LookupCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+        )
+        Post.objects.create(author=cls.user, text='Пост', group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        lookups.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def queries_for(self, address):
+        with CaptureQueriesContext(connection) as context:
+            response = self.authorized_client.get(address)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_warm_lookup_skips_query(self):
+        # Готовая лента группы строится первым запросом: строим заранее.
+        timelines.read(self.group.pk)
+        for address in (
+            reverse('posts:group_posts', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.user.username]),
+        ):
+            with self.subTest(address=address):
+                cold = self.queries_for(address)
+                self.assertEqual(self.queries_for(address), cold - 1)
+        self.assertEqual(lookups.groups.stats()['hits'], 1)
+        self.assertEqual(lookups.authors.stats()['hits'], 1)
+
+    def test_rename_invalidates_cached_lookup(self):
+        old = reverse('posts:group_posts', args=['test-slug'])
+        self.authorized_client.get(old)
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'new-slug'
+        group.save()
+        self.assertEqual(self.authorized_client.get(old).status_code, 404)
+        self.assertEqual(self.authorized_client.get(
+            reverse('posts:group_posts', args=['new-slug'])
+        ).status_code, 200)
+        address = reverse('posts:profile', args=[self.user.username])
+        self.authorized_client.get(address)
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Имя'
+        user.save()
+        response = self.authorized_client.get(address)
+        self.assertEqual(response.context['author'].first_name, 'Имя')
+
+    def test_lru_is_bounded_and_expires(self):
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertIs(lru.get('b'), MISSING)
+        self.assertEqual((lru.get('a'), lru.get('c')), (1, 3))
+        lru.ttl = -1
+        lru.set('a', 1)
+        self.assertIs(lru.get('a'), MISSING)
+        self.assertEqual(
+            lru.stats(), {'hits': 3, 'misses': 2, 'size': 1, 'maxsize': 2}
+        )
+
+
+class SyndicationFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        for i in range(25):
+            Post.objects.create(
+                author=cls.user, text=f'Тестовый пост {i}', group=cls.group
+            )
+
+    def setUp(self):
+        cache.clear()
+        lookups.clear()
+        self.guest_client = Client()
+        self.addresses = {
+            kind: (
+                reverse(f'posts:index_{kind}'),
+                reverse(f'posts:group_{kind}', args=[self.group.slug]),
+                reverse(f'posts:profile_{kind}', args=[self.user.username]),
+            )
+            for kind in ('rss', 'atom', 'json')
+        }
+
+    def test_feeds_render_latest_posts(self):
+        content_types = {
+            'rss': 'application/rss+xml',
+            'atom': 'application/atom+xml',
+            'json': 'application/feed+json',
+        }
+        for kind, addresses in self.addresses.items():
+            for address in addresses:
+                with self.subTest(address=address):
+                    response = self.guest_client.get(address)
+                    self.assertTrue(
+                        response['Content-Type'].startswith(
+                            content_types[kind]
+                        )
+                    )
+                    self.assertContains(response, 'Тестовый пост 24')
+                    self.assertNotContains(response, 'Тестовый пост 4<')
+        items = self.guest_client.get(
+            self.addresses['json'][1]
+        ).json()['items']
+        self.assertEqual(len(items), 20)
+        self.assertEqual(items[0]['tags'], ['Тестовая группа'])
+
+    def test_polling_is_conditional_and_invalidated_by_writes(self):
+        address = self.addresses['atom'][2]
+        response = self.guest_client.get(address)
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(
+                address, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            response = self.guest_client.get(
+                address, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+            )
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.user, text='Новый пост')
+        response = self.guest_client.get(
+            address, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertContains(response, 'Новый пост')
+
+    def test_pages_link_their_feeds(self):
+        response = self.guest_client.get(
+            reverse('posts:group_posts', args=[self.group.slug])
+        )
+        self.assertContains(response, self.addresses['rss'][1])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.best = Post.objects.create(
+            author=cls.user, text='кошка кошка кошка'
+        )
+        for i in range(12):
+            Post.objects.create(
+                author=cls.user, text=f'пост {i} про кошку и <b>собаку</b>'
+            )
+        Post.objects.create(author=cls.user, text='совсем другой текст')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query, **params):
+        return self.guest_client.get(
+            reverse('posts:search'), {'q': query, **params}
+        ).context['page']
+
+    def test_ranked_results_with_cursor(self):
+        page = self.search('кошк')
+        self.assertEqual(page.results[0].post, self.best)
+        found = [result.post for result in page.results]
+        while page.has_next():
+            page = self.search('кошк', after=page.next_cursor)
+            found.extend(result.post for result in page.results)
+        self.assertEqual(len(found), 13)
+        self.assertEqual(len(set(found)), 13)
+
+    def test_snippet_is_escaped_and_highlighted(self):
+        snippet = self.search('собаку').results[0].snippet
+        self.assertIn('<mark>собаку</mark>', snippet)
+        self.assertIn('&lt;b&gt;', snippet)
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.get(pk=self.best.pk)
+        post.text = 'попугай'
+        post.save()
+        self.assertEqual(self.search('попугай').results[0].post, post)
+        post.delete()
+        self.assertEqual(self.search('попугай').results, [])
+
+    def test_fts_operators_are_not_interpreted(self):
+        self.assertEqual(self.search('NOT "*').results, [])
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        client = Client()
+        client.force_login(admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'другой'}
+        )
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class PostAdminChangelistTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug',
+        )
+        for i in range(150):
+            Post.objects.create(
+                author=cls.user, text=f'Пост {i}', group=cls.group
+            )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.url = reverse('admin:posts_post_changelist')
+
+    def test_count_comes_from_counter(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['cl'].result_count, 150)
+        self.assertEqual(len(response.context['cl'].result_list), 100)
+        self.assertContains(
+            response, f'<option selected value="{self.group.pk}">', 100
+        )
+
+    def test_walk_by_cursor(self):
+        response = self.client.get(self.url)
+        seen = list(response.context['cl'].result_list)
+        response = self.client.get(self.url + response.context[
+            'next_cursor_url'
+        ])
+        seen.extend(response.context['cl'].result_list)
+        self.assertNotIn('next_cursor_url', response.context)
+        self.assertEqual(
+            seen, list(Post.objects.order_by('-pub_date', '-pk'))
+        )
+
+    def test_date_hierarchy_filter(self):
+        post = Post.objects.first()
+        post.pub_date = post.pub_date.replace(year=2001, month=3)
+        post.save()
+        response = self.client.get(self.url, {'published': '2001'})
+        choices = [
+            choice['display']
+            for spec in response.context['cl'].filter_specs
+            for choice in spec.choices(response.context['cl'])
+        ]
+        self.assertIn('2001-03', choices)
+        response = self.client.get(self.url, {'published': '2001-03'})
+        self.assertEqual(list(response.context['cl'].result_list), [post])
@@ -0,0 +1,298 @@
+"""Готовые ленты главной и групп: id самых новых постов.
+
+Главная и лента группы на каждый запрос сортировали таблицу постов.
+Теперь для каждой ленты хранится список (pub_date, id) её
+``TIMELINE_SIZE`` самых новых постов, и страница ленты — это чтение
+списка и один запрос ``pk__in`` (``paginator.TimelinePaginator``).
+Список обновляется при записи: сигналы сохранения и удаления поста
+(``posts.signals``) вносят пост в ленты или убирают из них.
+
+Хранилище задаёт ``TIMELINE_STORE``: кэш Django (``CacheTimelineStore``)
+или таблицы в основной базе (``DatabaseTimelineStore``). Лента, которой
+в хранилище нет, строится при первом чтении.
+
+Список — всегда начало ленты, без пропусков; ``complete`` значит, что
+постов старше последнего в списке нет. Страницы глубже списка и
+страницы, посты которых разошлись со списком, читаются обычным
+запросом. Вставка в обход сигналов (import_posts, seed_posts) сбрасывает
+ленты через ``forget()``; расхождения находит check_timelines.
+"""
+import heapq
+import itertools
+import time
+from collections import namedtuple
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.module_loading import import_string
+
+from . import shards
+from .models import Post, Timeline, TimelineEntry
+
+DEFAULT_STORE = 'posts.timelines.CacheTimelineStore'
+DEFAULT_SIZE = 1000
+DEFAULT_CACHE_TIMEOUT = 60 * 10
+TIMELINE_KEY = 'timeline:{feed}'
+LOCK_KEY = 'timeline:lock:{feed}'
+LOCK_TIMEOUT = 5
+# Сколько секунд запись ждёт блокировку ленты в кэше.
+LOCK_WAIT = 1.0
+
+# entries — кортеж (pub_date, id) от новых постов к старым.
+Snapshot = namedtuple('Snapshot', 'entries complete')
+
+
+def size():
+    return getattr(settings, 'TIMELINE_SIZE', DEFAULT_SIZE)
+
+
+def feed_name(group_id=None):
+    """Имя ленты: главная или группа с этим id."""
+    if group_id is None:
+        return 'index'
+    return f'group:{group_id}'
+
+
+def newest(group_id=None, limit=None):
+    """(pub_date, id) limit самых новых постов ленты из всех шардов."""
+    posts = Post.objects.order_by('-pub_date', '-pk')
+    if group_id is not None:
+        posts = posts.filter(group_id=group_id)
+    rows = [
+        posts.using(alias).values_list('pub_date', 'pk')[:limit]
+        for alias in shards.each()
+    ]
+    return list(itertools.islice(heapq.merge(*rows, reverse=True), limit))
+
+
+def build(group_id=None):
+    """Лента, построенная запросом к постам."""
+    rows = newest(group_id, size() + 1)
+    return Snapshot(tuple(rows[:size()]), len(rows) <= size())
+
+
+def with_entry(snapshot, entry, limit):
+    """Лента с постом entry; пост старше неполного списка не вносится."""
+    entries = [item for item in snapshot.entries if item[1] != entry[1]]
+    if not snapshot.complete and (not entries or entry < entries[-1]):
+        # Между концом списка и постом могут быть посты не из списка.
+        return Snapshot(tuple(entries), snapshot.complete)
+    entries = sorted([*entries, entry], reverse=True)
+    return Snapshot(
+        tuple(entries[:limit]), snapshot.complete and len(entries) <= limit
+    )
+
+
+def without_entry(snapshot, pk):
+    return Snapshot(
+        tuple(item for item in snapshot.entries if item[1] != pk),
+        snapshot.complete,
+    )
+
+
+class CacheTimelineStore:
+    """Ленты в кэше Django: одно значение на ленту.
+
+    Запись читает и перезаписывает значение целиком под блокировкой
+    ``cache.add``; под ней же сохраняется лента, построенная при чтении.
+    Не дождавшись блокировки, запись удаляет ленту — она построится
+    заново при чтении. Лента живёт ``TIMELINE_CACHE_TIMEOUT``
+    секунд, так что и пропущенное обновление исправится само.
+    """
+
+    def _key(self, feed):
+        return TIMELINE_KEY.format(feed=feed)
+
+    def _timeout(self):
+        return getattr(
+            settings, 'TIMELINE_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT
+        )
+
+    def get(self, feed):
+        return cache.get(self._key(feed))
+
+    def set(self, feed, snapshot):
+        cache.set(self._key(feed), snapshot, self._timeout())
+
+    def delete(self, *feeds):
+        cache.delete_many([self._key(feed) for feed in feeds])
+
+    def _update(self, feed, change):
+        lock = LOCK_KEY.format(feed=feed)
+        deadline = time.monotonic() + LOCK_WAIT
+        while not cache.add(lock, True, LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                self.delete(feed)
+                return
+            time.sleep(0.01)
+        try:
+            snapshot = self.get(feed)
+            if snapshot is not None:
+                self.set(feed, change(snapshot))
+        finally:
+            cache.delete(lock)
+
+    def fill(self, feed, build):
+        """Строит ленту и сохраняет её под той же блокировкой, что запись.
+
+        Иначе пост, внесённый между запросом build() и cache.set, пропал
+        бы из ленты до её истечения: запись, не найдя ленту, её не
+        трогает. Пока блокировку держит запись, лента строится без
+        сохранения.
+        """
+        lock = LOCK_KEY.format(feed=feed)
+        if not cache.add(lock, True, LOCK_TIMEOUT):
+            return build()
+        try:
+            snapshot = build()
+            self.set(feed, snapshot)
+        finally:
+            cache.delete(lock)
+        return snapshot
+
+    def add(self, feed, entry, limit):
+        self._update(feed, lambda snapshot: with_entry(snapshot, entry, limit))
+
+    def remove(self, feed, pk):
+        self._update(feed, lambda snapshot: without_entry(snapshot, pk))
+
+
+class DatabaseTimelineStore:
+    """Ленты в таблицах Timeline и TimelineEntry основной базы.
+
+    Добавление поста — вставка строки и удаление вытесненных за
+    ``TIMELINE_SIZE``, без чтения всего списка.
+    """
+
+    def _db(self):
+        return router.db_for_write(TimelineEntry)
+
+    def get(self, feed):
+        complete = Timeline.objects.filter(feed=feed).values_list(
+            'complete', flat=True
+        ).first()
+        if complete is None:
+            return None
+        entries = TimelineEntry.objects.filter(feed=feed).order_by(
+            '-pub_date', '-post_id'
+        ).values_list('pub_date', 'post_id')
+        return Snapshot(tuple(entries), complete)
+
+    def set(self, feed, snapshot):
+        with transaction.atomic(using=self._db()):
+            TimelineEntry.objects.filter(feed=feed).delete()
+            TimelineEntry.objects.bulk_create([
+                TimelineEntry(feed=feed, pub_date=pub_date, post_id=pk)
+                for pub_date, pk in snapshot.entries
+            ], batch_size=500)
+            Timeline.objects.update_or_create(
+                feed=feed, defaults={'complete': snapshot.complete}
+            )
+
+    def delete(self, *feeds):
+        with transaction.atomic(using=self._db()):
+            TimelineEntry.objects.filter(feed__in=feeds).delete()
+            Timeline.objects.filter(feed__in=feeds).delete()
+
+    def fill(self, feed, build):
+        # Блокировки, как у CacheTimelineStore, здесь нет: пост, внесённый
+        # между build() и set, выпадет из ленты до check_timelines --fix
+        # или forget().
+        snapshot = build()
+        self.set(feed, snapshot)
+        return snapshot
+
+    def add(self, feed, entry, limit):
+        pub_date, pk = entry
+        entries = TimelineEntry.objects.filter(feed=feed)
+        with transaction.atomic(using=self._db()):
+            complete = Timeline.objects.select_for_update().filter(
+                feed=feed
+            ).values_list('complete', flat=True).first()
+            if complete is None:
+                return
+            if not complete:
+                oldest = entries.order_by('pub_date', 'post_id').values_list(
+                    'pub_date', 'post_id'
+                ).first()
+                if oldest is None or entry < oldest:
+                    return
+            _, created = TimelineEntry.objects.get_or_create(
+                feed=feed, post_id=pk, defaults={'pub_date': pub_date}
+            )
+            if not created:
+                return
+            overflow = list(entries.order_by(
+                '-pub_date', '-post_id'
+            ).values_list('pk', flat=True)[limit:])
+            if overflow:
+                entries.filter(pk__in=overflow).delete()
+                Timeline.objects.filter(feed=feed).update(complete=False)
+
+    def remove(self, feed, pk):
+        TimelineEntry.objects.filter(feed=feed, post_id=pk).delete()
+
+
+def get_store():
+    return import_string(getattr(settings, 'TIMELINE_STORE', DEFAULT_STORE))()
+
+
+def read(group_id=None):
+    """Лента из хранилища; если её там нет — строится и сохраняется."""
+    store = get_store()
+    feed = feed_name(group_id)
+    snapshot = store.get(feed)
+    if snapshot is None:
+        snapshot = store.fill(feed, partial(build, group_id))
+    return snapshot
+
+
+def post_saved(post, created, old_group_id=None):
+    """Вносит новый пост в ленты, при смене группы — переносит."""
+    store = get_store()
+    entry = (post.pub_date, post.pk)
+    if created:
+        store.add(feed_name(), entry, size())
+    elif old_group_id == post.group_id:
+        return
+    elif old_group_id:
+        store.remove(feed_name(old_group_id), post.pk)
+    if post.group_id:
+        store.add(feed_name(post.group_id), entry, size())
+
+
+def post_deleted(post, group_ids):
+    """Убирает пост из главной и лент групп group_ids."""
+    store = get_store()
+    for group_id in {None, *group_ids}:
+        store.remove(feed_name(group_id), post.pk)
+
+
+def forget(group_ids=()):
+    """Сбрасывает главную и ленты групп: они построятся при чтении."""
+    get_store().delete(
+        feed_name(), *(feed_name(group_id) for group_id in group_ids)
+    )
+
+
+def rebuild(group_id=None):
+    get_store().set(feed_name(group_id), build(group_id))
+
+
+def check(group_id=None):
+    """Проверяет ленту по постам.
+
+    Возвращает None, если ленты нет в хранилище, иначе True, если список
+    совпадает с началом ленты, а complete — с тем, есть ли посты старше.
+    """
+    snapshot = get_store().get(feed_name(group_id))
+    if snapshot is None:
+        return None
+    rows = newest(group_id, len(snapshot.entries) + 1)
+    length = len(snapshot.entries)
+    return (
+        tuple(rows[:length]) == snapshot.entries
+        and snapshot.complete == (len(rows) <= length)
+    )
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, feeds, views
 
 app_name = 'posts'
 
@@ -7,7 +7,25 @@ urlpatterns = [
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('search/', views.search, name='search'),
+    path('export/', views.export, name='export'),
+    path('api/posts/', api.posts, name='api_posts'),
+    path('api/groups/', api.groups, name='api_groups'),
+    path('api/profiles/<str:username>/', api.profile, name='api_profile'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('', views.index, name='main'),
 ]
+
+for kind in feeds.FEED_TYPES:
+    urlpatterns += [
+        path(f'feed/{kind}/', feeds.index[kind], name=f'index_{kind}'),
+        path(
+            f'group/<slug:slug>/feed/{kind}/', feeds.group[kind],
+            name=f'group_{kind}',
+        ),
+        path(
+            f'profile/<str:username>/feed/{kind}/', feeds.profile[kind],
+            name=f'profile_{kind}',
+        ),
+    ]
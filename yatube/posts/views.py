@@ -1,32 +1,53 @@
+from functools import partial
+
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.shortcuts import render, get_object_or_404, redirect
+from django.db import router, transaction
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.shortcuts import render, redirect
 
-from .models import Post, Group, User
+from core.query_budget import query_budget
 
+from . import timelines
+from .counts import cached_count
+from .export import CONTENT_TYPES, export_lines, posts_for_export
 from .forms import PostForm
+from .lookups import get_author_or_404, get_group_or_404
+from .models import EditConflict, Post, PostCounter
+from .page_cache import (cache_anonymous_page, group_feed, index_feed,
+                         profile_feed)
+from .paginator import paginate
+from .search import search as search_posts
+from .shards import across, budget, get_post_or_404
 
 
 AMOUNT: int = 10
 
 
+# Из каждого шарда: лента, посты страницы, их авторы и группы.
+@query_budget(budget(6, per_shard=4, sharded=2))
+@cache_anonymous_page(index_feed)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, AMOUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = across(Post.objects.for_feed())
+    page_obj = paginate(request, post_list, AMOUNT, partial(
+        cached_count, index_feed(),
+        partial(PostCounter.objects.get_value, PostCounter.ALL),
+    ), timelines.read())
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(budget(7, per_shard=4, sharded=1))
+@cache_anonymous_page(group_feed)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.select_related('author')
-    paginator = Paginator(post_list, AMOUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group = get_group_or_404(slug)
+    post_list = across(group.posts.for_feed())
+    page_obj = paginate(request, post_list, AMOUNT, partial(
+        cached_count, group_feed(slug),
+        partial(PostCounter.objects.get_value, PostCounter.GROUP, group.pk),
+    ), timelines.read(group.pk))
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -34,28 +55,70 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+# Посты автора лежат в одном шарде.
+@query_budget(budget(8, per_shard=0, sharded=2))
+@cache_anonymous_page(profile_feed)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post = Post.objects.select_related('author', 'group').filter(author=author)
-    paginator = Paginator(post, AMOUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = get_author_or_404(username)
+    post = Post.objects.for_feed().of_author(author)
+    posts_count = PostCounter.objects.get_value(PostCounter.AUTHOR, author.pk)
+    page_obj = paginate(request, post, AMOUNT, lambda: posts_count)
     context = {
         'page_obj': page_obj,
         'author': author,
+        'posts_count': posts_count,
     }
     return render(request, 'posts/profile.html', context)
 
 
+# Пост ищется в шарде, где создан, потом в остальных.
+@query_budget(budget(6, per_shard=1, sharded=2))
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_post_or_404(Post.objects.for_detail(), post_id)
     context = {
-        'post': post
+        'post': post,
+        'posts_count': PostCounter.objects.get_value(
+            PostCounter.AUTHOR, post.author_id
+        ),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(budget(6, per_shard=4, sharded=2))
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page = search_posts(query, request.GET.get('after'), AMOUNT)
+    context = {
+        'query': query,
+        'page': page,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@staff_member_required
+@query_budget(4)
+def export(request):
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in CONTENT_TYPES:
+        return HttpResponseBadRequest('format: jsonl или csv')
+    author = request.GET.get('author') or None
+    group = request.GET.get('group') or None
+    # Автор и группа ищутся сразу, а посты выбираются, пока клиент
+    # читает ответ, поэтому ни бюджет запросов, ни память view от их
+    # числа не зависят.
+    response = StreamingHttpResponse(
+        export_lines(posts_for_export(author, group), fmt),
+        content_type=CONTENT_TYPES[fmt],
+    )
+    name = '-'.join(filter(None, ('posts', author, group)))
+    response['Content-Disposition'] = (
+        f'attachment; filename="{name}.{fmt}"'
+    )
+    return response
+
+
 @login_required
+@query_budget(15)
 def post_create(request):
     form = PostForm(request.POST or None)
     context = {'form': form}
@@ -63,20 +126,40 @@ def post_create(request):
         return render(request, 'posts/create_post.html', context)
     post = form.save(commit=False)
     post.author = request.user
-    post.save()
+    # Пост и его счётчики пишутся в шард автора (posts.shards).
+    with transaction.atomic(using=router.db_for_write(Post, instance=post)):
+        post.save()
     return redirect('posts:profile', username=post.author)
 
 
 @login_required
+@query_budget(15)
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_post_or_404(Post.objects.all(), post_id)
     form = PostForm(request.POST or None, instance=post)
+    # Версия, с которой открыли форму. Без неё (старая форма) правка
+    # записывается без проверки.
+    version = request.POST.get('version', '')
+    version = int(version) if version.isdigit() else None
     context = {
         'form': form,
-        'is_edit': True
+        'is_edit': True,
+        'version': post.version,
     }
     if form.is_valid():
-        post = form.save()
-        post.save()
+        try:
+            with transaction.atomic(using=post._state.db):
+                form.save(commit=False).save_changes(version)
+        except EditConflict:
+            form.add_error(None, (
+                'Пока вы редактировали, пост изменили. Проверьте текст '
+                'и сохраните ещё раз.'
+            ))
+            context['version'] = Post.objects.using(
+                post._state.db
+            ).filter(pk=post.pk).values_list('version', flat=True).first()
+            return render(
+                request, 'posts/create_post.html', context, status=409
+            )
         return redirect('posts:post_detail', post_id=post_id)
     return render(request, 'posts/create_post.html', context)
@@ -49,7 +49,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.timing.ServerTimingMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.static.StaticFilesMiddleware',
+    'core.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,6 +62,36 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Бюджеты SQL-запросов view (core.query_budget): при разработке и в тестах
+# нарушения роняют запрос, в продакшене только пишутся в лог.
+QUERY_BUDGET_STRICT = DEBUG
+QUERY_BUDGET_REPEATS = 3
+
+# Доля запросов, у которых core.timing замеряет view, SQL, шаблоны и
+# контекст-процессоры (заголовок Server-Timing и строка в лог
+# core.timing). При разработке замеряется каждый запрос.
+SERVER_TIMING_SAMPLE_RATE = 1.0 if DEBUG else 0.01
+
+# Число постов для навигации по страницам лент (posts.counts): столько
+# секунд значение считается свежим, потом обновляется в фоне. В тестах
+# фоновый поток не видит транзакцию теста, поэтому там обновление
+# синхронное.
+COUNT_CACHE_TTL = 30
+COUNT_REFRESH_IN_BACKGROUND = not DEBUG
+
+# Кэш процесса для поиска группы по slug и автора по username
+# (posts.lookups). Сигналы сбрасывают его только в своём процессе,
+# поэтому запись живёт не дольше LOOKUP_CACHE_TTL секунд.
+LOOKUP_CACHE_SIZE = 1024
+LOOKUP_CACHE_TTL = 300
+
+# Готовые ленты главной и групп (posts.timelines): где хранить id самых
+# новых постов — CacheTimelineStore или DatabaseTimelineStore, — и
+# сколько постов держать в каждой ленте.
+TIMELINE_STORE = 'posts.timelines.CacheTimelineStore'
+TIMELINE_SIZE = 1000
+TIMELINE_CACHE_TIMEOUT = 60 * 10
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
@@ -88,9 +122,78 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами, PRAGMA ниже — один раз на него.
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# PRAGMA для каждого нового соединения SQLite (core.sqlite).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+
+# Реплики только для чтения (core.routers). Локально реплику можно
+# держать копией db.sqlite3, которую обновляет sync_replica:
+#   DATABASES['replica'] = {
+#       **DATABASES['default'],
+#       'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+#       'TEST': {'MIRROR': 'default'},
+#   }
+#   DATABASE_REPLICAS = ('replica',)
+DATABASE_ROUTERS = [
+    'posts.shards.ShardRouter',
+    'core.routers.ReplicaRouter',
+]
+DATABASE_REPLICAS = ()
+# Шарды постов по автору (posts.shards), пусто — все посты в основной
+# базе; включаются так: POST_SHARDS = ('default', 'posts_1'). У шардов,
+# кроме default, отключаются внешние ключи. База второго шарда описана
+# всегда (на ней идут тесты шардирования), но без POST_SHARDS к ней
+# никто не подключается. Каждый шард мигрируется отдельно:
+# migrate --database posts_1.
+DATABASES['posts_1'] = {
+    **DATABASES['default'],
+    'NAME': os.path.join(BASE_DIR, 'db.posts_1.sqlite3'),
+    'SQLITE_PRAGMAS': {'foreign_keys': 'off'},
+}
+POST_SHARDS = ()
+# Фоновые задачи (core.jobs): очередь лежит в базе поста, поэтому
+# исполнитель run_jobs обходит все шарды. При JOBS_EAGER задачи
+# выполняются сразу, без очереди и исполнителя.
+JOB_DATABASES = POST_SHARDS or ('default',)
+JOBS_EAGER = DEBUG
+JOBS_MAX_ATTEMPTS = 5
+# Столько секунд после записи клиент читает только из основной базы;
+# должно быть не меньше отставания реплик.
+REPLICA_STICKY_SECONDS = 10
+
+# На кэше держатся карточки и страницы лент, версии для их сброса,
+# готовые ленты и пробуждение run_jobs, поэтому кэш должен быть общим для
+# всех процессов: LocMemCache у каждого процесса свой, и правка сбросила
+# бы кэш только в том процессе, который её принял. Он годится лишь для
+# разработки и тестов (один процесс runserver). В продакшене — memcached:
+# он общий для процессов и машин, а cache.add в нём атомарен, на чём
+# держатся блокировки готовых лент (posts.timelines) и обновления
+# счётчиков (posts.counts). Файловый кэш для этого не годится: add в нём
+# не атомарен, а каждая запись просматривает весь каталог кэша.
+if DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': '127.0.0.1:11211',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -132,6 +235,21 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
+# collectstatic собирает сюда файлы с хэшем в имени и их сжатые копии,
+# их раздаёт core.static.StaticFilesMiddleware. При разработке статика
+# берётся из STATICFILES_DIRS как есть.
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+if not DEBUG:
+    STATICFILES_STORAGE = (
+        'core.static.CompressedManifestStaticFilesStorage'
+    )
+
+# Что страница загрузит наверняка: браузер начнёт качать это сразу.
+STATIC_PRELOAD = (
+    ('css/bootstrap.min.css', 'style'),
+    ('img/logo.png', 'image'),
+)
+
 LOGIN_URL = 'users:login'
 
 LOGIN_REDIRECT_URL = 'posts:main'